@@ -0,0 +1,202 @@
+"""
+Контроль допуска запросов и сброс нагрузки.
+
+Каждый маршрут относится к классу (interactive, heavy, bulk). У класса
+есть приоритет, лимит одновременных запросов, длина очереди ожидания и
+максимальное время ожидания. Все классы делят общую емкость воркера
+(число потоков): освободившееся место получает ожидающий запрос с
+наивысшим приоритетом, поэтому вход и обычные страницы обгоняют тяжелые
+отчеты. Если очередь класса заполнена или ожидание истекло, запрос сразу
+получает 503 с Retry-After, а не копится в потоках.
+
+Лимиты действуют в пределах процесса; при pre-fork каждый воркер
+ограничивает себя сам.
+"""
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class RouteClass:
+    name: str
+    priority: int  # меньше — важнее
+    max_concurrent: int
+    max_queue: int
+    max_wait: float
+    retry_after: int
+
+
+@dataclass
+class RouteStats:
+    in_flight: int = 0
+    queued: int = 0
+    admitted: int = 0
+    rejected: int = 0
+    timed_out: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+
+    def as_dict(self):
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": round(self.wait_total / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "max_wait_ms": round(self.wait_max * 1000, 2),
+        }
+
+
+def _split(total):
+    """Делит места класса на выполняющиеся и ожидающие"""
+    running = max(1, total // 2)
+    return running, max(0, total - running)
+
+
+def default_classes(capacity):
+    """Классы маршрутов для воркера с capacity потоками.
+
+    Ожидающий в очереди запрос тоже занимает поток сервера, поэтому для
+    heavy и bulk ограничена сумма выполняющихся и ожидающих, и вместе они
+    оставляют не меньше четверти потоков (минимум один) interactive-запросам.
+    Меньше чем при четырех потоках каждому классу нужен хотя бы один поток,
+    и резерв не гарантируется.
+    """
+    reserved = max(1, capacity // 4)
+    shared = capacity - reserved
+    heavy_running, heavy_queue = _split(max(1, shared - shared // 3))
+    bulk_running, bulk_queue = _split(max(1, shared // 3))
+    return [
+        RouteClass("interactive", priority=0, max_concurrent=capacity, max_queue=capacity * 4, max_wait=2.0, retry_after=1),
+        RouteClass("heavy", priority=1, max_concurrent=heavy_running, max_queue=heavy_queue, max_wait=5.0, retry_after=5),
+        RouteClass("bulk", priority=2, max_concurrent=bulk_running, max_queue=bulk_queue, max_wait=1.0, retry_after=30),
+    ]
+
+
+class Rejected(Exception):
+    def __init__(self, route_class):
+        super().__init__(route_class.name)
+        self.retry_after = route_class.retry_after
+
+
+class _Waiter:
+    __slots__ = ("route_class", "event", "admitted")
+
+    def __init__(self, route_class):
+        self.route_class = route_class
+        self.event = threading.Event()
+        self.admitted = False
+
+
+class AdmissionController:
+    def __init__(self, capacity, classes):
+        self.capacity = capacity
+        self.classes = {route_class.name: route_class for route_class in classes}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._class_in_flight = {name: 0 for name in self.classes}
+        self._class_queued = {name: 0 for name in self.classes}
+        self._waiters = []
+        self._seq = itertools.count()
+        self._stats = {}
+
+    def _can_run(self, route_class):
+        return (
+            self._in_flight < self.capacity
+            and self._class_in_flight[route_class.name] < route_class.max_concurrent
+        )
+
+    def _occupy(self, route_class):
+        self._in_flight += 1
+        self._class_in_flight[route_class.name] += 1
+
+    @staticmethod
+    def _admitted(stats, waited):
+        stats.in_flight += 1
+        stats.admitted += 1
+        stats.wait_total += waited
+        stats.wait_max = max(stats.wait_max, waited)
+
+    def acquire(self, class_name, endpoint):
+        """Допускает запрос или бросает Rejected; возвращает билет для release()"""
+        route_class = self.classes[class_name]
+        started = time.monotonic()
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, RouteStats())
+            # Не обгоняем ожидающих того же или более высокого приоритета, которые ждут общей емкости
+            ahead = any(
+                waiter.route_class.priority <= route_class.priority
+                and self._class_in_flight[waiter.route_class.name] < waiter.route_class.max_concurrent
+                for _p, _s, waiter in self._waiters
+            )
+            if not ahead and self._can_run(route_class):
+                self._occupy(route_class)
+                self._admitted(stats, 0.0)
+                return (route_class, endpoint)
+            if self._class_queued[route_class.name] >= route_class.max_queue:
+                stats.rejected += 1
+                raise Rejected(route_class)
+            waiter = _Waiter(route_class)
+            heapq.heappush(self._waiters, (route_class.priority, next(self._seq), waiter))
+            self._class_queued[route_class.name] += 1
+            stats.queued += 1
+
+        waiter.event.wait(route_class.max_wait)
+        with self._lock:
+            stats.queued -= 1
+            if waiter.admitted:
+                # Место уже занято за нас в _wake()
+                self._admitted(stats, time.monotonic() - started)
+                return (route_class, endpoint)
+            # Время ожидания истекло: убираем себя из очереди
+            self._waiters = [item for item in self._waiters if item[2] is not waiter]
+            heapq.heapify(self._waiters)
+            self._class_queued[route_class.name] -= 1
+            stats.timed_out += 1
+            self._wake()
+        raise Rejected(route_class)
+
+    def release(self, ticket):
+        route_class, endpoint = ticket
+        with self._lock:
+            self._in_flight -= 1
+            self._class_in_flight[route_class.name] -= 1
+            self._stats[endpoint].in_flight -= 1
+            self._wake()
+
+    def _wake(self):
+        """Передает свободные места ожидающим в порядке приоритета (под self._lock)"""
+        blocked = []
+        while self._waiters and self._in_flight < self.capacity:
+            priority, seq, waiter = heapq.heappop(self._waiters)
+            if not self._can_run(waiter.route_class):
+                # Лимит класса исчерпан, но менее важные классы еще могут пройти
+                blocked.append((priority, seq, waiter))
+                continue
+            self._occupy(waiter.route_class)
+            self._class_queued[waiter.route_class.name] -= 1
+            waiter.admitted = True
+            waiter.event.set()
+        for item in blocked:
+            heapq.heappush(self._waiters, item)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "in_flight": self._in_flight,
+                "classes": {
+                    name: {
+                        "priority": route_class.priority,
+                        "max_concurrent": route_class.max_concurrent,
+                        "in_flight": self._class_in_flight[name],
+                        "queued": self._class_queued[name],
+                    }
+                    for name, route_class in self.classes.items()
+                },
+                "routes": {endpoint: stats.as_dict() for endpoint, stats in sorted(self._stats.items())},
+            }
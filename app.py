@@ -1,27 +1,98 @@
 import sqlite3
 import os
+import shutil
+import sys
+import tempfile
+import threading
+import weakref
+import click
+from functools import partial
+from datetime import date, timedelta
 from pathlib import Path
-from flask import Flask, render_template, request, redirect, url_for, session, flash, g, abort, send_file
+from flask import Blueprint, Flask, current_app, render_template, stream_template, request, redirect, url_for, session, flash, g, abort, send_file, jsonify, get_flashed_messages, Response, stream_with_context
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 
-DB_PATH = Path("app.bd")
-
-app = Flask(__name__)
-app.secret_key = "change-this-secret"  # замените на надёжный секрет
+import admission
+import cache_bus
+import change_feed
+import compression
+import event_log
+import facets
+import internship_periods
+import matching
+import moderation_queue
+import notifications
+import recommendations
+import resume_index
+import storage_gc
+import vacancy_import
+# backup и exports нужны только командам и выгрузкам откликов
+# и импортируются в них, чтобы не замедлять запуск каждого воркера
+
+# FLASK_DATABASE=:memory: — БД в памяти процесса, temp — файл во временном каталоге
+MEMORY_DATABASE = ":memory:"
+TEMP_DATABASE = "temp"
+
+# Маршруты, обработчики запросов и команды; create_app() регистрирует их
+# в каждом новом экземпляре приложения со своей конфигурацией и БД
+bp = Blueprint("main", __name__, cli_group=None)
 
 # Конфигурация для загрузки файлов
 UPLOAD_FOLDER = 'uploads'
 AVATAR_FOLDER = 'static/avatars'
 ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx'}
 ALLOWED_AVATAR_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'svg'}
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['AVATAR_FOLDER'] = AVATAR_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-
-# Создаем папки для загрузок если их нет
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(AVATAR_FOLDER, exist_ok=True)
+DEFAULT_SECRET_KEY = "change-this-secret"
+
+# Значения по умолчанию; create_app() дополняет их переменными окружения FLASK_*
+DEFAULT_CONFIG = {
+    'SECRET_KEY': DEFAULT_SECRET_KEY,  # для продакшена задайте FLASK_SECRET_KEY
+    'DATABASE': 'app.bd',
+    'UPLOAD_FOLDER': UPLOAD_FOLDER,
+    'AVATAR_FOLDER': AVATAR_FOLDER,
+    'MAX_CONTENT_LENGTH': 16 * 1024 * 1024,  # 16MB max file size
+    'EVENT_LOG_DIR': 'events',
+    'BACKUP_DIR': 'backups',
+    # Доставка уведомлений: maildir (локальная папка) или smtp, пустое значение — отключено
+    'NOTIFY_TRANSPORT': 'maildir',
+    'NOTIFY_MAILDIR': 'mail',
+    'NOTIFY_SENDER': 'noreply@localhost',
+    'SMTP_HOST': 'localhost',
+    'SMTP_PORT': 25,
+    'SMTP_USERNAME': None,
+    'SMTP_PASSWORD': None,
+    'SMTP_STARTTLS': False,
+    # Метод хеширования паролей (werkzeug); тесты и бенчмарк задают более быстрый
+    'PASSWORD_HASH_METHOD': 'scrypt',
+    # Контроль допуска: емкость — число потоков воркера; serve.py (--threads)
+    # и asgi.py (ASGI_THREADS) задают ее сами, здесь — значение для flask run
+    'ADMISSION_CAPACITY': int(os.environ.get("THREADS", 8)),
+}
+
+# Каталог журнала — из конфигурации приложения, в котором произошло событие
+event_log.configure(lambda: current_app.config['EVENT_LOG_DIR'])
+
+# Класс маршрута по endpoint; остальные маршруты — interactive
+ROUTE_CLASSES = {
+    "main.hr_dashboard": "heavy",
+    "main.admin_moderation": "heavy",
+    "main.university_dashboard": "heavy",
+    "main.hr_vacancy_shortlist": "heavy",
+    "main.university_internship_shortlist": "heavy",
+    "main.admin_entity_events": "heavy",
+    "main.hr_export_applications": "bulk",
+    "main.hr_export_vacancy_applications": "bulk",
+    "main.hr_import_vacancies": "bulk",
+}
+# Статика и метрики не ограничиваются, чтобы перегрузку было видно
+ADMISSION_EXEMPT = {"static", "main.admission_metrics"}
+
+# После индексации резюме пересчитываем его оценки соответствия; если корпус
+# резюме заметно вырос, сначала обновляются веса IDF и все оценки
+resume_index.on_indexed.append(recommendations.refresh_weights)
+resume_index.on_indexed.append(matching.score_resume)
+resume_index.on_indexed.append(recommendations.refresh_resume_owner)
 
 
 def allowed_file(filename):
@@ -36,16 +107,181 @@ def allowed_avatar_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_AVATAR_EXTENSIONS
 
 
+# Таблицы с интенсивной записью живут в отдельных файлах: блокировка записи
+# в SQLite берется на файл, и отклики не ждут, пока пишутся профили или модерация
+ATTACHED_DATABASES = {
+    "appl": "_applications",  # applications
+    "moder": "_moderation",  # moderation_queue, moderation_logs
+}
+
+# Внешние ключи не работают между файлами БД, поэтому каскады делаем
+# временными триггерами соединения: только TEMP-триггеры видят другие схемы,
+# а имена таблиц в их теле нельзя квалифицировать — они ищутся по всем схемам
+CROSS_DB_TRIGGERS = (
+    "CREATE TEMP TRIGGER IF NOT EXISTS cascade_vacancy_applications AFTER DELETE ON main.vacancies "
+    "BEGIN DELETE FROM applications WHERE vacancy_id = OLD.id; "
+    "DELETE FROM moderation_queue WHERE item_type = 'vacancy' AND item_id = OLD.id; END",
+    "CREATE TEMP TRIGGER IF NOT EXISTS cascade_internship_queue AFTER DELETE ON main.internship_requests "
+    "BEGIN DELETE FROM moderation_queue WHERE item_type = 'internship' AND item_id = OLD.id; END",
+    "CREATE TEMP TRIGGER IF NOT EXISTS cascade_user_applications AFTER DELETE ON main.users "
+    "BEGIN DELETE FROM applications WHERE candidate_id = OLD.id; "
+    "DELETE FROM application_outbox WHERE recipient_id = OLD.id; END",
+    "CREATE TEMP TRIGGER IF NOT EXISTS set_null_resume_applications AFTER DELETE ON main.resumes "
+    "BEGIN UPDATE applications SET resume_id = NULL WHERE resume_id = OLD.id; END",
+) + change_feed.CROSS_DB_TRIGGERS
+
+
+def attached_db_paths(path):
+    """Пути присоединяемых БД рядом с основной: app.bd -> app_applications.bd"""
+    return {
+        alias: path.with_name(f"{path.stem}{suffix}{path.suffix}")
+        for alias, suffix in ATTACHED_DATABASES.items()
+    }
+
+
+def sqlite_target(path, in_memory):
+    """Имя для sqlite3.connect и ATTACH: путь к файлу или общая БД в памяти процесса"""
+    if in_memory:
+        return f"file:{path.name}?mode=memory&cache=shared"
+    return str(path)
+
+
+def cache_bus_file(path):
+    """Файл шины инвалидации кеша рядом с БД: app.bd -> app_cache.bd"""
+    return path.with_name(f"{path.stem}_cache{path.suffix}")
+
+
+def cache_bus_path():
+    """Файл шины инвалидации кеша текущего приложения"""
+    path, in_memory = database_location()
+    if in_memory:
+        # Шина нужна только между процессами с общей БД
+        return None
+    return cache_bus_file(path)
+
+
+# Путь вычисляется при каждом обращении: у каждого приложения своя шина и кеш
+cache_bus.configure(cache_bus_path)
+# Ключ кеша каталога: счетчики фасетов и выдачи по фильтрам (catalog:...)
+CATALOG_CACHE = "catalog"
+
+
+def create_cross_db_triggers(db):
+    for sql in CROSS_DB_TRIGGERS:
+        try:
+            db.execute(sql)
+        except sqlite3.OperationalError as exc:
+            # Таблиц еще нет (первый запуск до init_db) — триггеры создаст init_db
+            if "no such table" not in str(exc):
+                raise
+
+
+def connect_db(path=None, in_memory=False):
+    """Открывает новое соединение с БД текущего приложения или с БД path
+    (фоновые потоки получают готовую функцию из db_connector())"""
+    if path is None:
+        path, in_memory = database_location()
+    # timeout — ожидание блокировки записи, пока ее держит другой воркер
+    db = sqlite3.connect(sqlite_target(path, in_memory), timeout=15, uri=in_memory)
+    db.row_factory = sqlite3.Row
+    # Включаем внешние ключи для SQLite
+    db.execute("PRAGMA foreign_keys = ON")
+    for alias, attached in attached_db_paths(path).items():
+        db.execute(f"ATTACH DATABASE ? AS {alias}", (sqlite_target(attached, in_memory),))
+    create_cross_db_triggers(db)
+    return db
+
+
+def db_connector():
+    """Функция подключения к БД текущего приложения для фоновых потоков (у них нет контекста приложения)"""
+    return partial(connect_db, *database_location())
+
+
+def move_table_to_attached(db, table, alias):
+    """Миграция: переносит таблицу из основной БД в присоединенную"""
+    exists = db.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    if exists is None:
+        return
+    columns = ", ".join(row[1] for row in db.execute(f"PRAGMA main.table_info({table})"))
+    db.execute(f"INSERT OR IGNORE INTO {alias}.{table} ({columns}) SELECT {columns} FROM main.{table}")
+    db.execute(f"DROP TABLE main.{table}")
+
+
+def rebuild_table(db, table, create_sql):
+    """Миграция: пересоздает таблицу основной БД по новому CREATE TABLE с сохранением строк.
+
+    SQLite не меняет ограничения CHECK через ALTER TABLE. Внешние ключи на время
+    пересоздания выключаются, иначе DROP TABLE удалил бы каскадом дочерние строки.
+    Триггеры и индексы таблицы удаляются вместе с ней — init_db создает их заново.
+    """
+    db.commit()
+    db.execute("PRAGMA foreign_keys = OFF")
+    try:
+        columns = ", ".join(row[1] for row in db.execute(f"PRAGMA main.table_info({table})"))
+        sequence = db.execute("SELECT seq FROM main.sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        db.execute(create_sql.replace(table, f"{table}_rebuild", 1))
+        db.execute(f"INSERT INTO main.{table}_rebuild ({columns}) SELECT {columns} FROM main.{table}")
+        db.execute(f"DROP TABLE main.{table}")
+        # Без legacy_alter_table SQLite перепроверяет все триггеры схемы, а TEMP-триггеры
+        # соединения могут ссылаться на таблицы, которые init_db еще не создал
+        db.execute("PRAGMA legacy_alter_table = ON")
+        db.execute(f"ALTER TABLE main.{table}_rebuild RENAME TO {table}")
+        db.execute("PRAGMA legacy_alter_table = OFF")
+        if sequence is not None:
+            # Удаленные id не выдаются повторно: на них ссылаются журнал событий и лента изменений
+            db.execute("DELETE FROM main.sqlite_sequence WHERE name = ?", (table,))
+            db.execute("INSERT INTO main.sqlite_sequence (name, seq) VALUES (?, ?)", (table, sequence[0]))
+        db.commit()
+    finally:
+        db.execute("PRAGMA foreign_keys = ON")
+
+
+def configure_database(application):
+    """Выбирает БД приложения по значению DATABASE: путь к файлу, TEMP_DATABASE
+    (новый временный каталог, например для параллельных тестов) или MEMORY_DATABASE.
+
+    Результат хранится в конфигурации приложения (DATABASE_PATH, DATABASE_IN_MEMORY).
+    Для временной БД и БД в памяти журнал событий тоже пишется во временный каталог;
+    каталог удаляется вместе с приложением или при выходе из процесса.
+    """
+    config = application.config
+    value = config.get("DATABASE")
+    in_memory = value == MEMORY_DATABASE
+    if value in (MEMORY_DATABASE, TEMP_DATABASE):
+        folder = Path(tempfile.mkdtemp(prefix="hr_case_"))
+        # Имя БД в памяти уникально, чтобы приложения в одном процессе не делили данные
+        path = folder / (f"{folder.name}.bd" if in_memory else "app.bd")
+        config["EVENT_LOG_DIR"] = str(folder / "events")
+        # Воркеры serve.py завершаются через os._exit, каталог удаляет только мастер
+        weakref.finalize(application, remove_temp_database, folder, path)
+    else:
+        path = Path(value or "app.bd")
+    if in_memory:
+        # Держит БД в памяти живой, пока существует приложение
+        application.extensions["database_keepalive"] = connect_db(path, in_memory)
+    config["DATABASE_IN_MEMORY"] = in_memory
+    config["DATABASE_PATH"] = str(path)
+
+
+def remove_temp_database(folder, path):
+    """Удаляет временный каталог БД; шину кеша закрываем раньше, иначе
+    фоновый поток cache_bus заново создаст в каталоге файлы WAL"""
+    cache_bus.discard(cache_bus_file(path))
+    shutil.rmtree(folder, ignore_errors=True)
+
+
+def database_location():
+    """(путь основной БД, в памяти ли она) текущего приложения"""
+    config = current_app.config
+    return Path(config["DATABASE_PATH"]), config["DATABASE_IN_MEMORY"]
+
+
 def get_db():
     if "db" not in g:
-        g.db = sqlite3.connect(DB_PATH)
-        g.db.row_factory = sqlite3.Row
-        # Включаем внешние ключи для SQLite
-        g.db.execute("PRAGMA foreign_keys = ON")
+        g.db = connect_db()
     return g.db
 
 
-@app.teardown_appcontext
 def close_db(_exc):
     db = g.pop("db", None)
     if db is not None:
@@ -152,23 +388,21 @@ def init_db():
         """
     )
 
-    # Отклики на вакансии
+    # Отклики на вакансии (отдельный файл БД; каскады vacancy/candidate/resume — см. CROSS_DB_TRIGGERS)
     db.execute(
         """
-        CREATE TABLE IF NOT EXISTS applications (
+        CREATE TABLE IF NOT EXISTS appl.applications (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             vacancy_id INTEGER NOT NULL,
             candidate_id INTEGER NOT NULL,
             resume_id INTEGER,
             status TEXT NOT NULL CHECK (status IN ('new','viewed','interview','rejected')),
             cover_letter TEXT,
-            created_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP),
-            FOREIGN KEY (vacancy_id) REFERENCES vacancies(id) ON DELETE CASCADE,
-            FOREIGN KEY (candidate_id) REFERENCES users(id) ON DELETE CASCADE,
-            FOREIGN KEY (resume_id) REFERENCES resumes(id) ON DELETE SET NULL
+            created_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP)
         )
         """
     )
+    move_table_to_attached(db, "applications", "appl")
 
     # Заявки на стажировки
     db.execute(
@@ -181,7 +415,7 @@ def init_db():
             period_start TEXT,
             period_end TEXT,
             skills_required TEXT,
-            status TEXT NOT NULL CHECK (status IN ('on_moderation','published')),
+            status TEXT NOT NULL CHECK (status IN ('on_moderation','published','rejected')),
             created_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP),
             FOREIGN KEY (university_id) REFERENCES users(id) ON DELETE RESTRICT
         )
@@ -209,8 +443,9 @@ def init_db():
     db.execute("CREATE INDEX IF NOT EXISTS idx_vacancies_company ON vacancies(company_id)")
     db.execute("CREATE INDEX IF NOT EXISTS idx_vacancies_status ON vacancies(status)")
     db.execute("CREATE INDEX IF NOT EXISTS idx_resumes_candidate ON resumes(candidate_id)")
-    db.execute("CREATE INDEX IF NOT EXISTS idx_applications_vacancy ON applications(vacancy_id)")
-    db.execute("CREATE INDEX IF NOT EXISTS idx_applications_candidate ON applications(candidate_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS appl.idx_applications_vacancy ON applications(vacancy_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS appl.idx_applications_candidate ON applications(candidate_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS appl.idx_applications_resume ON applications(resume_id)")
     
     # Миграция: добавляем created_at в internship_requests если его нет
     try:
@@ -219,6 +454,37 @@ def init_db():
     except sqlite3.OperationalError:
         # Колонка уже существует, игнорируем ошибку
         pass
+
+    # Миграция: старая схема не допускала отклоненные заявки на стажировку
+    create_sql = db.execute(
+        "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = 'internship_requests'"
+    ).fetchone()[0]
+    if "'rejected'" not in create_sql:
+        rebuild_table(db, "internship_requests", create_sql.replace(
+            "CHECK (status IN ('on_moderation','published'))",
+            "CHECK (status IN ('on_moderation','published','rejected'))",
+        ))
+    
+    # Миграция: резюме, удаленные кандидатом, но еще прикрепленные к откликам
+    try:
+        db.execute("ALTER TABLE resumes ADD COLUMN deleted_at TEXT")
+        db.commit()
+    except sqlite3.OperationalError:
+        # Колонка уже существует, игнорируем ошибку
+        pass
+
+    # Миграция: сохраненные резюме кандидата (stored = 1) отличаем от старых копий,
+    # которые создавались на каждый отклик: копии не входят в лимит и список «Мои резюме»
+    try:
+        db.execute("ALTER TABLE resumes ADD COLUMN stored INTEGER NOT NULL DEFAULT 0")
+        db.execute(
+            "UPDATE resumes SET stored = 1 WHERE deleted_at IS NOT NULL "
+            "OR NOT EXISTS (SELECT 1 FROM applications a WHERE a.resume_id = resumes.id)"
+        )
+        db.commit()
+    except sqlite3.OperationalError:
+        # Колонка уже существует, игнорируем ошибку
+        pass
     
     # Миграция: добавляем недостающие поля в profiles если их нет
     try:
@@ -228,24 +494,61 @@ def init_db():
         # Колонка уже существует, игнорируем ошибку
         pass
     
-    # Логи модерации
+    # Миграция: структурированные поля каталога вакансий и анкеты кандидата
+    for table, column in (
+        ("vacancies", "city TEXT"),
+        ("vacancies", "salary_min INTEGER"),
+        ("vacancies", "salary_max INTEGER"),
+        ("profiles", "city TEXT"),
+        ("profiles", "age INTEGER"),
+    ):
+        try:
+            db.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+            db.commit()
+        except sqlite3.OperationalError:
+            # Колонка уже существует, игнорируем ошибку
+            pass
+    
+    # Логи модерации (история до журнала событий; отдельный файл БД)
     db.execute(
         """
-        CREATE TABLE IF NOT EXISTS moderation_logs (
+        CREATE TABLE IF NOT EXISTS moder.moderation_logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             item_type TEXT NOT NULL CHECK (item_type IN ('vacancy','internship')),
             item_id INTEGER NOT NULL,
             action TEXT NOT NULL CHECK (action IN ('approve','reject','delete')),
             moderator_id INTEGER NOT NULL,
             created_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP),
-            note TEXT,
-            FOREIGN KEY (moderator_id) REFERENCES users(id) ON DELETE SET NULL
+            note TEXT
         )
         """
     )
+    move_table_to_attached(db, "moderation_logs", "moder")
+
+    # Индексация навыков резюме
+    resume_index.init_resume_index(db)
+    # Сопоставление резюме с вакансиями и стажировками
+    matching.init_matching(db)
+    # Счетчики фасетов каталога (после vacancy_skills из init_matching)
+    facets.init_facets(db)
+    # Предрасчитанные рекомендации
+    recommendations.init_recommendations(db)
+    # Интервальный индекс периодов стажировок
+    internship_periods.init_internship_periods(db)
+    # Очередь модерации с арендой элементов
+    moderation_queue.init_moderation_queue(db, schema="moder")
+    notifications.init_notifications(db)
+    move_table_to_attached(db, "moderation_queue", "moder")
+    # Лента изменений для интеграций (/api/changes)
+    change_feed.init_change_feed(db)
+    create_cross_db_triggers(db)
     db.commit()
 
 
+def hash_password(password):
+    return generate_password_hash(password, method=current_app.config["PASSWORD_HASH_METHOD"])
+
+
 def setup():
     init_db()
     # При первом запуске создадим пользователя-админа, если его нет
@@ -254,7 +557,7 @@ def setup():
     if cur.fetchone() is None:
         db.execute(
             "INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
-            ("admin", generate_password_hash("admin"), "admin"),
+            ("admin", hash_password("admin"), "admin"),
         )
         db.commit()
 
@@ -264,7 +567,7 @@ def setup():
     if uni is None:
         db.execute(
             "INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
-            ("university_rep", generate_password_hash("university_rep"), "university_rep"),
+            ("university_rep", hash_password("university_rep"), "university_rep"),
         )
         db.commit()
         uni_id = db.execute("SELECT id FROM users WHERE username = ?", ("university_rep",)).fetchone()[0]
@@ -285,7 +588,7 @@ def setup():
     if hr is None:
         db.execute(
             "INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
-            ("company_hr", generate_password_hash("company_hr"), "company_hr"),
+            ("company_hr", hash_password("company_hr"), "company_hr"),
         )
         db.commit()
         hr_id = db.execute("SELECT id FROM users WHERE username = ?", ("company_hr",)).fetchone()[0]
@@ -301,11 +604,183 @@ def setup():
         db.commit()
 
 
+def create_app(config=None):
+    """Создает экземпляр приложения: конфигурация из окружения, папки и схема БД.
+
+    Каждый вызов собирает новый Flask с маршрутами из bp и своей
+    конфигурацией: путь к БД хранится в app.config, поэтому приложения в
+    одном процессе (например, в тестах) работают каждое со своей БД.
+    В продакшене вызывается один раз в мастер-процессе до запуска воркеров
+    (см. serve.py). config переопределяет значения из окружения, например
+    create_app({"DATABASE": MEMORY_DATABASE}) в тестах.
+    """
+    application = Flask(__name__)
+    application.config.from_mapping(DEFAULT_CONFIG)
+    # FLASK_SECRET_KEY, FLASK_DATABASE, FLASK_UPLOAD_FOLDER и т.д.
+    application.config.from_prefixed_env()
+    if config:
+        application.config.update(config)
+    # Сжатие HTML/JSON и отдача собранной статики (flask build-static);
+    # регистрируется до bp, чтобы after_request сжатия выполнялся последним
+    compression.init_app(application)
+    application.register_blueprint(bp)
+    application.teardown_appcontext(close_db)
+    configure_database(application)
+    if application.secret_key == DEFAULT_SECRET_KEY:
+        application.logger.warning("Используется секрет по умолчанию, задайте FLASK_SECRET_KEY")
+
+    # Создаем папки для загрузок если их нет
+    os.makedirs(application.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(application.config['AVATAR_FOLDER'], exist_ok=True)
+    application.extensions["notify_transport"] = make_notification_transport(application.config)
+
+    with application.app_context():
+        setup()
+        # WAL позволяет воркерам читать параллельно с записью
+        db = get_db()
+        for schema in ["main", *ATTACHED_DATABASES]:
+            db.execute(f"PRAGMA {schema}.journal_mode=WAL")
+    return application
+
+
+def make_notification_transport(config):
+    """Создает транспорт уведомлений по конфигурации приложения"""
+    name = config.get("NOTIFY_TRANSPORT")
+    if not name:
+        return None
+    if name == "smtp":
+        return notifications.SMTPTransport(
+            config["SMTP_HOST"], config["SMTP_PORT"], config["SMTP_USERNAME"],
+            config["SMTP_PASSWORD"], config["NOTIFY_SENDER"], bool(config["SMTP_STARTTLS"]),
+        )
+    if name == "maildir":
+        return notifications.MaildirTransport(config["NOTIFY_MAILDIR"], config["NOTIFY_SENDER"])
+    raise ValueError(f"Неизвестный транспорт уведомлений: {name}")
+
+
+@bp.before_app_request
+def start_notification_dispatcher():
+    # Диспетчер живет в каждом воркере; захват по аренде не дает отправить запись дважды
+    transport = current_app.extensions.get("notify_transport")
+    if transport is not None:
+        path, _in_memory = database_location()
+        notifications.ensure_dispatcher(str(path), db_connector(), transport)
+
+
+_admission_lock = threading.Lock()
+
+
+def admission_controller():
+    """Контроллер допуска приложения; создается при первом запросе, когда serve.py
+    или asgi.py уже задали ADMISSION_CAPACITY по числу потоков воркера"""
+    controller = current_app.extensions.get("admission")
+    if controller is None:
+        # Первые запросы приходят параллельно: у всех потоков должен быть один счетчик мест
+        with _admission_lock:
+            controller = current_app.extensions.get("admission")
+            if controller is None:
+                capacity = int(current_app.config["ADMISSION_CAPACITY"])
+                controller = current_app.extensions["admission"] = admission.AdmissionController(
+                    capacity, admission.default_classes(capacity)
+                )
+    return controller
+
+
+@bp.before_app_request
+def admit_request():
+    if request.endpoint is None or request.endpoint in ADMISSION_EXEMPT:
+        return None
+    try:
+        g.admission_ticket = admission_controller().acquire(
+            ROUTE_CLASSES.get(request.endpoint, "interactive"), request.endpoint
+        )
+    except admission.Rejected as exc:
+        return Response(
+            "Сервер перегружен, повторите запрос позже.",
+            503,
+            {"Retry-After": str(exc.retry_after)},
+            mimetype="text/plain",
+        )
+    return None
+
+
+@bp.after_app_request
+def release_admission_on_close(response):
+    # Для send_file (direct_passthrough) сервер закрывает только файл, а не ответ:
+    # call_on_close не сработал бы, поэтому место освобождает teardown_request
+    if response.is_streamed and not response.direct_passthrough and "admission_ticket" in g:
+        # Потоковый ответ держит место, пока тело не отдано клиенту
+        ticket = g.pop("admission_ticket")
+        # close() вызывается уже вне контекста приложения
+        response.call_on_close(partial(admission_controller().release, ticket))
+    return response
+
+
+@bp.teardown_app_request
+def release_admission(_exc):
+    ticket = g.pop("admission_ticket", None)
+    if ticket is not None:
+        admission_controller().release(ticket)
+
+
+# Потоковые страницы отправляют HTML порциями не меньше этого размера (символов)
+STREAM_CHUNK_SIZE = 8 * 1024
+# Строки курсоров потоковых страниц читаются пачками такого размера
+STREAM_FETCH_ROWS = 200
+
+
+def _buffered(chunks, size):
+    """Склеивает мелкие фрагменты шаблона в порции, чтобы не писать в сокет по строке"""
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield "".join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def _stream_rows(cursor, owner):
+    """Читает курсор пачками по STREAM_FETCH_ROWS и закрывает его, когда страница отдана"""
+    try:
+        while True:
+            # Соединение SQLite привязано к потоку запроса: сервер (serve.py, asgi.py)
+            # обязан читать потоковый ответ в том же потоке, где выполнено представление
+            if threading.get_ident() != owner:
+                raise RuntimeError("Потоковая страница читается не в потоке запроса")
+            rows = cursor.fetchmany(STREAM_FETCH_ROWS)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def stream_page(template_name, **context):
+    """Рендерит страницу потоком: шапка уходит сразу, строки списков — по мере чтения курсоров.
+
+    В context передаются курсоры, а не fetchall(); шаблон перебирает их
+    через {% for %}...{% else %} и не проверяет их истинность или длину.
+    Курсоры читаются ограниченными пачками и только в потоке запроса.
+    """
+    # Сессию нельзя сохранить после отправки заголовков, поэтому flash-сообщения
+    # забираем из нее заранее; шаблон получит их из кеша запроса
+    get_flashed_messages()
+    owner = threading.get_ident()
+    context = {
+        name: _stream_rows(value, owner) if isinstance(value, sqlite3.Cursor) else value
+        for name, value in context.items()
+    }
+    return Response(_buffered(stream_template(template_name, **context), STREAM_CHUNK_SIZE), mimetype="text/html")
+
+
 def login_required(view_func):
     def wrapper(*args, **kwargs):
         if "user_id" not in session:
             flash("Требуется вход.", "warning")
-            return redirect(url_for("login"))
+            return redirect(url_for("main.login"))
         return view_func(*args, **kwargs)
     wrapper.__name__ = view_func.__name__
     return wrapper
@@ -316,24 +791,24 @@ def role_required(*roles):
         def wrapper(*args, **kwargs):
             if "user_id" not in session:
                 flash("Требуется вход.", "warning")
-                return redirect(url_for("login"))
+                return redirect(url_for("main.login"))
             if session.get("role") not in roles:
                 flash("Недостаточно прав.", "danger")
-                return redirect(url_for("dashboard"))
+                return redirect(url_for("main.dashboard"))
             return view_func(*args, **kwargs)
         wrapper.__name__ = view_func.__name__
         return wrapper
     return decorator
 
 
-@app.route("/")
+@bp.route("/")
 def index():
     if "user_id" in session:
-        return redirect(url_for("dashboard"))
-    return redirect(url_for("login"))
+        return redirect(url_for("main.dashboard"))
+    return redirect(url_for("main.login"))
 
 
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         username = (request.form.get("username") or "").strip()
@@ -358,12 +833,12 @@ def login():
         session["username"] = user["username"]
         session["role"] = user["role"]
         flash("Успешный вход.", "success")
-        return redirect(url_for("dashboard"))
+        return redirect(url_for("main.dashboard"))
 
     return render_template("login.html")
 
 
-@app.route("/register", methods=["GET", "POST"])
+@bp.route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
         username = (request.form.get("username") or "").strip()
@@ -387,7 +862,7 @@ def register():
             # Создаём пользователя с ролью candidate по умолчанию
             user_id = db.execute(
                 "INSERT INTO users (username, email, password_hash, role) VALUES (?, ?, ?, ?)",
-                (username, email, generate_password_hash(password), "candidate"),
+                (username, email, hash_password(password), "candidate"),
             ).lastrowid
             db.commit()
             
@@ -400,21 +875,22 @@ def register():
         except sqlite3.IntegrityError:
             flash("Логин или email уже заняты.", "danger")
             return render_template("register.html")
+        event_log.emit("user", user_id, "register", user_id, role="candidate")
 
         flash("Регистрация успешна. Войдите.", "success")
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
 
     return render_template("register.html")
 
 
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
     session.clear()
     flash("Вы вышли из системы.", "info")
-    return redirect(url_for("login"))
+    return redirect(url_for("main.login"))
 
 
-@app.route("/dashboard")
+@bp.route("/dashboard")
 @login_required
 def dashboard():
     db = get_db()
@@ -428,14 +904,14 @@ def dashboard():
     return render_template("dashboard.html", user=user_info)
 
 
-@app.route("/admin")
+@bp.route("/admin")
 @role_required("admin")
 def admin_only():
     return render_template("admin.html", username=session.get("username"))
     
 
 # -------------------- Модерация (Admin) --------------------
-@app.route("/admin/moderation")
+@bp.route("/admin/moderation")
 @role_required("admin")
 def admin_moderation():
     tab = request.args.get("tab", "vacancies")
@@ -455,7 +931,7 @@ def admin_moderation():
         "WHERE v.status = ? AND (? = '' OR c.name LIKE '%' || ? || '%') "
         "ORDER BY v.created_at DESC LIMIT ? OFFSET ?"
     )
-    vacancies = db.execute(vac_sql, (status_q, company_q, company_q, per_page, offset)).fetchall()
+    vacancies = db.execute(vac_sql, (status_q, company_q, company_q, per_page, offset))
 
     vac_count = db.execute(
         "SELECT COUNT(*) FROM vacancies v JOIN companies c ON v.company_id=c.id WHERE v.status = ? AND (? = '' OR c.name LIKE '%' || ? || '%')",
@@ -468,13 +944,17 @@ def admin_moderation():
         "WHERE ir.status = ? AND (? = '' OR u.username LIKE '%' || ? || '%') "
         "ORDER BY ir.id DESC LIMIT ? OFFSET ?"
     )
-    internship_requests = db.execute(int_sql, (status_q, university_q, university_q, per_page, offset)).fetchall()
+    internship_requests = db.execute(int_sql, (status_q, university_q, university_q, per_page, offset))
 
     int_count = db.execute(
         "SELECT COUNT(*) FROM internship_requests ir JOIN users u ON ir.university_id=u.id WHERE ir.status = ? AND (? = '' OR u.username LIKE '%' || ? || '%')",
         (status_q, university_q, university_q),
     ).fetchone()[0]
-    return render_template(
+
+    # Элементы, захваченные текущим модератором
+    claims = moderation_queue.my_claims(db, session.get("user_id")) if tab == "queue" else []
+    queue_stats = moderation_queue.stats(db)
+    return stream_page(
         "moderation.html",
         tab=tab,
         vacancies=vacancies,
@@ -486,44 +966,102 @@ def admin_moderation():
         status_q=status_q,
         company_q=company_q,
         university_q=university_q,
+        claims=claims,
+        queue_stats=queue_stats,
     )
 
 
-@app.post("/admin/moderation/vacancy/<int:vacancy_id>/approve")
-@role_required("admin")
-def approve_vacancy(vacancy_id: int):
+MODERATION_TABLES = {"vacancy": "vacancies", "internship": "internship_requests"}
+
+
+def apply_moderation_decision(item_type, item_id, new_status, action):
+    """Применяет решение модератора идемпотентно: повторное решение ничего не меняет"""
     db = get_db()
-    row = db.execute("SELECT id FROM vacancies WHERE id = ?", (vacancy_id,)).fetchone()
+    table = MODERATION_TABLES[item_type]
+    row = db.execute(f"SELECT id FROM {table} WHERE id = ?", (item_id,)).fetchone()
     if not row:
-        abort(404, description="Vacancy not found")
-    db.execute("UPDATE vacancies SET status = 'published' WHERE id = ?", (vacancy_id,))
-    db.execute(
-        "INSERT INTO moderation_logs (item_type, item_id, action, moderator_id) VALUES (?,?,?,?)",
-        ("vacancy", vacancy_id, "approve", session.get("user_id")),
-    )
+        abort(404, description="Vacancy not found" if item_type == "vacancy" else "Internship request not found")
+    if moderation_queue.locked_by_other(db, item_type, item_id, session.get("user_id")):
+        return "locked"
+    # Условие по статусу делает решение идемпотентным: второй модератор получит rowcount = 0
+    changed = db.execute(
+        f"UPDATE {table} SET status = ? WHERE id = ? AND status != ?",
+        (new_status, item_id, new_status),
+    ).rowcount
+    moderation_queue.complete(db, item_type, item_id)
+    if changed:
+        notify_moderation_result(db, item_type, item_id, new_status)
     db.commit()
-    flash("Вакансия одобрена и опубликована.", "success")
-    return redirect(url_for("admin_moderation", tab="vacancies"))
+    if changed:
+        if item_type == "vacancy":
+            cache_bus.publish(CATALOG_CACHE)
+        event_log.emit(item_type, item_id, action, session.get("user_id"), status=new_status)
+    return "done" if changed else "noop"
+
+
+def notify_moderation_result(db, item_type, item_id, new_status):
+    """Уведомляет автора вакансии или заявки о решении модератора (в текущей транзакции)"""
+    if item_type == "vacancy":
+        row = db.execute("SELECT created_by AS owner_id, title FROM vacancies WHERE id = ?", (item_id,)).fetchone()
+        subject = f"Вакансия «{row['title']}» " + ("опубликована" if new_status == "published" else "отклонена модератором")
+    else:
+        row = db.execute(
+            "SELECT university_id AS owner_id, specialization AS title FROM internship_requests WHERE id = ?", (item_id,)
+        ).fetchone()
+        subject = f"Заявка на стажировку «{row['title'] or item_id}» " + ("опубликована" if new_status == "published" else "отклонена модератором")
+    notifications.notify(
+        db, row["owner_id"], "moderation", subject, "Результат модерации доступен в личном кабинете.",
+        dedup_key=f"moderation:{item_type}:{item_id}",
+    )
+
+
+def flash_moderation_result(result, done_message, done_category):
+    if result == "locked":
+        flash("Элемент уже взят в работу другим модератором.", "warning")
+    elif result == "noop":
+        flash("Решение по этому элементу уже принято.", "info")
+    else:
+        flash(done_message, done_category)
 
 
-@app.post("/admin/moderation/vacancy/<int:vacancy_id>/reject")
+@bp.post("/admin/moderation/claim")
 @role_required("admin")
-def reject_vacancy(vacancy_id: int):
+def claim_moderation_items():
     db = get_db()
-    row = db.execute("SELECT id FROM vacancies WHERE id = ?", (vacancy_id,)).fetchone()
-    if not row:
-        abort(404, description="Vacancy not found")
-    db.execute("UPDATE vacancies SET status = 'rejected' WHERE id = ?", (vacancy_id,))
-    db.execute(
-        "INSERT INTO moderation_logs (item_type, item_id, action, moderator_id) VALUES (?,?,?,?)",
-        ("vacancy", vacancy_id, "reject", session.get("user_id")),
-    )
-    db.commit()
-    flash("Вакансия отклонена.", "info")
-    return redirect(url_for("admin_moderation", tab="vacancies"))
+    claimed = moderation_queue.claim(db, session.get("user_id"))
+    flash(f"Взято в работу элементов: {len(claimed)}.", "info")
+    return redirect(url_for("main.admin_moderation", tab="queue"))
+
+
+@bp.post("/admin/moderation/release")
+@role_required("admin")
+def release_moderation_items():
+    moderation_queue.release(get_db(), session.get("user_id"))
+    flash("Элементы возвращены в общую очередь.", "info")
+    return redirect(url_for("main.admin_moderation", tab="queue"))
+
+
+@bp.post("/admin/moderation/vacancy/<int:vacancy_id>/approve")
+@role_required("admin")
+def approve_vacancy(vacancy_id: int):
+    result = apply_moderation_decision("vacancy", vacancy_id, "published", "approve")
+    if result == "done":
+        recommendations.on_vacancy_published(get_db(), vacancy_id)
+    flash_moderation_result(result, "Вакансия одобрена и опубликована.", "success")
+    return redirect(url_for("main.admin_moderation", tab="vacancies"))
 
 
-@app.post("/admin/moderation/vacancy/<int:vacancy_id>/delete")
+@bp.post("/admin/moderation/vacancy/<int:vacancy_id>/reject")
+@role_required("admin")
+def reject_vacancy(vacancy_id: int):
+    result = apply_moderation_decision("vacancy", vacancy_id, "rejected", "reject")
+    if result == "done":
+        recommendations.remove_item(get_db(), matching.VACANCY, vacancy_id)
+    flash_moderation_result(result, "Вакансия отклонена.", "info")
+    return redirect(url_for("main.admin_moderation", tab="vacancies"))
+
+
+@bp.post("/admin/moderation/vacancy/<int:vacancy_id>/delete")
 @role_required("admin")
 def delete_vacancy(vacancy_id: int):
     db = get_db()
@@ -533,50 +1071,35 @@ def delete_vacancy(vacancy_id: int):
     if row["status"] == "on_moderation":
         abort(400, description="Cannot delete item on moderation")
     db.execute("DELETE FROM vacancies WHERE id = ?", (vacancy_id,))
-    db.execute(
-        "INSERT INTO moderation_logs (item_type, item_id, action, moderator_id) VALUES (?,?,?,?)",
-        ("vacancy", vacancy_id, "delete", session.get("user_id")),
-    )
     db.commit()
+    cache_bus.publish(CATALOG_CACHE)
+    event_log.emit("vacancy", vacancy_id, "delete", session.get("user_id"), status=row["status"])
+    recommendations.remove_item(db, matching.VACANCY, vacancy_id)
     flash("Вакансия удалена (если она была не на модерации).", "warning")
-    return redirect(url_for("admin_moderation", tab="vacancies"))
+    return redirect(url_for("main.admin_moderation", tab="vacancies"))
 
 
-@app.post("/admin/moderation/internship/<int:req_id>/approve")
+@bp.post("/admin/moderation/internship/<int:req_id>/approve")
 @role_required("admin")
 def approve_internship(req_id: int):
-    db = get_db()
-    row = db.execute("SELECT id FROM internship_requests WHERE id = ?", (req_id,)).fetchone()
-    if not row:
-        abort(404, description="Internship request not found")
-    db.execute("UPDATE internship_requests SET status = 'published' WHERE id = ?", (req_id,))
-    db.execute(
-        "INSERT INTO moderation_logs (item_type, item_id, action, moderator_id) VALUES (?,?,?,?)",
-        ("internship", req_id, "approve", session.get("user_id")),
-    )
-    db.commit()
-    flash("Заявка на стажировку опубликована.", "success")
-    return redirect(url_for("admin_moderation", tab="internships"))
+    result = apply_moderation_decision("internship", req_id, "published", "approve")
+    if result == "done":
+        recommendations.on_internship_published(get_db(), req_id)
+    flash_moderation_result(result, "Заявка на стажировку опубликована.", "success")
+    return redirect(url_for("main.admin_moderation", tab="internships"))
 
 
-@app.post("/admin/moderation/internship/<int:req_id>/reject")
+@bp.post("/admin/moderation/internship/<int:req_id>/reject")
 @role_required("admin")
 def reject_internship(req_id: int):
-    db = get_db()
-    row = db.execute("SELECT id FROM internship_requests WHERE id = ?", (req_id,)).fetchone()
-    if not row:
-        abort(404, description="Internship request not found")
-    db.execute("UPDATE internship_requests SET status = 'rejected' WHERE id = ?", (req_id,))
-    db.execute(
-        "INSERT INTO moderation_logs (item_type, item_id, action, moderator_id) VALUES (?,?,?,?)",
-        ("internship", req_id, "reject", session.get("user_id")),
-    )
-    db.commit()
-    flash("Заявка на стажировку отклонена.", "info")
-    return redirect(url_for("admin_moderation", tab="internships"))
+    result = apply_moderation_decision("internship", req_id, "rejected", "reject")
+    if result == "done":
+        recommendations.remove_item(get_db(), matching.INTERNSHIP, req_id)
+    flash_moderation_result(result, "Заявка на стажировку отклонена.", "info")
+    return redirect(url_for("main.admin_moderation", tab="internships"))
 
 
-@app.post("/admin/moderation/internship/<int:req_id>/delete")
+@bp.post("/admin/moderation/internship/<int:req_id>/delete")
 @role_required("admin")
 def delete_internship(req_id: int):
     db = get_db()
@@ -586,38 +1109,50 @@ def delete_internship(req_id: int):
     if row["status"] == "on_moderation":
         abort(400, description="Cannot delete item on moderation")
     db.execute("DELETE FROM internship_requests WHERE id = ?", (req_id,))
-    db.execute(
-        "INSERT INTO moderation_logs (item_type, item_id, action, moderator_id) VALUES (?,?,?,?)",
-        ("internship", req_id, "delete", session.get("user_id")),
-    )
     db.commit()
+    event_log.emit("internship", req_id, "delete", session.get("user_id"), status=row["status"])
+    recommendations.remove_item(db, matching.INTERNSHIP, req_id)
     flash("Заявка удалена (если она была рассмотрена).", "warning")
-    return redirect(url_for("admin_moderation", tab="internships"))
+    return redirect(url_for("main.admin_moderation", tab="internships"))
 
 
 # -------------------- Каталог вакансий и стажировок --------------------
-@app.route("/catalog")
+@bp.route("/catalog")
 @login_required
 def catalog():
     db = get_db()
-    # Получаем опубликованные вакансии
-    vacancies = db.execute(
-        "SELECT v.id, v.title, v.description, v.salary_range, c.name AS company_name, v.created_at "
-        "FROM vacancies v JOIN companies c ON v.company_id = c.id "
-        "WHERE v.status = 'published' ORDER BY v.created_at DESC"
-    ).fetchall()
-    
-    # Получаем опубликованные стажировки
-    internships = db.execute(
-        "SELECT ir.id, ir.specialization, ir.student_count, ir.period_start, ir.period_end, u.username AS university_name "
-        "FROM internship_requests ir JOIN users u ON ir.university_id = u.id "
-        "WHERE ir.status = 'published' ORDER BY ir.id DESC"
-    ).fetchall()
-    
-    return render_template("catalog.html", vacancies=vacancies)
+    # Выбранные фасеты: ?city=Москва&salary=100000&skill=3&company=2
+    selected = {
+        "city": (request.args.get("city") or "").strip() or None,
+        "company": request.args.get("company", type=int),
+        "salary": request.args.get("salary", type=int),
+        "skill": request.args.get("skill", type=int),
+    }
+    # Каталог одинаков для всех пользователей, поэтому кешируется в воркере;
+    # публикация, снятие и удаление вакансии вытесняют его через cache_bus
+    filters = ":".join(str(selected[name] or "") for name in ("city", "company", "salary", "skill"))
+    vacancies, total = cache_bus.cached(
+        f"{CATALOG_CACHE}:search:{filters}",
+        lambda: facets.search(
+            db, city=selected["city"], company_id=selected["company"],
+            salary_from=selected["salary"], skill_id=selected["skill"],
+        ),
+    )
+    facet_counts = cache_bus.cached(f"{CATALOG_CACHE}:counts", lambda: facets.counts(db))
+    return render_template(
+        "catalog.html", vacancies=vacancies, total=total, facet_counts=facet_counts, selected=selected
+    )
+
+
+@bp.route("/recommendations")
+@login_required
+def candidate_recommendations():
+    db = get_db()
+    vacancies = recommendations.vacancy_feed(db, session.get("user_id"))
+    return render_template("recommendations.html", vacancies=vacancies)
 
 
-@app.route("/vacancy/<int:vacancy_id>")
+@bp.route("/vacancy/<int:vacancy_id>")
 @login_required
 def vacancy_detail(vacancy_id):
     db = get_db()
@@ -630,69 +1165,185 @@ def vacancy_detail(vacancy_id):
     return render_template("vacancy_detail.html", vacancy=vacancy)
 
 
-@app.route("/vacancy/<int:vacancy_id>/apply", methods=["GET", "POST"])
+MAX_STORED_RESUMES = 5
+
+
+def candidate_resumes(db, candidate_id):
+    """Сохраненные (не удаленные) резюме кандидата"""
+    return db.execute(
+        "SELECT r.id, r.title, r.experience, r.education, r.resume_file, r.indexed_at, "
+        "(SELECT COUNT(*) FROM applications a WHERE a.resume_id = r.id) AS application_count "
+        "FROM resumes r WHERE r.candidate_id = ? AND r.stored = 1 AND r.deleted_at IS NULL ORDER BY r.id DESC",
+        (candidate_id,),
+    ).fetchall()
+
+
+def create_resume_from_form(db, candidate_id):
+    """Создает сохраненное резюме из полей формы и файла; возвращает (id, сообщение об ошибке).
+
+    Индексацию ставит в очередь вызывающий код после коммита своих изменений.
+    """
+    title = (request.form.get("title") or "").strip()
+    if not title:
+        first_name = (request.form.get("first_name") or "").strip()
+        last_name = (request.form.get("last_name") or "").strip()
+        title = f"{first_name} {last_name}".strip()
+    if not title:
+        return None, "Укажите название резюме или имя и фамилию."
+    count = db.execute(
+        "SELECT COUNT(*) FROM resumes WHERE candidate_id = ? AND stored = 1 AND deleted_at IS NULL", (candidate_id,)
+    ).fetchone()[0]
+    if count >= MAX_STORED_RESUMES:
+        return None, f"Можно хранить не более {MAX_STORED_RESUMES} резюме. Удалите лишние в разделе «Мои резюме»."
+
+    # Обработка загрузки файла резюме (опционально)
+    resume_file = request.files.get("resume_file")
+    resume_file_path = None
+    if resume_file and resume_file.filename:
+        if not allowed_file(resume_file.filename):
+            return None, "Недопустимый формат файла. Разрешены только PDF, DOC и DOCX файлы."
+        # Формат имени: resume_userId_метка_originalname (см. hr_download_resume)
+        filename = secure_filename(resume_file.filename)
+        resume_file_path = os.path.join(
+            current_app.config['UPLOAD_FOLDER'], f"resume_{candidate_id}_{os.urandom(4).hex()}_{filename}"
+        )
+        resume_file.save(resume_file_path)
+
+    resume_id = db.execute(
+        "INSERT INTO resumes (candidate_id, title, experience, education, resume_file, is_public, skills_text, stored) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, 1)",
+        (
+            candidate_id, title,
+            (request.form.get("experience") or "").strip(),
+            (request.form.get("education") or "").strip(),
+            resume_file_path, 1,
+            (request.form.get("skills") or "").strip(),
+        ),
+    ).lastrowid
+    db.commit()
+    event_log.emit("resume", resume_id, "create", candidate_id)
+    return resume_id, None
+
+
+@bp.route("/resumes", methods=["GET", "POST"])
+@role_required("candidate")
+def candidate_resume_list():
+    db = get_db()
+    if request.method == "POST":
+        resume_id, error = create_resume_from_form(db, session.get("user_id"))
+        if error:
+            flash(error, "warning")
+        else:
+            # Текст файла и навыки разбираются один раз, в фоне
+            resume_index.enqueue(db_connector(), resume_id)
+            flash("Резюме сохранено. Его можно прикреплять к откликам.", "success")
+        return redirect(url_for("main.candidate_resume_list"))
+    return render_template(
+        "candidate_resumes.html", resumes=candidate_resumes(db, session.get("user_id")), max_resumes=MAX_STORED_RESUMES
+    )
+
+
+@bp.post("/resumes/<int:resume_id>/delete")
+@role_required("candidate")
+def candidate_delete_resume(resume_id):
+    db = get_db()
+    resume = db.execute(
+        "SELECT id, resume_file FROM resumes WHERE id = ? AND candidate_id = ? AND stored = 1 AND deleted_at IS NULL",
+        (resume_id, session.get("user_id")),
+    ).fetchone()
+    if not resume:
+        abort(404)
+    used = db.execute("SELECT 1 FROM applications WHERE resume_id = ? LIMIT 1", (resume_id,)).fetchone()
+    if used:
+        # HR по-прежнему видит резюме в откликах; строку и файл уберет storage-gc, когда откликов не останется
+        db.execute("UPDATE resumes SET deleted_at = CURRENT_TIMESTAMP, is_public = 0 WHERE id = ?", (resume_id,))
+        db.execute("DELETE FROM match_scores WHERE target_type = 'internship' AND resume_id = ?", (resume_id,))
+    else:
+        db.execute("DELETE FROM resumes WHERE id = ?", (resume_id,))
+    db.commit()
+    if not used:
+        storage_gc.remove_replaced_file(resume["resume_file"], None, current_app.config['UPLOAD_FOLDER'])
+    event_log.emit("resume", resume_id, "delete", session.get("user_id"))
+    recommendations.refresh_candidate(db, session.get("user_id"))
+    flash("Резюме удалено.", "info")
+    return redirect(url_for("main.candidate_resume_list"))
+
+
+@bp.route("/vacancy/<int:vacancy_id>/apply", methods=["GET", "POST"])
 @login_required
 def apply_to_vacancy(vacancy_id):
     db = get_db()
     vacancy = db.execute(
-        "SELECT v.*, c.name AS company_name FROM vacancies v JOIN companies c ON v.company_id = c.id WHERE v.id = ? AND v.status = 'published'",
+        "SELECT v.*, c.name AS company_name, c.contact_user_id AS hr_user_id FROM vacancies v JOIN companies c ON v.company_id = c.id WHERE v.id = ? AND v.status = 'published'",
         (vacancy_id,),
     ).fetchone()
     if not vacancy:
         abort(404)
+    resumes = candidate_resumes(db, session.get("user_id"))
     
     if request.method == "POST":
         cover_letter = (request.form.get("cover_letter") or "").strip()
+        selected = request.form.get("resume_id") or "new"
         
-        # Получаем данные из формы
-        first_name = (request.form.get("first_name") or "").strip()
-        last_name = (request.form.get("last_name") or "").strip()
-        age = request.form.get("age")
-        city = (request.form.get("city") or "").strip()
-        education = (request.form.get("education") or "").strip()
-        experience = (request.form.get("experience") or "").strip()
-        skills = (request.form.get("skills") or "").strip()
-        
-        if not first_name or not last_name:
-            flash("Заполните обязательные поля (имя и фамилия).", "warning")
-            return render_template("apply_to_vacancy.html", vacancy=vacancy)
-        
-        # Обработка загрузки файла резюме (опционально)
-        resume_file = request.files.get("resume_file")
-        resume_file_path = None
-        
-        if resume_file and resume_file.filename:
-            if not allowed_file(resume_file.filename):
-                flash("Недопустимый формат файла. Разрешены только PDF, DOC и DOCX файлы.", "warning")
-                return render_template("apply_to_vacancy.html", vacancy=vacancy)
-            
-            # Сохраняем файл на сервер
-            filename = secure_filename(resume_file.filename)
-            resume_file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"resume_{session.get('user_id')}_{vacancy_id}_{filename}")
-            resume_file.save(resume_file_path)
-        
-        # Создаём резюме в БД с данными из анкеты и опциональным файлом
-        resume_id = db.execute(
-            "INSERT INTO resumes (candidate_id, title, experience, education, resume_file, is_public) VALUES (?, ?, ?, ?, ?, ?)",
-            (session.get("user_id"), f"{first_name} {last_name}", experience, education, resume_file_path, 1),
-        ).lastrowid
-        db.commit()
+        if selected == "new":
+            # Новое резюме сохраняется и дальше прикрепляется к другим откликам без повторного ввода
+            resume_id, error = create_resume_from_form(db, session.get("user_id"))
+            if error:
+                flash(error, "warning")
+                return render_template("apply_to_vacancy.html", vacancy=vacancy, resumes=resumes)
+            indexed = False
+            # Город и возраст из анкеты сохраняем в профиль кандидата
+            age = request.form.get("age", type=int)
+            age = age if age is not None and 16 <= age <= 100 else None
+            city = facets.normalize_city(request.form.get("city"))
+            if age is not None or city:
+                db.execute(
+                    "INSERT INTO profiles (user_id, city, age) VALUES (?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET "
+                    "city = COALESCE(excluded.city, city), age = COALESCE(excluded.age, age)",
+                    (session.get("user_id"), city, age),
+                )
+        else:
+            resume = db.execute(
+                "SELECT id, title, indexed_at FROM resumes WHERE id = ? AND candidate_id = ? AND stored = 1 AND deleted_at IS NULL",
+                (selected, session.get("user_id")),
+            ).fetchone()
+            if not resume:
+                abort(404)
+            resume_id, indexed = resume["id"], resume["indexed_at"] is not None
         
-        # Создаём отклик
-        db.execute(
+        # Отклик — одна строка со ссылкой на резюме
+        application_id = db.execute(
             "INSERT INTO applications (vacancy_id, candidate_id, resume_id, status, cover_letter) VALUES (?, ?, ?, 'new', ?)",
             (vacancy_id, session.get("user_id"), resume_id, cover_letter),
+        ).lastrowid
+        candidate = db.execute(
+            "SELECT title FROM resumes WHERE id = ?", (resume_id,)
+        ).fetchone()
+        notifications.notify(
+            db, vacancy["hr_user_id"], "application", f"Новый отклик на вакансию «{vacancy['title']}»",
+            f"Резюме: {candidate['title']}. Отклик доступен в кабинете HR.",
+            dedup_key=f"application:{application_id}", schema="appl",
         )
         db.commit()
+        event_log.emit("application", application_id, "create", session.get("user_id"), vacancy_id=vacancy_id, resume_id=resume_id)
+
+        if indexed:
+            # Навыки резюме уже разобраны: досчитываем только пару вакансия-резюме
+            matching.score_target(db, matching.VACANCY, vacancy_id, [resume_id])
+            recommendations.on_applied(db, session.get("user_id"), vacancy_id)
+        else:
+            # Новое резюме индексируется после коммита отклика: обработчики on_indexed
+            # считают оценки и ленту кандидата, уже видя этот отклик
+            resume_index.enqueue(db_connector(), resume_id)
         
         flash("Отклик отправлен! HR компании получит уведомление.", "success")
-        return redirect(url_for("application_success", vacancy_id=vacancy_id))
+        return redirect(url_for("main.application_success", vacancy_id=vacancy_id))
     
-    return render_template("apply_to_vacancy.html", vacancy=vacancy)
+    return render_template("apply_to_vacancy.html", vacancy=vacancy, resumes=resumes)
 
 
 # -------------------- Кабинет HR --------------------
-@app.route("/hr")
+@bp.route("/hr")
 @role_required("company_hr")
 def hr_dashboard():
     db = get_db()
@@ -702,21 +1353,38 @@ def hr_dashboard():
         (session.get("user_id"),),
     ).fetchone()
     
+    # Курсоры читаются во время отдачи страницы (stream_page), без fetchall()
     vacancies = db.execute(
         "SELECT v.*, COUNT(a.id) as application_count FROM vacancies v LEFT JOIN applications a ON v.id = a.vacancy_id WHERE v.company_id = ? GROUP BY v.id ORDER BY v.created_at DESC",
         (company["id"],),
-    ).fetchall()
+    )
     
-    # Получаем отклики на вакансии компании
+    # Получаем отклики на вакансии компании (опционально фильтруем по навыку через resume_skills)
+    skill_q = resume_index.normalize_skill(request.args.get("skill")) or ""
     applications = db.execute(
-        "SELECT a.*, v.title as vacancy_title, u.username as candidate_name FROM applications a JOIN vacancies v ON a.vacancy_id = v.id JOIN users u ON a.candidate_id = u.id WHERE v.company_id = ? ORDER BY a.created_at DESC",
-        (company["id"],),
-    ).fetchall()
+        "SELECT a.*, v.title as vacancy_title, u.username as candidate_name FROM applications a JOIN vacancies v ON a.vacancy_id = v.id JOIN users u ON a.candidate_id = u.id "
+        "WHERE v.company_id = ? AND (? = '' OR a.resume_id IN "
+        "(SELECT rs.resume_id FROM resume_skills rs JOIN skills s ON s.id = rs.skill_id WHERE s.name = ?)) "
+        "ORDER BY a.created_at DESC",
+        (company["id"], skill_q, skill_q),
+    )
     
-    return render_template("hr_dashboard.html", vacancies=vacancies, applications=applications)
+    return stream_page("hr_dashboard.html", vacancies=vacancies, applications=applications, skill_q=skill_q)
+
+
+@bp.route("/hr/recommendations")
+@role_required("company_hr")
+def hr_recommendations():
+    db = get_db()
+    company = db.execute(
+        "SELECT id FROM companies WHERE contact_user_id = ?",
+        (session.get("user_id"),),
+    ).fetchone()
+    internships = recommendations.internship_feed(db, company["id"])
+    return render_template("hr_recommendations.html", internships=internships)
 
 
-@app.route("/hr/vacancies/new", methods=["GET", "POST"])
+@bp.route("/hr/vacancies/new", methods=["GET", "POST"])
 @role_required("company_hr")
 def hr_create_vacancy():
     if request.method == "POST":
@@ -724,6 +1392,8 @@ def hr_create_vacancy():
         description = (request.form.get("description") or "").strip()
         requirements = (request.form.get("requirements") or "").strip()
         salary_range = (request.form.get("salary_range") or "").strip()
+        city = facets.normalize_city(request.form.get("city"))
+        salary_min, salary_max = facets.parse_salary(salary_range)
         contacts = (request.form.get("contacts") or "").strip()
         
         if not title:
@@ -736,19 +1406,72 @@ def hr_create_vacancy():
             (session.get("user_id"),),
         ).fetchone()
         
-        db.execute(
-            "INSERT INTO vacancies (title, description, requirements, salary_range, company_id, status, created_by) VALUES (?, ?, ?, ?, ?, 'on_moderation', ?)",
-            (title, description, requirements, salary_range, company["id"], session.get("user_id")),
-        )
+        vacancy_id = db.execute(
+            "INSERT INTO vacancies (title, description, requirements, salary_range, salary_min, salary_max, city, company_id, status, created_by) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'on_moderation', ?)",
+            (title, description, requirements, salary_range, salary_min, salary_max, city, company["id"], session.get("user_id")),
+        ).lastrowid
+        moderation_queue.enqueue(db, "vacancy", vacancy_id, f"company:{company['id']}")
         db.commit()
+        event_log.emit("vacancy", vacancy_id, "create", session.get("user_id"), company_id=company["id"])
+        matching.index_vacancy(db, vacancy_id)
         
         flash("Вакансия отправлена на модерацию.", "success")
-        return redirect(url_for("hr_dashboard"))
+        return redirect(url_for("main.hr_dashboard"))
     
     return render_template("hr_vacancy_create.html")
 
 
-@app.route("/application/success/<int:vacancy_id>")
+def run_vacancy_import(db, company_id, user_id, rows, dry_run=False):
+    """Импортирует вакансии и пишет события создания; общий код для HTTP и CLI"""
+    report = vacancy_import.import_vacancies(db, company_id, user_id, rows, dry_run=dry_run)
+    for vacancy_id in report["vacancy_ids"]:
+        event_log.emit("vacancy", vacancy_id, "create", user_id, company_id=company_id, source="import")
+    return report
+
+
+@bp.route("/hr/vacancies/import", methods=["GET", "POST"])
+@role_required("company_hr")
+def hr_import_vacancies():
+    if request.method == "GET":
+        return render_template("hr_vacancy_import.html", report=None)
+
+    db = get_db()
+    company = db.execute(
+        "SELECT id FROM companies WHERE contact_user_id = ?",
+        (session.get("user_id"),),
+    ).fetchone()
+    if not company:
+        abort(404)
+    dry_run = bool(request.values.get("dry_run"))
+    try:
+        if request.is_json:
+            # API-клиенты присылают список вакансий прямо в теле запроса
+            payload = request.get_json(silent=True)
+            rows = payload.get("vacancies") if isinstance(payload, dict) else payload
+            if not isinstance(rows, list):
+                raise vacancy_import.ImportFormatError("JSON должен содержать список вакансий")
+        else:
+            upload = request.files.get("file")
+            if not upload or not upload.filename:
+                flash("Выберите файл CSV или JSON.", "warning")
+                return render_template("hr_vacancy_import.html", report=None)
+            rows = vacancy_import.read_rows(upload.read(), upload.filename)
+        report = run_vacancy_import(db, company["id"], session.get("user_id"), rows, dry_run=dry_run)
+    except vacancy_import.ImportFormatError as exc:
+        if request.is_json:
+            return jsonify({"error": str(exc)}), 400
+        flash(str(exc), "danger")
+        return render_template("hr_vacancy_import.html", report=None), 400
+
+    if request.is_json:
+        return jsonify(report)
+    if report["imported"]:
+        flash(f"Импортировано вакансий: {report['imported']}. Они отправлены на модерацию.", "success")
+    return render_template("hr_vacancy_import.html", report=report, dry_run=dry_run)
+
+
+@bp.route("/application/success/<int:vacancy_id>")
 @login_required
 def application_success(vacancy_id):
     db = get_db()
@@ -761,12 +1484,12 @@ def application_success(vacancy_id):
     return render_template("application_success.html", vacancy=vacancy)
 
 
-@app.route("/hr/applications/<int:application_id>")
+@bp.route("/hr/applications/<int:application_id>")
 @role_required("company_hr")
 def hr_view_application(application_id):
     db = get_db()
     application = db.execute(
-        "SELECT a.*, v.title as vacancy_title, u.username as candidate_name, p.first_name, p.last_name, p.phone, r.id as resume_id, r.title as resume_title, r.experience, r.education, r.resume_file "
+        "SELECT a.*, v.title as vacancy_title, u.username as candidate_name, p.first_name, p.last_name, p.phone, p.city, p.age, r.id as resume_id, r.title as resume_title, r.experience, r.education, r.resume_file "
         "FROM applications a "
         "JOIN vacancies v ON a.vacancy_id = v.id "
         "JOIN users u ON a.candidate_id = u.id "
@@ -777,10 +1500,36 @@ def hr_view_application(application_id):
     ).fetchone()
     if not application:
         abort(404)
-    return render_template("hr_application_detail.html", application=application)
+    skills = resume_index.resume_skill_names(db, application["resume_id"]) if application["resume_id"] else []
+    return render_template("hr_application_detail.html", application=application, skills=skills)
+
+
+APPLICATION_STATUSES = ("new", "viewed", "interview", "rejected")
+
+
+@bp.post("/hr/applications/<int:application_id>/status")
+@role_required("company_hr")
+def hr_update_application_status(application_id):
+    status = request.form.get("status") or ""
+    if status not in APPLICATION_STATUSES:
+        abort(400, description="Unknown application status")
+    db = get_db()
+    application = db.execute(
+        "SELECT a.id, a.status FROM applications a JOIN vacancies v ON a.vacancy_id = v.id "
+        "WHERE a.id = ? AND v.company_id IN (SELECT id FROM companies WHERE contact_user_id = ?)",
+        (application_id, session.get("user_id")),
+    ).fetchone()
+    if not application:
+        abort(404)
+    if application["status"] != status:
+        db.execute("UPDATE applications SET status = ? WHERE id = ?", (status, application_id))
+        db.commit()
+        event_log.emit("application", application_id, "status", session.get("user_id"), old=application["status"], new=status)
+    flash("Статус отклика обновлен.", "success")
+    return redirect(request.referrer or url_for("main.hr_dashboard"))
 
 
-@app.route("/hr/resume/<int:resume_id>/download")
+@bp.route("/hr/resume/<int:resume_id>/download")
 @role_required("company_hr")
 def hr_download_resume(resume_id):
     db = get_db()
@@ -804,9 +1553,9 @@ def hr_download_resume(resume_id):
     original_filename = os.path.basename(resume["resume_file"])
     
     # Убираем префикс с ID пользователя и вакансии для более читаемого имени
-    # Формат: resume_userId_vacancyId_originalname
+    # Формат: resume_userId_метка_originalname (раньше вместо метки был vacancyId)
     if original_filename.startswith("resume_") and "_" in original_filename:
-        parts = original_filename.split('_', 3)  # resume, userId, vacancyId, originalname
+        parts = original_filename.split('_', 3)  # resume, userId, метка, originalname
         if len(parts) >= 4:
             original_filename = parts[3]
         elif len(parts) == 3:
@@ -823,7 +1572,7 @@ def hr_download_resume(resume_id):
     return send_file(resume["resume_file"], as_attachment=True, download_name=original_filename)
 
 
-@app.route("/hr/resume/<int:resume_id>/view")
+@bp.route("/hr/resume/<int:resume_id>/view")
 @role_required("company_hr")
 def hr_view_resume(resume_id):
     db = get_db()
@@ -842,7 +1591,7 @@ def hr_view_resume(resume_id):
     return render_template("hr_resume_view.html", resume=resume)
 
 
-@app.route("/hr/vacancies/<int:vacancy_id>/close", methods=["POST"])
+@bp.route("/hr/vacancies/<int:vacancy_id>/close", methods=["POST"])
 @role_required("company_hr")
 def hr_close_vacancy(vacancy_id):
     db = get_db()
@@ -860,13 +1609,128 @@ def hr_close_vacancy(vacancy_id):
         (vacancy_id,),
     )
     db.commit()
+    cache_bus.publish(CATALOG_CACHE)
+    event_log.emit("vacancy", vacancy_id, "close", session.get("user_id"), status="archived")
+    recommendations.remove_item(db, matching.VACANCY, vacancy_id)
     
     flash("Вакансия закрыта и перемещена в архив.", "success")
-    return redirect(url_for("hr_dashboard"))
+    return redirect(url_for("main.hr_dashboard"))
+
+
+@bp.route("/hr/vacancies/<int:vacancy_id>/shortlist")
+@role_required("company_hr")
+def hr_vacancy_shortlist(vacancy_id):
+    db = get_db()
+    vacancy = db.execute(
+        "SELECT id, title, requirements FROM vacancies WHERE id = ? AND company_id IN (SELECT id FROM companies WHERE contact_user_id = ?)",
+        (vacancy_id, session.get("user_id")),
+    ).fetchone()
+    if not vacancy:
+        abort(404)
+    candidates = matching.vacancy_shortlist(db, vacancy_id)
+    return render_template("hr_shortlist.html", vacancy=vacancy, candidates=candidates)
+
+
+def stream_applications_export(company_id, vacancy_id, prefix):
+    """Отдает отклики компании потоком в формате из ?format= с фильтрами status/date_from/date_to"""
+    import exports
+
+    fmt = request.args.get("format", "csv")
+    if fmt not in exports.FORMATS:
+        abort(400, description="Unknown export format")
+    status = request.args.get("status") or None
+    if status is not None and status not in APPLICATION_STATUSES:
+        abort(400, description="Unknown application status")
+    try:
+        date_from = exports.parse_date(request.args.get("date_from"))
+        date_to = exports.parse_date(request.args.get("date_to"))
+    except ValueError:
+        abort(400, description="Dates must be in YYYY-MM-DD format")
+    cursor = exports.query_applications(get_db(), company_id, vacancy_id, status, date_from, date_to)
+    # stream_with_context держит соединение g.db открытым до конца выгрузки
+    return Response(
+        stream_with_context(exports.WRITERS[fmt](cursor)),
+        mimetype=exports.FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{exports.export_filename(prefix, fmt)}"'},
+    )
+
+
+@bp.route("/hr/applications/export")
+@role_required("company_hr")
+def hr_export_applications():
+    company = get_db().execute(
+        "SELECT id FROM companies WHERE contact_user_id = ?",
+        (session.get("user_id"),),
+    ).fetchone()
+    if not company:
+        abort(404)
+    return stream_applications_export(company["id"], None, "applications")
+
+
+@bp.route("/hr/vacancies/<int:vacancy_id>/applications/export")
+@role_required("company_hr")
+def hr_export_vacancy_applications(vacancy_id):
+    vacancy = get_db().execute(
+        "SELECT id, company_id FROM vacancies WHERE id = ? AND company_id IN (SELECT id FROM companies WHERE contact_user_id = ?)",
+        (vacancy_id, session.get("user_id")),
+    ).fetchone()
+    if not vacancy:
+        abort(404)
+    return stream_applications_export(vacancy["company_id"], vacancy_id, f"vacancy_{vacancy_id}_applications")
+
+
+@bp.route("/admin/metrics/admission")
+@role_required("admin")
+def admission_metrics():
+    return jsonify(admission_controller().metrics())
+
+
+def change_feed_scope():
+    """Область ленты изменений для текущего пользователя"""
+    if session.get("role") == "admin":
+        return {"everything": True}
+    company_ids = [
+        row[0] for row in get_db().execute("SELECT id FROM companies WHERE contact_user_id = ?", (session.get("user_id"),))
+    ]
+    university_id = session.get("user_id") if session.get("role") == "university_rep" else None
+    return {"company_ids": company_ids, "university_id": university_id}
+
+
+@bp.route("/api/changes")
+@role_required("admin", "company_hr", "university_rep")
+def api_changes():
+    try:
+        since = change_feed.parse_cursor(request.args.get("since", "0"))
+    except ValueError:
+        return jsonify({"error": "since — курсор next из предыдущего ответа"}), 400
+    limit = request.args.get("limit", change_feed.DEFAULT_LIMIT, type=int)
+    return jsonify(change_feed.changes(get_db(), change_feed.format_cursor(since), limit, **change_feed_scope()))
+
+
+@bp.route("/api/changes/<entity>")
+@role_required("admin", "company_hr", "university_rep")
+def api_change_entities(entity):
+    """Пакетное чтение объектов из ленты: /api/changes/vacancy?ids=1,2,3"""
+    if entity not in change_feed.ENTITIES:
+        abort(404)
+    try:
+        ids = [int(item) for item in request.args.get("ids", "").split(",") if item.strip()]
+    except ValueError:
+        return jsonify({"error": "ids — список целых чисел через запятую"}), 400
+    if len(ids) > change_feed.MAX_FETCH_IDS:
+        return jsonify({"error": f"Не больше {change_feed.MAX_FETCH_IDS} id за запрос"}), 400
+    return jsonify({"entity": entity, "items": change_feed.fetch(get_db(), entity, ids, **change_feed_scope())})
+
+
+@bp.route("/admin/events/<entity_type>/<int:entity_id>")
+@role_required("admin")
+def admin_entity_events(entity_type, entity_id):
+    limit = min(max(int(request.args.get("limit", 100) or 100), 1), 1000)
+    return jsonify(event_log.query(entity_type, entity_id, limit))
 
 
 # Детали для модерации
-@app.route("/admin/moderation/vacancy/<int:vacancy_id>")
+@bp.route("/admin/moderation/vacancy/<int:vacancy_id>")
 @role_required("admin")
 def admin_vacancy_detail(vacancy_id: int):
     db = get_db()
@@ -879,7 +1743,7 @@ def admin_vacancy_detail(vacancy_id: int):
     return render_template("moderation_vacancy_detail.html", v=v)
 
 
-@app.route("/admin/moderation/internship/<int:req_id>")
+@bp.route("/admin/moderation/internship/<int:req_id>")
 @role_required("admin")
 def internship_detail(req_id: int):
     db = get_db()
@@ -893,18 +1757,51 @@ def internship_detail(req_id: int):
 
 
 # -------------------- Кабинет Университета --------------------
-@app.route("/university")
+@bp.route("/university")
 @role_required("university_rep")
 def university_dashboard():
     db = get_db()
     # Получаем одобренные стажировки
     approved_internships = db.execute(
         "SELECT ir.*, u.username AS university_name FROM internship_requests ir JOIN users u ON ir.university_id = u.id WHERE ir.status = 'published' ORDER BY ir.id DESC"
-    ).fetchall()
-    return render_template("university.html", username=session.get("username"), approved_internships=approved_internships)
+    )
+    return stream_page("university.html", username=session.get("username"), approved_internships=approved_internships)
+
 
+@bp.route("/internships/calendar")
+@role_required("company_hr", "university_rep", "admin")
+def internship_calendar():
+    """Календарь стажировок на месяц и поиск по диапазону дат"""
+    db = get_db()
+    university_id = session.get("user_id") if session.get("role") == "university_rep" else None
+    today = date.today()
+    try:
+        year, month = (int(part) for part in (request.args.get("month") or today.strftime("%Y-%m")).split("-"))
+        grid = internship_periods.month_grid(db, year, month, university_id)
+    except ValueError:
+        abort(404)
+    # Диапазон ?from=&to= (пересечение) или ?soon=N (начало в ближайшие N дней)
+    date_from = internship_periods.parse_date(request.args.get("from"))
+    date_to = internship_periods.parse_date(request.args.get("to"))
+    soon = request.args.get("soon", type=int)
+    matches, title = None, None
+    if date_from and date_to:
+        matches = internship_periods.overlapping(db, min(date_from, date_to), max(date_from, date_to), university_id)
+        title = f"Пересекаются с периодом {min(date_from, date_to)} — {max(date_from, date_to)}"
+    elif soon:
+        soon = min(max(soon, 1), 366)
+        matches = internship_periods.starting_between(db, today, today + timedelta(days=soon), university_id)
+        title = f"Начинаются в ближайшие {soon} дн."
+    previous_month = grid["first"] - timedelta(days=1)
+    next_month = grid["last"] + timedelta(days=1)
+    return render_template(
+        "internship_calendar.html", grid=grid, matches=matches, matches_title=title,
+        previous_month=previous_month.strftime("%Y-%m"), next_month=next_month.strftime("%Y-%m"),
+        date_from=request.args.get("from") or "", date_to=request.args.get("to") or "",
+    )
 
-@app.route("/university/internship_requests/new", methods=["GET", "POST"])
+
+@bp.route("/university/internship_requests/new", methods=["GET", "POST"])
 @role_required("university_rep")
 def create_internship_request():
     if request.method == "POST":
@@ -916,19 +1813,47 @@ def create_internship_request():
         if not specialization:
             flash("Укажите специализацию.", "warning")
             return render_template("internship_request_create.html")
+        # Даты храним в ISO: по ним строится интервальный индекс
+        start_date = internship_periods.parse_date(period_start)
+        end_date = internship_periods.parse_date(period_end)
+        if (period_start and start_date is None) or (period_end and end_date is None):
+            flash("Укажите даты периода в формате ГГГГ-ММ-ДД или ДД.ММ.ГГГГ.", "warning")
+            return render_template("internship_request_create.html")
+        if start_date and end_date and end_date < start_date:
+            flash("Конец периода раньше начала.", "warning")
+            return render_template("internship_request_create.html")
+        period_start = start_date.isoformat() if start_date else ""
+        period_end = end_date.isoformat() if end_date else ""
         db = get_db()
-        db.execute(
+        req_id = db.execute(
             "INSERT INTO internship_requests (university_id, specialization, student_count, period_start, period_end, skills_required, status) VALUES (?,?,?,?,?,?, 'on_moderation')",
             (session.get("user_id"), specialization, student_count, period_start, period_end, skills_required),
-        )
+        ).lastrowid
+        moderation_queue.enqueue(db, "internship", req_id, f"university:{session.get('user_id')}")
         db.commit()
+        event_log.emit("internship", req_id, "create", session.get("user_id"))
+        matching.index_internship(db, req_id)
         flash("Заявка отправлена на модерацию.", "success")
-        return redirect(url_for("university_dashboard"))
+        return redirect(url_for("main.university_dashboard"))
     return render_template("internship_request_create.html")
 
 
+@bp.route("/university/internship_requests/<int:req_id>/shortlist")
+@role_required("university_rep")
+def university_internship_shortlist(req_id):
+    db = get_db()
+    internship = db.execute(
+        "SELECT id, specialization, skills_required FROM internship_requests WHERE id = ? AND university_id = ?",
+        (req_id, session.get("user_id")),
+    ).fetchone()
+    if not internship:
+        abort(404)
+    candidates = matching.internship_shortlist(db, req_id)
+    return render_template("university_shortlist.html", internship=internship, candidates=candidates)
+
+
 # -------------------- Редактирование профиля --------------------
-@app.route("/profile/edit", methods=["GET", "POST"])
+@bp.route("/profile/edit", methods=["GET", "POST"])
 @login_required
 def edit_profile():
     db = get_db()
@@ -946,11 +1871,11 @@ def edit_profile():
         if avatar_file and avatar_file.filename:
             if not allowed_avatar_file(avatar_file.filename):
                 flash("Недопустимый формат файла аватара. Разрешены только PNG, JPG, JPEG, GIF, SVG.", "warning")
-                return redirect(url_for("edit_profile"))
+                return redirect(url_for("main.edit_profile"))
             
             # Сохраняем аватар
             filename = secure_filename(avatar_file.filename)
-            avatar_path = os.path.join(app.config['AVATAR_FOLDER'], f"avatar_{session.get('user_id')}_{filename}")
+            avatar_path = os.path.join(current_app.config['AVATAR_FOLDER'], f"avatar_{session.get('user_id')}_{filename}")
             avatar_file.save(avatar_path)
         
         try:
@@ -959,7 +1884,7 @@ def edit_profile():
                 db.execute("UPDATE users SET email = ? WHERE id = ?", (email, session.get("user_id")))
             
             # Обновляем или создаем профиль
-            existing_profile = db.execute("SELECT user_id FROM profiles WHERE user_id = ?", (session.get("user_id"),)).fetchone()
+            existing_profile = db.execute("SELECT user_id, avatar FROM profiles WHERE user_id = ?", (session.get("user_id"),)).fetchone()
             
             if existing_profile:
                 # Обновляем существующий профиль
@@ -981,12 +1906,19 @@ def edit_profile():
                 )
             
             db.commit()
+            if avatar_path and existing_profile:
+                # Прежний аватар больше ни на что не ссылается
+                storage_gc.remove_replaced_file(existing_profile["avatar"], avatar_path, current_app.config['AVATAR_FOLDER'])
+            event_log.emit(
+                "profile", session.get("user_id"), "update", session.get("user_id"),
+                email_changed=bool(email), avatar_changed=bool(avatar_path),
+            )
             flash("Профиль успешно обновлен.", "success")
-            return redirect(url_for("dashboard"))
+            return redirect(url_for("main.dashboard"))
             
         except sqlite3.IntegrityError:
             flash("Email уже используется другим пользователем.", "danger")
-            return redirect(url_for("edit_profile"))
+            return redirect(url_for("main.edit_profile"))
     
     # Получаем текущую информацию о пользователе
     user_info = db.execute(
@@ -998,7 +1930,7 @@ def edit_profile():
     return render_template("edit_profile.html", user=user_info)
 
 
-@app.route("/profile/change-password", methods=["GET", "POST"])
+@bp.route("/profile/change-password", methods=["GET", "POST"])
 @login_required
 def change_password():
     if request.method == "POST":
@@ -1031,18 +1963,200 @@ def change_password():
         # Обновляем пароль
         db.execute(
             "UPDATE users SET password_hash = ? WHERE id = ?",
-            (generate_password_hash(new_password), session.get("user_id"))
+            (hash_password(new_password), session.get("user_id"))
         )
         db.commit()
+        event_log.emit("user", session.get("user_id"), "password_change", session.get("user_id"))
         
         flash("Пароль успешно изменен.", "success")
-        return redirect(url_for("dashboard"))
+        return redirect(url_for("main.dashboard"))
     
     return render_template("change_password.html")
 
 
+@bp.cli.command("reindex-resumes")
+def reindex_resumes_command():
+    """Индексирует резюме, которые еще не были обработаны"""
+    db = get_db()
+    pending = resume_index.pending_resume_ids(db)
+    for resume_id in pending:
+        resume_index.process_resume(db, resume_id)
+    print(f"Проиндексировано резюме: {len(pending)}")
+
+
+@bp.cli.command("rebuild-matches")
+def rebuild_matches_command():
+    """Пересчитывает веса IDF, навыки вакансий и стажировок и все оценки соответствия"""
+    db = get_db()
+    # Оценки пересчитываются заново, поэтому снимок IDF обновляется без пересчета старых
+    matching.store_idf_snapshot(db)
+    db.commit()
+    vacancy_ids = [row["id"] for row in db.execute("SELECT id FROM vacancies")]
+    for vacancy_id in vacancy_ids:
+        matching.index_vacancy(db, vacancy_id)
+    req_ids = [row["id"] for row in db.execute("SELECT id FROM internship_requests")]
+    for req_id in req_ids:
+        matching.index_internship(db, req_id)
+    recommendations.refresh_all(db)
+    print(f"Пересчитано вакансий: {len(vacancy_ids)}, стажировок: {len(req_ids)}")
+
+
+@bp.cli.command("rebuild-facets")
+def rebuild_facets_command():
+    """Разбирает зарплаты старых вакансий и пересчитывает счетчики фасетов каталога"""
+    db = get_db()
+    parsed = facets.backfill_salaries(db)
+    facets.rebuild(db)
+    db.commit()
+    cache_bus.publish(CATALOG_CACHE)
+    print(f"Разобрано зарплат: {parsed}, счетчики фасетов пересчитаны")
+
+
+@bp.cli.command("import-vacancies")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--hr", "hr_username", required=True, help="Логин HR, от имени которого создаются вакансии")
+@click.option("--dry-run", is_flag=True, help="Только проверить файл")
+def import_vacancies_command(path, hr_username, dry_run):
+    """Импортирует вакансии компании из CSV или JSON одной транзакцией"""
+    db = get_db()
+    company = db.execute(
+        "SELECT c.id, u.id AS user_id FROM companies c JOIN users u ON u.id = c.contact_user_id "
+        "WHERE u.username = ? AND u.role = 'company_hr'",
+        (hr_username,),
+    ).fetchone()
+    if not company:
+        raise click.ClickException(f"Компания HR {hr_username} не найдена")
+    with open(path, "rb") as f:
+        try:
+            rows = vacancy_import.read_rows(f.read(), path)
+            report = run_vacancy_import(db, company["id"], company["user_id"], rows, dry_run=dry_run)
+        except vacancy_import.ImportFormatError as exc:
+            raise click.ClickException(str(exc))
+    for error in report["errors"]:
+        print(f"Строка {error['row']}: {error['error']}")
+    if dry_run:
+        print(f"Проверено строк: {report['total']}, корректных: {report['valid']}, с ошибками: {len(report['errors'])}")
+    else:
+        print(f"Импортировано вакансий: {report['imported']} из {report['total']} за {report['db_seconds']} с")
+
+
+@bp.cli.command("send-notifications")
+def send_notifications_command():
+    """Отправляет накопившиеся уведомления одним проходом (например, из cron)"""
+    transport = make_notification_transport(current_app.config)
+    if transport is None:
+        raise click.ClickException("Транспорт уведомлений отключен (NOTIFY_TRANSPORT)")
+    sent = notifications.dispatch(get_db(), transport)
+    print(f"Отправлено дайджестов: {sent}")
+
+
+def database_files():
+    """Основная и присоединенные БД текущего приложения — все файлы, которые входят в резервную копию"""
+    path, _in_memory = database_location()
+    return [str(path), *(str(attached) for attached in attached_db_paths(path).values())]
+
+
+@bp.cli.command("backup-db")
+@click.option("--dest", default=None, help="Каталог снимков (по умолчанию BACKUP_DIR)")
+@click.option("--keep", default=14, show_default=True, help="Сколько последних снимков хранить")
+@click.option("--no-compress", is_flag=True, help="Не сжимать снимок gzip")
+@click.option("--pages", default=None, type=int, help="Страниц за один шаг копирования (по умолчанию PAGES_PER_STEP из backup.py)")
+def backup_db_command(dest, keep, no_compress, pages):
+    """Снимает горячую резервную копию БД без остановки приложения"""
+    import backup
+
+    try:
+        result = backup.create_snapshot(
+            database_files(), dest or current_app.config["BACKUP_DIR"], compress=not no_compress, keep=keep,
+            pages=pages or backup.PAGES_PER_STEP,
+        )
+    except backup.BackupError as exc:
+        raise click.ClickException(f"Снимок поврежден: {exc}")
+    print(f"Снимок {result['path']} ({len(result['files'])} файлов) за {result['seconds']} с, удалено старых: {len(result['removed'])}")
+
+
+@bp.cli.command("restore-db")
+@click.argument("snapshot", required=False)
+@click.option("--dest", default=None, help="Каталог снимков (по умолчанию BACKUP_DIR)")
+@click.confirmation_option(prompt="Текущие данные будут заменены данными снимка. Продолжить?")
+def restore_db_command(snapshot, dest):
+    """Восстанавливает БД из снимка (по умолчанию — из последнего)"""
+    import backup
+
+    if snapshot is None:
+        available = backup.snapshots(dest or current_app.config["BACKUP_DIR"])
+        if not available:
+            raise click.ClickException("Снимков не найдено")
+        snapshot = available[0]
+    try:
+        restored = backup.restore_snapshot(snapshot, database_files())
+    except backup.BackupError as exc:
+        raise click.ClickException(str(exc))
+    cache_bus.publish(CATALOG_CACHE)
+    print(f"Восстановлено из {snapshot}: {', '.join(restored)}")
+
+
+@bp.cli.command("build-static")
+def build_static_command():
+    """Собирает статику с отпечатками в именах и заранее сжатыми .gz/.br копиями"""
+    manifest = compression.build_static(current_app.static_folder)
+    print(f"Собрано файлов: {len(manifest)} в {os.path.join(current_app.static_folder, compression.BUILD_DIR)}")
+    if compression.brotli is None:
+        print("Пакет brotli не установлен — собраны только .gz версии")
+
+
+@bp.cli.command("storage-gc")
+@click.option("--apply", is_flag=True, help="Действительно удалить (по умолчанию — пробный прогон)")
+@click.option("--batch-size", default=storage_gc.BATCH_SIZE, show_default=True)
+@click.option("--grace-hours", default=24, show_default=True, help="Не трогать объекты моложе, ч")
+@click.option("--verbose", is_flag=True, help="Вывести пути удаляемых файлов")
+def storage_gc_command(apply, batch_size, grace_hours, verbose):
+    """Удаляет резюме без откликов (удаленные кандидатами и старые копии) и файлы загрузок без ссылок"""
+    # Команда может запускаться на БД, которую еще не открывал сервер новой версии
+    init_db()
+    result = storage_gc.collect(
+        get_db(), [current_app.config['UPLOAD_FOLDER'], current_app.config['AVATAR_FOLDER']],
+        dry_run=not apply, batch_size=batch_size, grace_seconds=grace_hours * 3600,
+    )
+    if verbose:
+        for path in result["paths"]:
+            print(path)
+    prefix = "Будет удалено" if result["dry_run"] else "Удалено"
+    print(f"{prefix}: резюме {result['resumes']}, файлов {result['files']} ({result['bytes'] / 1024 / 1024:.1f} МБ)")
+    if result["dry_run"]:
+        print("Пробный прогон: запустите с --apply для удаления")
+
+
+@bp.cli.command("storage-usage")
+@click.option("--top", default=20, show_default=True)
+def storage_usage_command(top):
+    """Показывает место, занятое файлами пользователей и компаний"""
+    init_db()
+    report = storage_gc.usage(get_db())
+    print("Пользователи:")
+    for entry in report["users"][:top]:
+        print(f"  {entry['username']:<30} {entry['files']:>6} файлов {entry['bytes'] / 1024:>12.1f} КБ")
+    print("Компании:")
+    for entry in report["companies"][:top]:
+        print(f"  {entry['name']:<30} {entry['files']:>6} файлов {entry['bytes'] / 1024:>12.1f} КБ")
+
+
+@bp.route("/admin/storage")
+@role_required("admin")
+def admin_storage_usage():
+    return jsonify(storage_gc.usage(get_db()))
+
+
+@bp.cli.command("compact-events")
+@click.option("--keep-months", default=24, show_default=True, help="Сколько месяцев истории хранить")
+def compact_events_command(keep_months):
+    """Сжимает закрытые сегменты журнала событий и удаляет устаревшие"""
+    removed = event_log.apply_retention(keep_months)
+    compacted = event_log.compact()
+    print(f"Удалено сегментов: {len(removed)}, сжато: {len(compacted)}")
+
+
 if __name__ == "__main__":
-    # Инициализация БД и создание дефолтного админа при старте приложения
-    with app.app_context():
-        setup()
-    app.run(debug=True)
\ No newline at end of file
+    # Инициализация БД и запуск сервера (см. python serve.py --help)
+    import serve
+    sys.exit(serve.main())
\ No newline at end of file
@@ -0,0 +1,274 @@
+"""
+ASGI-режим: те же маршруты Flask за асинхронным адаптером.
+
+Event loop ASGI-сервера держит тысячи простаивающих и медленных
+соединений, а потоки нужны только на время реальной работы: код
+представления (включая запросы к SQLite) выполняется в ограниченном пуле
+из ASGI_THREADS потоков, а ожидание медленного клиента при отправке —
+асинхронно.
+
+Вызов WSGI-приложения, чтение всего ответа и close() выполняются в одном
+потоке пула: потоковые ответы (stream_with_context, курсоры SQLite)
+привязаны к потоку, в котором созданы. Поток передает куски в
+asyncio-очередь и опережает отправку не больше чем на STREAM_BUFFER
+кусков, поэтому обычная страница освобождает поток сразу, а большая
+выгрузка медленному клиенту идет в темпе клиента.
+
+Файлы (send_file: резюме, статика) не привязаны к потоку, поэтому adapter
+передает приложению свой wsgi.file_wrapper: поток пула только вызывает
+представление и сразу освобождается, а файл читается по блоку в пуле и
+отправляется асинхронно — медленный клиент не держит поток на время
+скачивания.
+
+Запуск: uvicorn asgi:application --workers 4 (или любой ASGI-сервер).
+"""
+import asyncio
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", 16))
+# Сколько кусков ответа поток может подготовить вперед, пока клиент их не забрал
+STREAM_BUFFER = 8
+
+_DONE = object()
+
+
+class FileWrapper:
+    """wsgi.file_wrapper: файл ответа, который adapter читает сам, без потока на все скачивание"""
+
+    def __init__(self, filelike, block_size=64 * 1024):
+        self.filelike = filelike
+        self.block_size = block_size
+
+    def read_block(self):
+        return self.filelike.read(self.block_size)
+
+    def __iter__(self):
+        # Обычный WSGI-сервер (и middleware) перебирает файл как любой ответ
+        while True:
+            block = self.read_block()
+            if not block:
+                return
+            yield block
+
+    def close(self):
+        close = getattr(self.filelike, "close", None)
+        if close is not None:
+            close()
+
+
+class _Failure:
+    """Исключение из потока пула, переданное через очередь"""
+
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def _run_wsgi(wsgi_app, environ, start_response, emit, slots, cancelled):
+    """Вызывает приложение, читает ответ и закрывает его в одном потоке"""
+    iterable = None
+    try:
+        iterable = wsgi_app(environ, start_response)
+        if isinstance(iterable, FileWrapper):
+            # Файл читает и закрывает асинхронная сторона, поток свободен
+            emit(iterable)
+            iterable = None
+            return
+        for chunk in iterable:
+            if not chunk:
+                continue
+            slots.acquire()
+            if cancelled.is_set():
+                break
+            emit(chunk)
+    except Exception as exc:
+        emit(_Failure(exc))
+    finally:
+        close = getattr(iterable, "close", None)
+        try:
+            if close is not None:
+                close()
+        except Exception as exc:
+            emit(_Failure(exc))
+        emit(_DONE)
+
+
+class ASGIAdapter:
+    """Обертка WSGI-приложения в ASGI с ограниченным пулом потоков"""
+
+    def __init__(self, wsgi_app=None, threads=ASGI_THREADS):
+        self.wsgi_app = wsgi_app
+        self.threads = threads
+        self.executor = None
+        self._startup_lock = asyncio.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.startup()
+            await self.handle_http(scope, receive, send)
+        else:
+            raise RuntimeError(f"Неподдерживаемый тип ASGI scope: {scope['type']}")
+
+    async def startup(self):
+        if self.executor is not None and self.wsgi_app is not None:
+            return
+        async with self._startup_lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="asgi")
+            if self.wsgi_app is None:
+                loop = asyncio.get_running_loop()
+                self.wsgi_app = await loop.run_in_executor(self.executor, _load_app)
+                # Запрос, ожидающий допуска, занимает поток пула
+                self.wsgi_app.config["ADMISSION_CAPACITY"] = self.threads
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.executor is not None:
+                    self.executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def read_body(self, receive, limit):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None
+            body += message.get("body", b"")
+            if limit is not None and len(body) > limit:
+                return False
+            if not message.get("more_body", False):
+                return bytes(body)
+
+    async def handle_http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        body = await self.read_body(receive, self.wsgi_app.config.get("MAX_CONTENT_LENGTH"))
+        if body is None:
+            return
+        if body is False:
+            await send({"type": "http.response.start", "status": 413, "headers": [(b"content-type", b"text/plain")]})
+            await send({"type": "http.response.body", "body": b"Request Entity Too Large"})
+            return
+
+        environ = build_environ(scope, body)
+        response = {}
+        chunks = asyncio.Queue()
+        slots = threading.Semaphore(STREAM_BUFFER)
+        cancelled = threading.Event()
+
+        def emit(item):
+            loop.call_soon_threadsafe(chunks.put_nowait, item)
+
+        def write(data):
+            # write() из WSGI идет в ту же очередь, что и куски тела
+            slots.acquire()
+            emit(data)
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+            return write
+
+        # Представление (и все обращения к SQLite) выполняется в ограниченном пуле
+        worker = loop.run_in_executor(
+            self.executor, _run_wsgi, self.wsgi_app, environ, start_response, emit, slots, cancelled
+        )
+        started = False
+        try:
+            while True:
+                item = await chunks.get()
+                if isinstance(item, _Failure):
+                    raise item.exc
+                if not started:
+                    # start_response вызван до первого куска тела (или вместе с ним)
+                    await send({"type": "http.response.start", "status": response["status"], "headers": response["headers"]})
+                    started = True
+                if item is _DONE:
+                    break
+                if isinstance(item, FileWrapper):
+                    await self.send_file(item, send)
+                    continue
+                # Ожидание медленного клиента не занимает поток пула
+                await send({"type": "http.response.body", "body": item, "more_body": True})
+                slots.release()
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            # Клиент ушел или ответ сломался: поток прекращает чтение и закрывает ответ
+            cancelled.set()
+            slots.release()
+            await worker
+            # Ответ оборвался до отправки файла: закрываем его здесь
+            while not chunks.empty():
+                item = chunks.get_nowait()
+                if isinstance(item, FileWrapper):
+                    item.close()
+
+
+    async def send_file(self, wrapper, send):
+        """Отправляет файл ответа: поток пула занят только чтением очередного блока"""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                block = await loop.run_in_executor(self.executor, wrapper.read_block)
+                if not block:
+                    return
+                await send({"type": "http.response.body", "body": block, "more_body": True})
+        finally:
+            wrapper.close()
+
+
+def build_environ(scope, body):
+    """Собирает WSGI environ из ASGI scope"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    path = scope.get("path", "/")
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+        "wsgi.file_wrapper": FileWrapper,
+        "CONTENT_LENGTH": str(len(body)),
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name == "CONTENT_LENGTH":
+            continue
+        else:
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _load_app():
+    import app as app_module
+
+    return app_module.create_app()
+
+
+application = ASGIAdapter()
@@ -0,0 +1,200 @@
+"""
+Горячее резервное копирование БД через SQLite online backup API.
+
+Копия снимается порциями по PAGES_PER_STEP страниц с паузой STEP_SLEEP
+между ними: блокировка чтения держится только на время одной порции,
+поэтому запросы и запись приложения не простаивают. Каждый снимок
+проверяется PRAGMA integrity_check до сжатия; старые снимки удаляются
+по количеству.
+
+Снимок — каталог backups/YYYYMMDD-HHMMSS-микросекунды с файлами основной и
+присоединенных БД (app.bd, app_applications.bd, ...). Файлы копируются
+по очереди, поэтому согласованы каждый по отдельности, а не на одну точку
+во времени: связи между ними и так поддерживаются триггерами, а не
+внешними ключами. Имя снимка занимается созданием временного каталога с
+флагом исключительности: два снимка, запущенные одновременно, получат
+разные имена и не перезапишут друг друга.
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+
+PAGES_PER_STEP = 256
+STEP_SLEEP = 0.01
+# Запись в источник другим соединением перезапускает копирование с начала;
+# после стольких перезапусков копируем одним шагом (в WAL это не мешает писателям)
+MAX_RESTARTS = 3
+SNAPSHOT_FORMAT = "%Y%m%d-%H%M%S-%f"
+# Снимки прежних версий именовались с точностью до секунды
+LEGACY_SNAPSHOT_FORMAT = "%Y%m%d-%H%M%S"
+
+
+class BackupError(Exception):
+    """Снимок не прошел проверку или не найден"""
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def _restart_guard():
+    state = {"remaining": None, "restarts": 0}
+
+    def progress(_status, remaining, _total):
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] > MAX_RESTARTS:
+                raise _TooManyRestarts()
+        state["remaining"] = remaining
+
+    return progress
+
+
+def _copy(source_path, target_path, pages, sleep, standalone=False):
+    # Источник открываем обычным соединением: read-only не может создать -shm у БД в режиме WAL
+    source = sqlite3.connect(source_path, timeout=15)
+    target = sqlite3.connect(target_path, timeout=15)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=_restart_guard(), sleep=sleep)
+        except _TooManyRestarts:
+            source.backup(target, pages=-1)
+        if standalone:
+            # Копия не должна зависеть от файлов -wal/-shm
+            target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+        source.close()
+
+
+def integrity_check(path):
+    """Возвращает список проблем; пустой список — файл цел"""
+    db = sqlite3.connect(path)
+    try:
+        rows = [row[0] for row in db.execute("PRAGMA integrity_check")]
+    finally:
+        db.close()
+    return [] if rows == ["ok"] else rows
+
+
+def _compress(path):
+    with open(path, "rb") as src, gzip.open(path + ".gz", "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.remove(path)
+    return path + ".gz"
+
+
+def _snapshot_time(name):
+    """Время снимка по имени каталога (с необязательным суффиксом _N) или None"""
+    stamp = name.split("_", 1)[0]
+    for fmt in (SNAPSHOT_FORMAT, LEGACY_SNAPSHOT_FORMAT):
+        try:
+            return datetime.strptime(stamp, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def snapshots(directory):
+    """Каталоги снимков от новых к старым"""
+    if not os.path.isdir(directory):
+        return []
+    names = [name for name in os.listdir(directory) if _snapshot_time(name) is not None]
+    names.sort(key=lambda name: (_snapshot_time(name), name), reverse=True)
+    return [os.path.join(directory, name) for name in names]
+
+
+def _reserve_name(directory):
+    """Занимает уникальное имя снимка: создает его временный каталог, которого еще нет"""
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now().strftime(SNAPSHOT_FORMAT)
+    attempt = 0
+    while True:
+        name = stamp if attempt == 0 else f"{stamp}_{attempt}"
+        partial = os.path.join(directory, f".{name}.partial")
+        if not os.path.exists(os.path.join(directory, name)):
+            try:
+                # mkdir без exist_ok — атомарная проверка: каталог создаст только один процесс
+                os.mkdir(partial)
+                return name, partial
+            except FileExistsError:
+                pass
+        attempt += 1
+
+
+def rotate(directory, keep):
+    """Удаляет снимки сверх keep последних"""
+    removed = snapshots(directory)[keep:]
+    for path in removed:
+        shutil.rmtree(path)
+    return removed
+
+
+def create_snapshot(db_paths, directory, compress=True, keep=None, pages=PAGES_PER_STEP, sleep=STEP_SLEEP):
+    """Снимает копию всех файлов БД в новый каталог снимка и проверяет ее"""
+    started = time.monotonic()
+    # Сначала пишем во временный каталог: недоделанный снимок не попадет в список
+    name, partial = _reserve_name(directory)
+    files = []
+    try:
+        for db_path in db_paths:
+            if not os.path.exists(db_path):
+                continue
+            target = os.path.join(partial, os.path.basename(db_path))
+            _copy(db_path, target, pages, sleep, standalone=True)
+            problems = integrity_check(target)
+            if problems:
+                raise BackupError(f"{os.path.basename(db_path)}: {'; '.join(problems[:5])}")
+            files.append(_compress(target) if compress else target)
+        final = os.path.join(directory, name)
+        if os.path.exists(final):
+            raise BackupError(f"Снимок {final} уже существует")
+        os.rename(partial, final)
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    removed = rotate(directory, keep) if keep else []
+    return {
+        "path": final,
+        "files": [os.path.join(final, os.path.basename(path)) for path in files],
+        "seconds": round(time.monotonic() - started, 3),
+        "removed": removed,
+    }
+
+
+def restore_snapshot(snapshot, db_paths, pages=PAGES_PER_STEP):
+    """Восстанавливает файлы БД из снимка через backup API поверх текущих файлов.
+
+    Каждый файл снимка сначала распаковывается и проверяется; запись в
+    рабочую БД идет под ее блокировкой, так что читатели не увидят
+    частично восстановленный файл. Воркеры лучше остановить заранее.
+    """
+    if not os.path.isdir(snapshot):
+        raise BackupError(f"Снимок {snapshot} не найден")
+    restored = []
+    for db_path in db_paths:
+        name = os.path.basename(db_path)
+        source = os.path.join(snapshot, name)
+        staged = None
+        if not os.path.exists(source) and os.path.exists(source + ".gz"):
+            staged = f"{db_path}.restore"
+            with gzip.open(source + ".gz", "rb") as src, open(staged, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            source = staged
+        if not os.path.exists(source):
+            continue
+        try:
+            problems = integrity_check(source)
+            if problems:
+                raise BackupError(f"{name}: {'; '.join(problems[:5])}")
+            _copy(source, db_path, pages, 0)
+        finally:
+            if staged:
+                os.remove(staged)
+        restored.append(name)
+    if not restored:
+        raise BackupError(f"В снимке {snapshot} нет файлов БД")
+    return restored
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк холодного старта: каждый замер — новый процесс Python.
+
+Фазы: import app (Flask и модули), create_app() (регистрация маршрутов,
+схема БД и пользователи по умолчанию) и первый запрос к приложению.
+По умолчанию сравниваются БД в памяти, новая временная БД и временная БД
+с хешем паролей по умолчанию (scrypt), чтобы было видно, что стоит
+создание пользователей. Рабочая app.bd не используется.
+
+Пример: python bench_startup.py --repeat 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app as app_module
+imported = time.perf_counter()
+config = json.loads(sys.argv[1])
+application = app_module.create_app(config)
+created = time.perf_counter()
+# Без входа каталог отвечает перенаправлением: маршрутизация, сессия, url_for
+application.test_client().get("/catalog")
+served = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "create_app": created - imported,
+    "first_request": served - created,
+    "total": served - started,
+}))
+"""
+
+BASE_CONFIG = {"TESTING": True, "SECRET_KEY": "bench", "NOTIFY_TRANSPORT": None}
+FAST_HASH = "pbkdf2:sha256:1000"
+SCENARIOS = {
+    "memory": {"DATABASE": ":memory:", "PASSWORD_HASH_METHOD": FAST_HASH},
+    "temp": {"DATABASE": "temp", "PASSWORD_HASH_METHOD": FAST_HASH},
+    "temp-scrypt": {"DATABASE": "temp"},
+}
+PHASES = ("import", "create_app", "first_request", "total")
+
+
+def probe(config):
+    root = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, json.dumps({**BASE_CONFIG, **config})],
+        cwd=root, check=True, capture_output=True, text=True,
+    ).stdout
+    # create_app может печатать предупреждения, результат — последняя строка
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного старта приложения")
+    parser.add_argument("--repeat", type=int, default=5, help="Число процессов на сценарий")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), action="append", help="Сценарий (по умолчанию все)")
+    args = parser.parse_args(argv)
+
+    print(f"{'сценарий':<14}" + "".join(f"{phase:>15}" for phase in PHASES) + "   (медиана, мс)")
+    for name in args.scenario or SCENARIOS:
+        runs = [probe(SCENARIOS[name]) for _ in range(args.repeat)]
+        medians = [statistics.median(run[phase] for run in runs) * 1000 for phase in PHASES]
+        print(f"{name:<14}" + "".join(f"{value:>15.1f}" for value in medians))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+Кеш в памяти воркера и шина инвалидации между процессами.
+
+Каждый воркер держит свой кеш (cached()). Код, изменивший данные, после
+коммита вызывает publish(ключ): ключ сразу вытесняется из кеша текущего
+процесса и дописывается в таблицу invalidations маленькой отдельной БД
+(app_cache.bd), чтобы не брать блокировку записи основной. Фоновый поток
+каждого воркера раз в POLL_INTERVAL проверяет PRAGMA data_version и, если
+файл изменился, дочитывает новые записи и вытесняет их ключи — обычно
+через десятки миллисекунд после коммита в другом воркере.
+
+Ключи иерархические: publish("catalog") вытесняет "catalog" и все
+"catalog:...". Значение, загруженное во время инвалидации, в кеш не
+попадает (счетчик поколений), поэтому устаревшие данные не переживают
+событие шины.
+
+Путь к файлу шины может задаваться функцией (configure): он вычисляется
+при каждом обращении, и у каждого файла свой кеш, поэтому приложения
+одного процесса с разными БД не видят данные друг друга.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+POLL_INTERVAL = 0.02
+DEFAULT_TTL = 60
+MAX_ENTRIES = 1000
+# Записи шины старше этого удаляются; новый воркер начинает с конца таблицы
+RETENTION_SECONDS = 3600
+PRUNE_EVERY = 500
+
+_path = None
+_lock = threading.Lock()
+_buses = {}
+_tailer = None
+
+
+class _Bus:
+    """Кеш процесса и соединение с одним файлом шины (поля меняются под _lock)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.generation = 0
+        self.conn = None
+        self.last_seq = None
+        self.data_version = None
+        self.published = 0
+
+    def connection(self):
+        if self.conn is None:
+            self.conn = _connect(self.path)
+            if self.last_seq is None:
+                # Кеш нового процесса пуст: прошлые события ему не нужны
+                self.last_seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM invalidations").fetchone()[0]
+        return self.conn
+
+    def evict(self, key):
+        """Вытесняет ключ и его потомков"""
+        self.generation += 1
+        prefix = key + ":"
+        for cached_key in [k for k in self.entries if k == key or k.startswith(prefix)]:
+            del self.entries[cached_key]
+
+    def poll(self):
+        rows = self.connection().execute(
+            "SELECT seq, key FROM invalidations WHERE seq > ? ORDER BY seq", (self.last_seq,)
+        ).fetchall()
+        for seq, key in rows:
+            self.evict(key)
+            self.last_seq = seq
+        return len(rows)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+        self.conn = None
+
+
+def configure(path):
+    """Задает файл шины: путь или функция, возвращающая путь (None — шина и кеш отключены)"""
+    global _path
+    with _lock:
+        _path = path
+        for bus in _buses.values():
+            bus.close()
+        _buses.clear()
+
+
+def discard(path):
+    """Закрывает шину файла и забывает ее кеш, например перед удалением каталога БД"""
+    with _lock:
+        bus = _buses.pop(str(path), None)
+        if bus is not None:
+            bus.close()
+
+
+def _connect(path):
+    db = sqlite3.connect(str(path), timeout=5, check_same_thread=False, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS invalidations ("
+        "seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, created_at REAL NOT NULL)"
+    )
+    return db
+
+
+def _bus():
+    """Шина текущего файла; None, если шина отключена"""
+    path = _path() if callable(_path) else _path
+    if path is None:
+        return None
+    with _lock:
+        bus = _buses.get(str(path))
+        if bus is None:
+            bus = _buses[str(path)] = _Bus(str(path))
+    return bus
+
+
+def publish(*keys):
+    """Инвалидирует ключи во всех воркерах; вызывать после коммита изменения"""
+    bus = _bus()
+    if bus is None or not keys:
+        return
+    now = time.time()
+    with _lock:
+        for key in keys:
+            bus.evict(key)
+        db = bus.connection()
+        db.executemany("INSERT INTO invalidations (key, created_at) VALUES (?, ?)", [(key, now) for key in keys])
+        bus.published += 1
+        if bus.published % PRUNE_EVERY == 0:
+            db.execute("DELETE FROM invalidations WHERE created_at < ?", (now - RETENTION_SECONDS,))
+    _ensure_tailer()
+
+
+def poll():
+    """Применяет новые события шины; возвращает число вытесненных ключей"""
+    bus = _bus()
+    if bus is None:
+        return 0
+    with _lock:
+        return bus.poll()
+
+
+def cached(key, loader, ttl=DEFAULT_TTL):
+    """Значение из кеша процесса или результат loader(), сохраненный на ttl секунд"""
+    bus = _bus()
+    if bus is None:
+        return loader()
+    _ensure_tailer()
+    now = time.monotonic()
+    with _lock:
+        entry = bus.entries.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        generation = bus.generation
+    value = loader()
+    with _lock:
+        # Пока грузили, пришла инвалидация — значение может быть устаревшим
+        if generation == bus.generation:
+            if len(bus.entries) >= MAX_ENTRIES:
+                bus.entries.clear()
+            bus.entries[key] = (now + ttl, value)
+    return value
+
+
+def _run():
+    while True:
+        time.sleep(POLL_INTERVAL)
+        with _lock:
+            buses = list(_buses.values())
+        for bus in buses:
+            try:
+                with _lock:
+                    if _buses.get(bus.path) is not bus:
+                        # Шину закрыли (discard) после снятия списка
+                        continue
+                    version = bus.connection().execute("PRAGMA data_version").fetchone()[0]
+                    # data_version меняется только после коммитов других соединений
+                    if version != bus.data_version:
+                        bus.data_version = version
+                        bus.poll()
+            except Exception as exc:  # фоновый поток не должен падать
+                print(f"Ошибка шины инвалидации кеша: {exc}")
+                time.sleep(1)
+
+
+def _ensure_tailer():
+    global _tailer
+    if _tailer is not None and _tailer.is_alive():
+        return
+    with _lock:
+        if _tailer is None or not _tailer.is_alive():
+            _tailer = threading.Thread(target=_run, name="cache-bus", daemon=True)
+            _tailer.start()
+
+
+def _reset_after_fork():
+    # Соединение SQLite нельзя использовать после fork, а кеш мастера мог устареть
+    global _lock, _buses, _tailer
+    _lock = threading.Lock()
+    _buses = {}
+    _tailer = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,256 @@
+"""
+Лента изменений (CDC) для интеграций вузов и HR.
+
+Триггеры на vacancies, internship_requests, internship_responses и
+applications пишут в журнал изменений строку с номером seq (AUTOINCREMENT,
+не переиспользуется) и областью видимости: компания и/или вуз. На объект
+хранится одна последняя строка — предыдущая удаляется тем же триггером,
+поэтому журнал не растет быстрее числа объектов, а удаление остается
+записью с op = 'delete'.
+
+Журналов два: change_log в основной БД и application_change_log в
+присоединенной appl — отклик пишет изменение в свой файл и не берет
+блокировку записи основной БД. Внутри файла seq фиксируются в порядке
+коммитов, поэтому курсор клиента — пара номеров "main:appl", а changes()
+сливает оба журнала, не переставляя строки внутри каждого: клиент,
+прочитавший до курсора, не пропустит изменение с меньшим номером.
+Интеграция хранит курсор next, опрашивает changes(since=next) и дочитывает
+актуальные строки через fetch() пачкой по id; отсутствующий в ответе id
+значит, что объект удален или больше не виден клиенту.
+"""
+import heapq
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+MAX_FETCH_IDS = 100
+
+# Сущность -> (таблица, компания, вуз); выражения от строки {row}.
+# Для удаления область берется из прошлой записи, если родителя уже нет
+ENTITIES = {
+    "vacancy": ("vacancies", "{row}.company_id", "NULL"),
+    "internship": ("internship_requests", "NULL", "{row}.university_id"),
+    "internship_response": (
+        "internship_responses", "{row}.company_id",
+        "(SELECT university_id FROM internship_requests WHERE id = {row}.internship_request_id)",
+    ),
+    "application": ("applications", "(SELECT company_id FROM vacancies WHERE id = {row}.vacancy_id)", "NULL"),
+}
+# applications живет в присоединенной БД: постоянный триггер не может писать
+# в main, поэтому для нее триггеры временные и создаются на каждом соединении
+CROSS_DB_ENTITIES = {"application"}
+# Журналы по схемам. Имена разные: в теле TEMP-триггера таблицу нельзя
+# квалифицировать схемой, и она ищется по всем присоединенным БД
+LOGS = {"main": "change_log", "appl": "application_change_log"}
+
+
+def _log(entity):
+    return LOGS["appl"] if entity in CROSS_DB_ENTITIES else LOGS["main"]
+
+
+def _trigger(entity, event, temp=False):
+    table, company, university = ENTITIES[entity]
+    log = _log(entity)
+    row = "OLD" if event == "DELETE" else "NEW"
+    previous = (
+        f"(SELECT {{column}} FROM {log} WHERE entity_type = '{entity}' AND entity_id = {row}.id "
+        f"ORDER BY seq DESC LIMIT 1)"
+    )
+    company = f"COALESCE({company.format(row=row)}, {previous.format(column='company_id')})"
+    university = f"COALESCE({university.format(row=row)}, {previous.format(column='university_id')})"
+    op = "delete" if event == "DELETE" else "upsert"
+    target = f"appl.{table}" if temp else table
+    return (
+        f"CREATE {'TEMP ' if temp else ''}TRIGGER IF NOT EXISTS change_{table}_{event.lower()} "
+        f"AFTER {event} ON {target} BEGIN "
+        f"INSERT INTO {log} (entity_type, entity_id, op, company_id, university_id) "
+        f"VALUES ('{entity}', {row}.id, '{op}', {company}, {university}); "
+        f"DELETE FROM {log} WHERE entity_type = '{entity}' AND entity_id = {row}.id "
+        f"AND seq < (SELECT MAX(seq) FROM {log} WHERE entity_type = '{entity}' AND entity_id = {row}.id); END"
+    )
+
+
+CROSS_DB_TRIGGERS = tuple(
+    _trigger(entity, event, temp=True)
+    for entity in sorted(CROSS_DB_ENTITIES)
+    for event in ("INSERT", "UPDATE", "DELETE")
+)
+
+# Начальное заполнение: объекты, существовавшие до появления ленты
+_BACKFILL = {
+    "vacancy": "SELECT id, company_id, NULL AS university_id FROM vacancies",
+    "internship": "SELECT id, NULL AS company_id, university_id FROM internship_requests",
+    "internship_response": (
+        "SELECT r.id, r.company_id, ir.university_id FROM internship_responses r "
+        "LEFT JOIN internship_requests ir ON ir.id = r.internship_request_id"
+    ),
+    "application": "SELECT a.id, v.company_id, NULL AS university_id FROM applications a LEFT JOIN vacancies v ON v.id = a.vacancy_id",
+}
+
+
+def _create_log(db, schema, table):
+    db.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{table} (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity_type TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            op TEXT NOT NULL CHECK (op IN ('upsert','delete')),
+            company_id INTEGER,
+            university_id INTEGER,
+            changed_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP)
+        )
+        """
+    )
+    db.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_{table}_entity ON {table}(entity_type, entity_id)")
+    db.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_{table}_company ON {table}(company_id, seq)")
+    db.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_{table}_university ON {table}(university_id, seq)")
+
+
+def init_change_feed(db):
+    """Создает журналы изменений, триггеры на таблицах основной БД и заполняет ленту существующими объектами"""
+    for schema, table in LOGS.items():
+        _create_log(db, schema, table)
+    # Миграция: изменения откликов раньше писались в change_log основной БД
+    moved = sorted(CROSS_DB_ENTITIES)
+    placeholders = ",".join("?" * len(moved))
+    db.execute(
+        f"INSERT INTO appl.{LOGS['appl']} (entity_type, entity_id, op, company_id, university_id, changed_at) "
+        f"SELECT entity_type, entity_id, op, company_id, university_id, changed_at FROM main.{LOGS['main']} "
+        f"WHERE entity_type IN ({placeholders}) ORDER BY seq",
+        moved,
+    )
+    db.execute(f"DELETE FROM main.{LOGS['main']} WHERE entity_type IN ({placeholders})", moved)
+    for schema, table in LOGS.items():
+        if db.execute(f"SELECT 1 FROM {schema}.{table} LIMIT 1").fetchone() is not None:
+            continue
+        for entity, sql in _BACKFILL.items():
+            if _log(entity) == table:
+                db.execute(
+                    f"INSERT INTO {schema}.{table} (entity_type, entity_id, op, company_id, university_id) "
+                    f"SELECT '{entity}', id, 'upsert', company_id, university_id FROM ({sql}) ORDER BY id"
+                )
+    for entity in ENTITIES:
+        if entity in CROSS_DB_ENTITIES:
+            continue
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            db.execute(_trigger(entity, event))
+
+
+def _visibility(company_ids, university_id, everything):
+    """Условие на журнал изменений для клиента: администратор видит все, HR — свою компанию
+    и опубликованные стажировки, вуз — свои заявки и отклики на них"""
+    if everything:
+        return "1", []
+    clauses, params = [], []
+    if company_ids:
+        clauses.append(f"company_id IN ({','.join('?' * len(company_ids))})")
+        params.extend(company_ids)
+        # Заявки вузов на модерации и отклоненные HR не видит даже по id
+        clauses.append(
+            "(entity_type = 'internship' AND entity_id IN "
+            "(SELECT id FROM main.internship_requests WHERE status = 'published'))"
+        )
+    if university_id is not None:
+        clauses.append("university_id = ?")
+        params.append(university_id)
+    if not clauses:
+        return "0", []
+    return "(" + " OR ".join(clauses) + ")", params
+
+
+def parse_cursor(value):
+    """Курсор "main:appl" -> {схема: seq}; одно число — курсор до разделения журналов"""
+    parts = str(value or 0).split(":")
+    if len(parts) > len(LOGS):
+        raise ValueError(f"Некорректный курсор: {value}")
+    seqs = [int(part) for part in parts] + [0] * (len(LOGS) - len(parts))
+    if min(seqs) < 0:
+        raise ValueError(f"Некорректный курсор: {value}")
+    return dict(zip(LOGS, seqs))
+
+
+def format_cursor(cursor):
+    return ":".join(str(cursor[schema]) for schema in LOGS)
+
+
+def changes(db, since=0, limit=DEFAULT_LIMIT, company_ids=(), university_id=None, everything=False):
+    """Изменения после курсора since; next — курсор для следующего запроса"""
+    limit = min(max(int(limit), 1), MAX_LIMIT)
+    cursor = parse_cursor(since)
+    condition, params = _visibility(list(company_ids), university_id, everything)
+    sources = [
+        [
+            (row[4], schema, row)
+            for row in db.execute(
+                f"SELECT seq, entity_type, entity_id, op, changed_at FROM {schema}.{table} "
+                f"WHERE seq > ? AND {condition} ORDER BY seq LIMIT ?",
+                [cursor[schema], *params, limit + 1],
+            )
+        ]
+        for schema, table in LOGS.items()
+    ]
+    # merge берет строки каждого журнала строго по порядку seq, поэтому next
+    # по каждой схеме не перескакивает непрочитанные строки
+    rows = list(heapq.merge(*sources, key=lambda item: item[0]))
+    has_more = len(rows) > limit
+    items = []
+    for _changed_at, schema, row in rows[:limit]:
+        cursor[schema] = row[0]
+        items.append(
+            {"seq": row[0], "entity": row[1], "id": row[2], "op": row[3], "changed_at": row[4], "cursor": format_cursor(cursor)}
+        )
+    return {"changes": items, "next": format_cursor(cursor), "has_more": has_more}
+
+
+# Сущность -> (псевдоним таблицы, SELECT актуальных строк, видимость для HR, видимость для вуза)
+_FETCH = {
+    "vacancy": (
+        "v",
+        "SELECT v.id, v.title, v.description, v.requirements, v.salary_range, v.company_id, v.status, v.created_at "
+        "FROM vacancies v",
+        "v.company_id IN ({companies})", None,
+    ),
+    "internship": (
+        "ir",
+        "SELECT ir.id, ir.university_id, ir.specialization, ir.student_count, ir.period_start, ir.period_end, "
+        "ir.skills_required, ir.status, ir.created_at FROM internship_requests ir",
+        "ir.status = 'published'", "ir.university_id = ?",
+    ),
+    "internship_response": (
+        "r",
+        "SELECT r.id, r.internship_request_id, r.company_id, r.message, r.status FROM internship_responses r "
+        "JOIN internship_requests ir ON ir.id = r.internship_request_id",
+        "r.company_id IN ({companies})", "ir.university_id = ?",
+    ),
+    "application": (
+        "a",
+        "SELECT a.id, a.vacancy_id, a.candidate_id, a.resume_id, a.status, a.cover_letter, a.created_at "
+        "FROM applications a JOIN vacancies v ON v.id = a.vacancy_id",
+        "v.company_id IN ({companies})", None,
+    ),
+}
+
+
+def fetch(db, entity, ids, company_ids=(), university_id=None, everything=False):
+    """Актуальные строки объектов по id (не больше MAX_FETCH_IDS), видимые клиенту"""
+    alias, sql, company_clause, university_clause = _FETCH[entity]
+    ids = list(dict.fromkeys(ids))[:MAX_FETCH_IDS]
+    company_ids = list(company_ids)
+    clauses, params = [], []
+    if everything:
+        clauses.append("1")
+    if company_ids:
+        placeholders = ",".join("?" * len(company_ids))
+        clauses.append(company_clause.format(companies=placeholders))
+        if "{companies}" in company_clause:
+            params.extend(company_ids)
+    if university_id is not None and university_clause:
+        clauses.append(university_clause)
+        params.append(university_id)
+    if not ids or not clauses:
+        return []
+    rows = db.execute(
+        f"{sql} WHERE {alias}.id IN ({','.join('?' * len(ids))}) AND ({' OR '.join(clauses)}) ORDER BY {alias}.id",
+        [*ids, *params],
+    ).fetchall()
+    return [dict(row) for row in rows]
@@ -0,0 +1,206 @@
+"""
+Сжатие ответов и предварительно сжатая статика.
+
+Динамические HTML и JSON больше MIN_SIZE сжимаются на лету (brotli, если
+установлен пакет brotli и клиент его принимает, иначе gzip). Потоковые
+ответы (stream_page, выгрузки CSV) сжимаются по мере отдачи: каждый кусок
+проходит через потоковый компрессор со сбросом буфера, поэтому клиент
+получает начало страницы сразу, а тело не собирается в памяти.
+
+Сборка статики (flask build-static) копирует файлы в static/build с хешем
+содержимого в имени и кладет рядом .gz/.br версии, а manifest.json
+связывает исходное имя с собранным. url_for('static', ...) подставляет
+собранный файл, а отдается готовый сжатый вариант без затрат CPU на
+запрос; такие файлы кешируются клиентом на год.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import zlib
+
+from flask import request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен, без него работает только gzip
+    brotli = None
+
+MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE_TYPES = {
+    "text/html", "text/css", "text/plain", "text/csv", "application/json",
+    "application/javascript", "text/javascript", "image/svg+xml",
+}
+BUILD_DIR = "build"
+MANIFEST_NAME = "manifest.json"
+# Загружаемые пользователями файлы не собираем
+SKIP_DIRS = {BUILD_DIR, "avatars"}
+YEAR = 365 * 24 * 3600
+
+_manifest = {}
+
+
+def _encodings():
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negotiate():
+    """Лучшее поддерживаемое кодирование из Accept-Encoding запроса или None"""
+    return request.accept_encodings.best_match(_encodings())
+
+
+def _compress(data, encoding, static=False):
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if static else BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=9 if static else GZIP_LEVEL, mtime=0)
+
+
+def _stream_compressor(encoding):
+    """(сжать кусок, сбросить буфер, завершить поток) для потокового ответа"""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.flush, compressor.finish
+    # wbits=31 — формат gzip (заголовок и CRC), а не голый deflate
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def _compress_chunks(chunks, original, encoding):
+    compress, flush, finish = _stream_compressor(encoding)
+    try:
+        for chunk in chunks:
+            if chunk:
+                # Сброс после каждого куска: клиент сразу может показать уже отданную часть страницы
+                yield compress(chunk) + flush()
+        yield finish()
+    finally:
+        # Закрываем исходный поток (курсоры, контекст запроса), даже если клиент ушел
+        close = getattr(original, "close", None)
+        if close is not None:
+            close()
+
+
+def compress_response(response):
+    """after_request: сжимает подходящие ответы, потоковые — по мере отдачи"""
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_TYPES
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    if response.is_streamed:
+        encoding = negotiate()
+        if encoding is not None:
+            original = response.response
+            response.response = _compress_chunks(response.iter_encoded(), original, encoding)
+            response.headers["Content-Encoding"] = encoding
+            response.headers.pop("Content-Length", None)
+        return response
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        return response
+    encoding = negotiate()
+    if encoding is None:
+        return response
+    response.set_data(_compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def load_manifest(static_folder):
+    global _manifest
+    path = os.path.join(static_folder, BUILD_DIR, MANIFEST_NAME)
+    try:
+        with open(path, encoding="utf-8") as f:
+            _manifest = json.load(f)
+    except FileNotFoundError:
+        _manifest = {}
+    return _manifest
+
+
+def fingerprint_url(endpoint, values):
+    """url_defaults: static/style.css -> static/build/style.<хеш>.css, если статика собрана"""
+    if endpoint == "static" and values.get("filename") in _manifest:
+        values["filename"] = _manifest[values["filename"]]
+
+
+def build_static(static_folder):
+    """Собирает статику: отпечатки в именах, .gz и .br рядом, manifest.json"""
+    build_root = os.path.join(static_folder, BUILD_DIR)
+    staging = build_root + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        rel_root = os.path.relpath(root, static_folder)
+        if rel_root == ".":
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith(BUILD_DIR)]
+        for name in files:
+            source = os.path.join(root, name)
+            rel = os.path.normpath(os.path.join(rel_root, name)).replace(os.sep, "/")
+            with open(source, "rb") as f:
+                data = f.read()
+            stem, ext = os.path.splitext(rel)
+            built = f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+            target = os.path.join(staging, built)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as f:
+                f.write(data)
+            if (mimetypes.guess_type(name)[0] or "") in COMPRESSIBLE_TYPES and len(data) >= MIN_SIZE:
+                for encoding, suffix in (("gzip", ".gz"), ("br", ".br")):
+                    if encoding == "br" and brotli is None:
+                        continue
+                    compressed = _compress(data, encoding, static=True)
+                    if len(compressed) < len(data):
+                        with open(target + suffix, "wb") as f:
+                            f.write(compressed)
+            manifest[rel] = f"{BUILD_DIR}/{built}"
+    with open(os.path.join(staging, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    # Подменяем каталог целиком, чтобы не смешивать старую и новую сборку
+    shutil.rmtree(build_root, ignore_errors=True)
+    os.rename(staging, build_root)
+    load_manifest(static_folder)
+    return manifest
+
+
+def make_static_view(app):
+    """Обработчик static: для собранных файлов отдает готовую .br/.gz версию"""
+    serve_original = app.view_functions["static"]
+
+    def static(filename):
+        if not filename.startswith(BUILD_DIR + "/"):
+            return serve_original(filename=filename)
+        path = safe_join(app.static_folder, filename)
+        suffix = {"br": ".br", "gzip": ".gz"}.get(negotiate())
+        if path is None or suffix is None or not os.path.isfile(path + suffix):
+            response = serve_original(filename=filename)
+        else:
+            mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            response = send_file(path + suffix, mimetype=mimetype, conditional=True)
+            response.headers["Content-Encoding"] = "br" if suffix == ".br" else "gzip"
+        response.vary.add("Accept-Encoding")
+        # Имя меняется вместе с содержимым, поэтому файл можно кешировать навсегда
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = YEAR
+        response.cache_control.immutable = True
+        return response
+
+    return static
+
+
+def init_app(app):
+    load_manifest(app.static_folder)
+    app.url_defaults(fingerprint_url)
+    app.view_functions["static"] = make_static_view(app)
+    app.after_request(compress_response)
@@ -0,0 +1,217 @@
+"""
+Журнал событий: append-only хранилище изменений состояния.
+
+События пишутся в помесячные SQLite-сегменты (events_YYYY_MM.db) вне
+основной БД. Запись буферизуется и сбрасывается пачками фоновым потоком
+раз в FLUSH_INTERVAL секунд или при накоплении BATCH_SIZE событий, поэтому
+emit() не блокирует запрос. Цена — при аварийном завершении процесса
+теряются события последнего неполного интервала.
+Закрытые сегменты сжимаются (VACUUM) один раз: сжатый сегмент помечается
+PRAGMA user_version и при следующих запусках пропускается, пока в него
+не допишут опоздавшие события. Устаревшие сегменты удаляются по сроку
+хранения.
+
+Каталог журнала может задаваться функцией (configure): emit() вычисляет
+его в момент события и сохраняет вместе с ним, поэтому приложения одного
+процесса пишут каждое в свой каталог.
+"""
+import atexit
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 0.5
+SEGMENT_RE = re.compile(r"^events_(\d{4})_(\d{2})\.db$")
+# user_version сегмента после compact(); запись в сегмент сбрасывает его в 0
+COMPACTED = 1
+
+_directory = "events"
+_buffer = []
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_flusher = None
+
+
+def configure(directory):
+    """Задает каталог сегментов журнала: путь или функция, возвращающая путь"""
+    global _directory
+    _directory = directory
+
+
+def _current_directory():
+    return _directory() if callable(_directory) else _directory
+
+
+def _segment_path(directory, month):
+    return os.path.join(directory, f"events_{month}.db")
+
+
+def _open_segment(path):
+    db = sqlite3.connect(path)
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY,
+            ts TEXT NOT NULL,
+            entity_type TEXT NOT NULL,
+            entity_id INTEGER,
+            action TEXT NOT NULL,
+            actor_id INTEGER,
+            data TEXT
+        )
+        """
+    )
+    db.execute("CREATE INDEX IF NOT EXISTS idx_events_entity ON events(entity_type, entity_id, ts)")
+    return db
+
+
+def emit(entity_type, entity_id, action, actor_id=None, **data):
+    """Добавляет событие в буфер; запись на диск выполняет фоновый поток"""
+    ts = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")) if data else None
+    with _lock:
+        _buffer.append((_current_directory(), ts, entity_type, entity_id, action, actor_id, payload))
+        size = len(_buffer)
+    _ensure_flusher()
+    if size >= BATCH_SIZE:
+        _wakeup.set()
+
+
+def flush():
+    """Записывает накопленные события: одна транзакция на сегмент (каталог и месяц)"""
+    global _buffer
+    with _lock:
+        batch, _buffer = _buffer, []
+    if not batch:
+        return 0
+    by_segment = {}
+    for directory, *event in batch:
+        by_segment.setdefault((directory, event[0][:7].replace("-", "_")), []).append(event)
+    for (directory, month), events in by_segment.items():
+        os.makedirs(directory, exist_ok=True)
+        db = _open_segment(_segment_path(directory, month))
+        try:
+            with db:
+                db.executemany(
+                    "INSERT INTO events (ts, entity_type, entity_id, action, actor_id, data) VALUES (?, ?, ?, ?, ?, ?)",
+                    events,
+                )
+                # Событие, сброшенное после смены месяца, снова делает прошлый сегмент несжатым
+                db.execute("PRAGMA user_version = 0")
+        finally:
+            db.close()
+    return len(batch)
+
+
+def _run():
+    while True:
+        _wakeup.wait(FLUSH_INTERVAL)
+        _wakeup.clear()
+        try:
+            flush()
+        except Exception as exc:  # фоновый поток не должен падать
+            print(f"Ошибка записи журнала событий: {exc}")
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_run, name="event-log", daemon=True)
+            _flusher.start()
+
+
+def segments():
+    """Список (месяц, путь) сегментов текущего каталога от новых к старым"""
+    directory = _current_directory()
+    if not os.path.isdir(directory):
+        return []
+    result = []
+    for name in os.listdir(directory):
+        match = SEGMENT_RE.match(name)
+        if match:
+            result.append((f"{match.group(1)}_{match.group(2)}", os.path.join(directory, name)))
+    return sorted(result, reverse=True)
+
+
+def query(entity_type, entity_id=None, limit=100):
+    """История сущности от новых событий к старым, с обходом сегментов до набора limit"""
+    flush()
+    result = []
+    for _month, path in segments():
+        db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        db.row_factory = sqlite3.Row
+        try:
+            rows = db.execute(
+                "SELECT ts, entity_type, entity_id, action, actor_id, data FROM events "
+                "WHERE entity_type = ? AND (? IS NULL OR entity_id = ?) ORDER BY ts DESC, id DESC LIMIT ?",
+                (entity_type, entity_id, entity_id, limit - len(result)),
+            ).fetchall()
+        finally:
+            db.close()
+        for row in rows:
+            event = dict(row)
+            event["data"] = json.loads(event["data"]) if event["data"] else {}
+            result.append(event)
+        if len(result) >= limit:
+            break
+    return result
+
+
+def _current_month():
+    return datetime.now(timezone.utc).strftime("%Y_%m")
+
+
+def compact():
+    """Сжимает закрытые (прошлые) сегменты, которые еще не сжаты; текущий месяц не трогаем"""
+    flush()
+    current = _current_month()
+    compacted = []
+    for month, path in segments():
+        if month >= current:
+            continue
+        db = sqlite3.connect(path)
+        try:
+            if db.execute("PRAGMA user_version").fetchone()[0] == COMPACTED:
+                continue
+            db.execute("PRAGMA optimize")
+            db.execute("VACUUM")
+            db.execute(f"PRAGMA user_version = {COMPACTED}")
+        finally:
+            db.close()
+        compacted.append(month)
+    return compacted
+
+
+def apply_retention(keep_months):
+    """Удаляет сегменты старше keep_months месяцев"""
+    flush()
+    now = datetime.now(timezone.utc)
+    total = now.year * 12 + now.month - 1 - keep_months
+    oldest = f"{total // 12:04d}_{total % 12 + 1:02d}"
+    removed = []
+    for month, path in segments():
+        if month < oldest:
+            os.remove(path)
+            removed.append(month)
+    return removed
+
+
+def _reset_after_fork():
+    global _buffer, _lock, _wakeup, _flusher
+    # Несброшенные события родителя остаются родителю, иначе они запишутся дважды
+    _buffer = []
+    _lock = threading.Lock()
+    _wakeup = threading.Event()
+    _flusher = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(flush)
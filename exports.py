@@ -0,0 +1,205 @@
+"""
+Потоковая выгрузка откликов для HR в CSV, JSONL и XLSX.
+
+Строки читаются из курсора пачками по FETCH_SIZE и сразу отдаются
+клиенту, поэтому память не зависит от числа откликов. XLSX собирается
+на лету: zipfile пишет в несекущийся приемник (с дескрипторами данных),
+ячейки — inline-строки без общей таблицы строк.
+"""
+import csv
+import io
+import json
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+FETCH_SIZE = 500
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+COLUMNS = (
+    ("application_id", "ID отклика"),
+    ("created_at", "Дата отклика"),
+    ("status", "Статус"),
+    ("vacancy_id", "ID вакансии"),
+    ("vacancy_title", "Вакансия"),
+    ("candidate_id", "ID кандидата"),
+    ("username", "Логин"),
+    ("email", "Email"),
+    ("first_name", "Имя"),
+    ("last_name", "Фамилия"),
+    ("phone", "Телефон"),
+    ("resume_title", "Резюме"),
+    ("experience", "Опыт"),
+    ("education", "Образование"),
+    ("cover_letter", "Сопроводительное письмо"),
+)
+
+
+def parse_date(value):
+    """Дата фильтра в формате YYYY-MM-DD; пустое значение — без ограничения"""
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d").date().isoformat()
+
+
+def query_applications(db, company_id, vacancy_id=None, status=None, date_from=None, date_to=None):
+    """Курсор откликов компании; все фильтры выполняются в SQL"""
+    return db.execute(
+        "SELECT a.id AS application_id, a.created_at, a.status, v.id AS vacancy_id, v.title AS vacancy_title, "
+        "u.id AS candidate_id, u.username, u.email, p.first_name, p.last_name, p.phone, "
+        "r.title AS resume_title, r.experience, r.education, a.cover_letter "
+        "FROM applications a "
+        "JOIN vacancies v ON a.vacancy_id = v.id "
+        "JOIN users u ON a.candidate_id = u.id "
+        "LEFT JOIN profiles p ON u.id = p.user_id "
+        "LEFT JOIN resumes r ON a.resume_id = r.id "
+        "WHERE v.company_id = ? AND (? IS NULL OR v.id = ?) AND (? IS NULL OR a.status = ?) "
+        "AND (? IS NULL OR a.created_at >= ?) AND (? IS NULL OR a.created_at < date(?, '+1 day')) "
+        "ORDER BY a.id",
+        (company_id, vacancy_id, vacancy_id, status, status, date_from, date_from, date_to, date_to),
+    )
+
+
+def _batches(cursor):
+    try:
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.close()
+
+
+# Ячейка CSV, начинающаяся с этих символов, выполняется Excel как формула
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _neutralize_formula(value):
+    """Экранирует текст, который табличный редактор принял бы за формулу (CSV injection)"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _values(row, neutralize_formulas=False):
+    values = [row[key] for key, _title in COLUMNS]
+    if neutralize_formulas:
+        # В XLSX ячейки — inline-строки и формулами не бывают, поэтому только для CSV
+        values = [_neutralize_formula(value) for value in values]
+    return values
+
+
+def stream_csv(cursor):
+    # BOM нужен, чтобы Excel открыл кириллицу в UTF-8
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([title for _key, title in COLUMNS])
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+    for rows in _batches(cursor):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(_values(row, neutralize_formulas=True) for row in rows)
+        yield buffer.getvalue().encode("utf-8")
+
+
+def stream_jsonl(cursor):
+    for rows in _batches(cursor):
+        yield "".join(
+            json.dumps({key: row[key] for key, _title in COLUMNS}, ensure_ascii=False) + "\n" for row in rows
+        ).encode("utf-8")
+
+
+class _ChunkSink:
+    """Несекущийся файл для zipfile: записанные байты забирает генератор"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+XLSX_STATIC_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        "</Relationships>"
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Отклики" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        "</Relationships>"
+    ),
+}
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return "<c/>"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"<c><v>{value}</v></c>"
+    # Управляющие символы недопустимы в XML
+    text = "".join(ch for ch in str(value) if ch >= " " or ch in "\t\n\r")
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return "<row>" + "".join(_xlsx_cell(value) for value in values) + "</row>"
+
+
+def stream_xlsx(cursor):
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_STATIC_PARTS.items():
+            archive.writestr(name, content)
+        yield sink.take()
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                (
+                    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                    + _xlsx_row([title for _key, title in COLUMNS])
+                ).encode("utf-8")
+            )
+            for rows in _batches(cursor):
+                sheet.write("".join(_xlsx_row(_values(row)) for row in rows).encode("utf-8"))
+                yield sink.take()
+            sheet.write(b"</sheetData></worksheet>")
+    yield sink.take()
+
+
+WRITERS = {"csv": stream_csv, "jsonl": stream_jsonl, "xlsx": stream_xlsx}
+
+
+def export_filename(prefix, fmt):
+    return f"{prefix}_{date.today().isoformat()}.{fmt}"
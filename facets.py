@@ -0,0 +1,237 @@
+"""
+Фасетный поиск по каталогу вакансий.
+
+Свободный текст salary_range при сохранении вакансии разбирается в
+числовые salary_min/salary_max, город приводится к единому виду. Для
+опубликованных вакансий триггеры поддерживают таблицу facet_counts
+(город, компания, зарплатный диапазон, навык) инкрементально, поэтому
+каталог читает счетчики фасетов несколькими строками, а сами вакансии
+выбирает по индексам (status, city), (status, company_id) и
+(status, верхняя граница зарплаты).
+"""
+import re
+
+CITY = "city"
+COMPANY = "company"
+SALARY = "salary"
+SKILL = "skill"
+
+# Нижние границы зарплатных диапазонов; фасет «от X» — сумма диапазонов >= X
+SALARY_BANDS = (50000, 100000, 150000, 200000, 300000)
+# Верхняя граница предложения: «от 100 000» без максимума считаем равной минимуму
+SALARY_TOP = "COALESCE({row}.salary_max, {row}.salary_min)"
+
+_NUMBER = re.compile(r"(\d[\d\s\u00a0.,]*)\s*(к|k|тыс)?", re.IGNORECASE)
+# Суммы меньше этой — не зарплата (график «5/2», «2 года опыта» и т.п.)
+MIN_SALARY = 1000
+
+
+def _amount(match):
+    digits = re.sub(r"\s", "", match.group(1)).rstrip(".,")
+    if re.fullmatch(r"\d{1,3}([.,]\d{3})+", digits):
+        # Разделители разрядов: 100,000 или 1.500.000
+        digits = re.sub(r"[.,]", "", digits)
+    try:
+        value = float(digits.replace(",", "."))
+    except ValueError:
+        return None
+    if match.group(2):
+        value *= 1000
+    return int(value) if value >= MIN_SALARY else None
+
+
+def parse_salary(text):
+    """'50000-80000 руб.', 'от 100к', 'до 150 тыс.', '120k+' -> (min, max); неразобранное — (None, None)"""
+    amounts = [value for value in (_amount(match) for match in _NUMBER.finditer(text or "")) if value]
+    if not amounts:
+        return None, None
+    if len(amounts) >= 2:
+        low, high = sorted(amounts[:2])
+        return low, high
+    lowered = text.strip().lower()
+    if lowered.startswith("до"):
+        return None, amounts[0]
+    if lowered.startswith("от") or "+" in lowered:
+        return amounts[0], None
+    return amounts[0], amounts[0]
+
+
+def normalize_city(text):
+    """' москва ' -> 'Москва'; пустое значение — None"""
+    text = re.sub(r"\s+", " ", (text or "").strip())
+    if not text:
+        return None
+    return "-".join(part[:1].upper() + part[1:] for part in text.split("-"))
+
+
+def _band_sql(row):
+    top = SALARY_TOP.format(row=row)
+    cases = " ".join(f"WHEN {top} >= {bound} THEN '{bound}'" for bound in reversed(SALARY_BANDS))
+    return f"CASE WHEN {top} IS NULL THEN NULL {cases} ELSE '0' END"
+
+
+def _facet_values(row):
+    return {
+        CITY: f"{row}.city",
+        COMPANY: f"CAST({row}.company_id AS TEXT)",
+        SALARY: _band_sql(row),
+    }
+
+
+def _add(facet, value, when):
+    return (
+        f"INSERT INTO facet_counts (facet, value, count) SELECT '{facet}', {value}, 1 "
+        f"WHERE {when} AND {value} IS NOT NULL "
+        f"ON CONFLICT(facet, value) DO UPDATE SET count = count + 1; "
+    )
+
+
+def _remove(facet, value, when):
+    return f"UPDATE facet_counts SET count = count - 1 WHERE {when} AND facet = '{facet}' AND value = {value}; "
+
+
+def _skills(op, vacancy):
+    if op == "add":
+        return (
+            f"INSERT INTO facet_counts (facet, value, count) "
+            f"SELECT '{SKILL}', CAST(skill_id AS TEXT), 1 FROM vacancy_skills WHERE vacancy_id = {vacancy} "
+            f"ON CONFLICT(facet, value) DO UPDATE SET count = count + 1; "
+        )
+    return (
+        f"UPDATE facet_counts SET count = count - 1 WHERE facet = '{SKILL}' "
+        f"AND value IN (SELECT CAST(skill_id AS TEXT) FROM vacancy_skills WHERE vacancy_id = {vacancy}); "
+    )
+
+
+def _triggers():
+    published_new = "NEW.status = 'published'"
+    published_old = "OLD.status = 'published'"
+    insert = "".join(_add(facet, value, published_new) for facet, value in _facet_values("NEW").items())
+    delete = "".join(_remove(facet, value, published_old) for facet, value in _facet_values("OLD").items())
+    update = delete + insert
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS facets_vacancy_insert AFTER INSERT ON vacancies "
+        f"WHEN {published_new} BEGIN {insert}{_skills('add', 'NEW.id')}END",
+        f"CREATE TRIGGER IF NOT EXISTS facets_vacancy_update AFTER UPDATE OF status, city, company_id, salary_min, salary_max "
+        f"ON vacancies WHEN {published_old} OR {published_new} BEGIN {update}END",
+        # Навыки меняются только вместе с публикацией или снятием
+        f"CREATE TRIGGER IF NOT EXISTS facets_vacancy_publish AFTER UPDATE OF status ON vacancies "
+        f"WHEN {published_new} AND NOT {published_old} BEGIN {_skills('add', 'NEW.id')}END",
+        f"CREATE TRIGGER IF NOT EXISTS facets_vacancy_unpublish AFTER UPDATE OF status ON vacancies "
+        f"WHEN {published_old} AND NOT {published_new} BEGIN {_skills('remove', 'NEW.id')}END",
+        f"CREATE TRIGGER IF NOT EXISTS facets_vacancy_delete AFTER DELETE ON vacancies "
+        f"WHEN {published_old} BEGIN {delete}END",
+        # Каскад внешнего ключа удаляет vacancy_skills раньше AFTER-триггера вакансии, поэтому навыки списываем до удаления
+        f"CREATE TRIGGER IF NOT EXISTS facets_vacancy_delete_skills BEFORE DELETE ON vacancies "
+        f"WHEN {published_old} BEGIN {_skills('remove', 'OLD.id')}END",
+        f"CREATE TRIGGER IF NOT EXISTS facets_skill_insert AFTER INSERT ON vacancy_skills "
+        f"WHEN EXISTS (SELECT 1 FROM vacancies WHERE id = NEW.vacancy_id AND status = 'published') BEGIN "
+        f"{_add(SKILL, 'CAST(NEW.skill_id AS TEXT)', '1')}END",
+        f"CREATE TRIGGER IF NOT EXISTS facets_skill_delete AFTER DELETE ON vacancy_skills "
+        f"WHEN EXISTS (SELECT 1 FROM vacancies WHERE id = OLD.vacancy_id AND status = 'published') BEGIN "
+        f"{_remove(SKILL, 'CAST(OLD.skill_id AS TEXT)', '1')}END",
+    )
+
+
+def init_facets(db):
+    """Создает таблицу счетчиков, индексы каталога и триггеры; вызывается после init_matching"""
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS facet_counts (
+            facet TEXT NOT NULL,
+            value TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (facet, value)
+        )
+        """
+    )
+    db.execute("CREATE INDEX IF NOT EXISTS idx_vacancies_catalog_city ON vacancies(status, city)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_vacancies_catalog_company ON vacancies(status, company_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_vacancies_catalog_salary ON vacancies(status, COALESCE(salary_max, salary_min))")
+    fresh = db.execute("SELECT 1 FROM facet_counts LIMIT 1").fetchone() is None
+    for sql in _triggers():
+        db.execute(sql)
+    backfill_salaries(db)
+    if fresh:
+        rebuild(db)
+
+
+def backfill_salaries(db):
+    """Разбирает salary_range у вакансий, сохраненных до появления числовых колонок"""
+    rows = db.execute(
+        "SELECT id, salary_range FROM vacancies WHERE salary_min IS NULL AND salary_max IS NULL "
+        "AND salary_range IS NOT NULL AND salary_range != ''"
+    ).fetchall()
+    updates = [(*parse_salary(salary_range), vacancy_id) for vacancy_id, salary_range in rows]
+    updates = [row for row in updates if row[0] is not None or row[1] is not None]
+    if updates:
+        db.executemany("UPDATE vacancies SET salary_min = ?, salary_max = ? WHERE id = ?", updates)
+    return len(updates)
+
+
+def rebuild(db):
+    """Полный пересчет счетчиков (первый запуск или проверка расхождений)"""
+    db.execute("DELETE FROM facet_counts")
+    values = _facet_values("v")
+    for facet, value in values.items():
+        db.execute(
+            f"INSERT INTO facet_counts (facet, value, count) SELECT '{facet}', {value}, COUNT(*) FROM vacancies v "
+            f"WHERE v.status = 'published' AND {value} IS NOT NULL GROUP BY 2"
+        )
+    db.execute(
+        f"INSERT INTO facet_counts (facet, value, count) SELECT '{SKILL}', CAST(vs.skill_id AS TEXT), COUNT(*) "
+        f"FROM vacancy_skills vs JOIN vacancies v ON v.id = vs.vacancy_id WHERE v.status = 'published' GROUP BY vs.skill_id"
+    )
+
+
+def counts(db, skill_limit=20):
+    """Счетчики фасетов для каталога: {facet: [(value, label, count), ...]}"""
+    result = {CITY: [], COMPANY: [], SALARY: [], SKILL: []}
+    rows = db.execute(
+        "SELECT f.facet, f.value, f.count, c.name AS company_name, s.name AS skill_name FROM facet_counts f "
+        "LEFT JOIN companies c ON f.facet = 'company' AND c.id = CAST(f.value AS INTEGER) "
+        "LEFT JOIN skills s ON f.facet = 'skill' AND s.id = CAST(f.value AS INTEGER) "
+        "WHERE f.count > 0 ORDER BY f.count DESC, f.value"
+    ).fetchall()
+    bands = {}
+    for facet, value, count, company_name, skill_name in rows:
+        if facet == SALARY:
+            bands[int(value)] = count
+        elif facet == COMPANY:
+            result[COMPANY].append((value, company_name or value, count))
+        elif facet == SKILL:
+            if len(result[SKILL]) < skill_limit:
+                result[SKILL].append((value, skill_name or value, count))
+        elif facet in result:
+            result[facet].append((value, value, count))
+    # «от X» включает все диапазоны выше
+    for bound in SALARY_BANDS:
+        total = sum(count for band, count in bands.items() if band >= bound)
+        if total:
+            result[SALARY].append((str(bound), f"от {bound:,}".replace(",", " "), total))
+    return result
+
+
+def search(db, city=None, company_id=None, salary_from=None, skill_id=None):
+    """Опубликованные вакансии по выбранным фасетам и их общее число одним запросом"""
+    clauses, params = ["v.status = 'published'"], []
+    if city:
+        clauses.append("v.city = ?")
+        params.append(city)
+    if company_id:
+        clauses.append("v.company_id = ?")
+        params.append(company_id)
+    if salary_from:
+        clauses.append(f"{SALARY_TOP.format(row='v')} >= ?")
+        params.append(salary_from)
+    if skill_id:
+        clauses.append("v.id IN (SELECT vacancy_id FROM vacancy_skills WHERE skill_id = ?)")
+        params.append(skill_id)
+    rows = db.execute(
+        "SELECT v.id, v.title, v.description, v.salary_range, v.salary_min, v.salary_max, v.city, "
+        "c.name AS company_name, v.created_at, COUNT(*) OVER () AS total "
+        "FROM vacancies v JOIN companies c ON v.company_id = c.id "
+        f"WHERE {' AND '.join(clauses)} ORDER BY v.created_at DESC",
+        params,
+    ).fetchall()
+    return rows, (rows[0]["total"] if rows else 0)
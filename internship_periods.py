@@ -0,0 +1,139 @@
+"""
+Интервальный индекс периодов стажировок.
+
+period_start/period_end хранятся текстом в формате ISO (YYYY-MM-DD);
+старые значения в других форматах приводятся к нему при миграции.
+Триггеры держат R*Tree-таблицу internship_periods (целые дни от
+1970-01-01) в согласии с internship_requests, поэтому запросы
+«пересекается с июлем–августом» и «начинается в ближайшие 30 дней» идут
+по дереву, а не разбором каждой строки. Если конец периода не указан,
+стажировка занимает один день начала.
+"""
+import calendar
+from datetime import date, datetime, timedelta
+
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%d/%m/%Y", "%d.%m.%y")
+EPOCH = date(1970, 1, 1)
+# День от 1970-01-01 из ISO-даты средствами SQLite (NULL, если дата не разобрана)
+_DAY_SQL = "CAST(julianday({value}) - 2440587.5 AS INTEGER)"
+
+
+def parse_date(text):
+    """'2025-07-01', '01.07.2025', '01/07/2025' -> date; пустое или неразобранное — None"""
+    text = (text or "").strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def day_number(value):
+    return (value - EPOCH).days
+
+
+def _index_row(row):
+    start = _DAY_SQL.format(value=f"{row}.period_start")
+    end = f"COALESCE({_DAY_SQL.format(value=f'{row}.period_end')}, {start})"
+    # R*Tree требует min <= max, поэтому перепутанные даты упорядочиваем
+    return (
+        f"INSERT INTO internship_periods (id, start_day, end_day) "
+        f"SELECT {row}.id, MIN({start}, {end}), MAX({start}, {end}) WHERE {start} IS NOT NULL; "
+    )
+
+
+TRIGGERS = (
+    f"CREATE TRIGGER IF NOT EXISTS periods_internship_insert AFTER INSERT ON internship_requests "
+    f"BEGIN {_index_row('NEW')}END",
+    f"CREATE TRIGGER IF NOT EXISTS periods_internship_update AFTER UPDATE OF period_start, period_end ON internship_requests "
+    f"BEGIN DELETE FROM internship_periods WHERE id = OLD.id; {_index_row('NEW')}END",
+    "CREATE TRIGGER IF NOT EXISTS periods_internship_delete AFTER DELETE ON internship_requests "
+    "BEGIN DELETE FROM internship_periods WHERE id = OLD.id; END",
+)
+
+
+def init_internship_periods(db):
+    """Приводит даты к ISO, создает R*Tree и триггеры; индекс заполняется при первом запуске"""
+    normalize_dates(db)
+    fresh = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'internship_periods'"
+    ).fetchone() is None
+    db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS internship_periods USING rtree_i32(id, start_day, end_day)")
+    for sql in TRIGGERS:
+        db.execute(sql)
+    if fresh:
+        rebuild(db)
+
+
+def normalize_dates(db):
+    """Переписывает разбираемые даты не в ISO-формате; возвращает число исправленных строк"""
+    updates = []
+    for req_id, period_start, period_end in db.execute(
+        "SELECT id, period_start, period_end FROM internship_requests"
+    ).fetchall():
+        values = []
+        for text in (period_start, period_end):
+            parsed = parse_date(text)
+            values.append(parsed.isoformat() if parsed else text)
+        if values != [period_start, period_end]:
+            updates.append((*values, req_id))
+    if updates:
+        db.executemany("UPDATE internship_requests SET period_start = ?, period_end = ? WHERE id = ?", updates)
+    return len(updates)
+
+
+def rebuild(db):
+    db.execute("DELETE FROM internship_periods")
+    db.execute(
+        f"INSERT INTO internship_periods (id, start_day, end_day) SELECT id, MIN(s, e), MAX(s, e) FROM ("
+        f"SELECT id, {_DAY_SQL.format(value='period_start')} AS s, "
+        f"COALESCE({_DAY_SQL.format(value='period_end')}, {_DAY_SQL.format(value='period_start')}) AS e "
+        f"FROM internship_requests) WHERE s IS NOT NULL"
+    )
+
+
+_SELECT = (
+    "SELECT ir.id, ir.specialization, ir.student_count, ir.period_start, ir.period_end, ir.status, "
+    "ir.university_id, u.username AS university_name, p.start_day, p.end_day "
+    "FROM internship_periods p JOIN internship_requests ir ON ir.id = p.id JOIN users u ON u.id = ir.university_id "
+)
+
+
+def _visible(university_id):
+    """Опубликованные стажировки и, для вуза, его собственные заявки"""
+    if university_id is None:
+        return "ir.status = 'published'", []
+    return "(ir.status = 'published' OR ir.university_id = ?)", [university_id]
+
+
+def overlapping(db, date_from, date_to, university_id=None):
+    """Стажировки, период которых пересекается с [date_from, date_to]"""
+    condition, params = _visible(university_id)
+    return db.execute(
+        f"{_SELECT}WHERE p.start_day <= ? AND p.end_day >= ? AND {condition} ORDER BY p.start_day, ir.id",
+        [day_number(date_to), day_number(date_from), *params],
+    ).fetchall()
+
+
+def starting_between(db, date_from, date_to, university_id=None):
+    """Стажировки, которые начинаются в [date_from, date_to]"""
+    condition, params = _visible(university_id)
+    return db.execute(
+        f"{_SELECT}WHERE p.start_day BETWEEN ? AND ? AND {condition} ORDER BY p.start_day, ir.id",
+        [day_number(date_from), day_number(date_to), *params],
+    ).fetchall()
+
+
+def month_grid(db, year, month, university_id=None):
+    """Данные календаря на месяц: дни и строки стажировок с отмеченными днями"""
+    first = date(year, month, 1)
+    last = date(year, month, calendar.monthrange(year, month)[1])
+    days = [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+    first_day, last_day = day_number(first), day_number(last)
+    rows = []
+    for internship in overlapping(db, first, last, university_id):
+        start = max(internship["start_day"], first_day) - first_day
+        end = min(internship["end_day"], last_day) - first_day
+        rows.append({"internship": internship, "active": [start <= index <= end for index in range(len(days))]})
+    return {"first": first, "last": last, "days": days, "rows": rows}
@@ -0,0 +1,340 @@
+"""
+Сопоставление резюме с вакансиями и заявками на стажировки.
+
+Требования вакансии (vacancies.requirements) и навыки стажировки
+(internship_requests.skills_required) приводятся к словарю навыков из
+таблицы skills. Резюме и цели представляются разреженными TF-IDF
+векторами над этим словарем, их косинусная близость сохраняется в
+match_scores при появлении нового отклика, резюме или вакансии, поэтому
+ранжирование кандидатов сводится к чтению по индексу.
+
+В словарь попадают только заявленные навыки: из поля навыков резюме и
+списка навыков стажировки. В свободном тексте требований вакансии ищутся
+только уже известные навыки, иначе фразы вроде «опыт от 3 лет» засоряли
+бы словарь и поиск навыков в резюме.
+
+Веса IDF берутся из снимка (skill_idf), а не считаются заново для каждой
+оценки: иначе оценки, посчитанные в разное время, были бы несравнимы.
+Когда число резюме меняется больше чем на IDF_DRIFT, снимок обновляется
+и все оценки пересчитываются пачками (refresh_idf).
+"""
+import math
+
+import resume_index
+
+VACANCY = "vacancy"
+INTERNSHIP = "internship"
+# Доля изменения числа резюме, после которой снимок IDF пересчитывается
+IDF_DRIFT = 0.1
+IDF_MIN_CHANGE = 20
+RESCORE_BATCH = 500
+
+
+def init_matching(db):
+    """Создает таблицы навыков целей и предрасчитанных оценок"""
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS vacancy_skills (
+            vacancy_id INTEGER NOT NULL,
+            skill_id INTEGER NOT NULL,
+            PRIMARY KEY (vacancy_id, skill_id),
+            FOREIGN KEY (vacancy_id) REFERENCES vacancies(id) ON DELETE CASCADE,
+            FOREIGN KEY (skill_id) REFERENCES skills(id) ON DELETE CASCADE
+        )
+        """
+    )
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS internship_skills (
+            internship_request_id INTEGER NOT NULL,
+            skill_id INTEGER NOT NULL,
+            PRIMARY KEY (internship_request_id, skill_id),
+            FOREIGN KEY (internship_request_id) REFERENCES internship_requests(id) ON DELETE CASCADE,
+            FOREIGN KEY (skill_id) REFERENCES skills(id) ON DELETE CASCADE
+        )
+        """
+    )
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS match_scores (
+            target_type TEXT NOT NULL CHECK (target_type IN ('vacancy','internship')),
+            target_id INTEGER NOT NULL,
+            resume_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            computed_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP),
+            PRIMARY KEY (target_type, target_id, resume_id),
+            FOREIGN KEY (resume_id) REFERENCES resumes(id) ON DELETE CASCADE
+        )
+        """
+    )
+    # Снимок весов IDF и размер корпуса резюме, по которому он посчитан
+    db.execute("CREATE TABLE IF NOT EXISTS skill_idf (skill_id INTEGER PRIMARY KEY, weight REAL NOT NULL)")
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS idf_snapshot (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            resume_count INTEGER NOT NULL,
+            computed_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP)
+        )
+        """
+    )
+    db.execute("CREATE INDEX IF NOT EXISTS idx_vacancy_skills_skill ON vacancy_skills(skill_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_internship_skills_skill ON internship_skills(skill_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_match_scores_rank ON match_scores(target_type, target_id, score DESC)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_match_scores_resume ON match_scores(resume_id)")
+
+
+def skill_vocabulary(db):
+    return {row[0] for row in db.execute("SELECT name FROM skills")}
+
+
+def extract_terms(db, text, title="", vocabulary=None, declared=False):
+    """Выделяет навыки из текста: известные термины, а для заявленного списка
+    навыков (declared) еще и короткие перечисленные фразы"""
+    vocabulary = vocabulary if vocabulary is not None else skill_vocabulary(db)
+    terms = resume_index.find_known_skills(f"{title}\n{text}", vocabulary)
+    if declared:
+        terms.update(s for s in resume_index.parse_skills(text) if len(s.split()) <= resume_index.MAX_SKILL_WORDS)
+    return sorted(terms)
+
+
+def _known_skill_ids(db, names):
+    """id навыков, которые уже есть в словаре; новые не создаются"""
+    if not names:
+        return {}
+    placeholders = ",".join("?" * len(names))
+    rows = db.execute(f"SELECT id, name FROM skills WHERE name IN ({placeholders})", list(names)).fetchall()
+    return {row[1]: row[0] for row in rows}
+
+
+def compute_idf(db):
+    """Считает idf по навыкам с учетом частоты навыка среди резюме: (число резюме, веса)"""
+    total = db.execute("SELECT COUNT(*) FROM resumes").fetchone()[0]
+    weights = {}
+    for skill_id, df in db.execute("SELECT skill_id, COUNT(*) FROM resume_skills GROUP BY skill_id"):
+        weights[skill_id] = math.log((total + 1) / (df + 1)) + 1.0
+    return total, weights
+
+
+def store_idf_snapshot(db):
+    """Сохраняет текущие веса IDF как снимок; коммит выполняет вызывающий код"""
+    total, weights = compute_idf(db)
+    db.execute("DELETE FROM skill_idf")
+    db.executemany("INSERT INTO skill_idf (skill_id, weight) VALUES (?, ?)", weights.items())
+    db.execute(
+        "INSERT OR REPLACE INTO idf_snapshot (id, resume_count, computed_at) VALUES (1, ?, CURRENT_TIMESTAMP)", (total,)
+    )
+    return weights
+
+
+def idf_weights(db):
+    """Возвращает веса IDF из снимка (при первом обращении снимок создается)"""
+    if db.execute("SELECT 1 FROM idf_snapshot").fetchone() is None:
+        return store_idf_snapshot(db)
+    return dict(db.execute("SELECT skill_id, weight FROM skill_idf").fetchall())
+
+
+def idf_drifted(db):
+    """Число резюме заметно изменилось со времени снимка IDF"""
+    row = db.execute("SELECT resume_count FROM idf_snapshot").fetchone()
+    if row is None:
+        return True
+    total = db.execute("SELECT COUNT(*) FROM resumes").fetchone()[0]
+    return abs(total - row[0]) > max(IDF_MIN_CHANGE, row[0] * IDF_DRIFT)
+
+
+def rescore_all(db, idf=None, batch_size=RESCORE_BATCH):
+    """Пересчитывает все сохраненные оценки по одному снимку IDF, коммит на каждые batch_size целей"""
+    idf = idf if idf is not None else idf_weights(db)
+    targets = db.execute("SELECT DISTINCT target_type, target_id FROM match_scores").fetchall()
+    for start in range(0, len(targets), batch_size):
+        for target_type, target_id in targets[start:start + batch_size]:
+            resume_ids = [
+                row[0] for row in db.execute(
+                    "SELECT resume_id FROM match_scores WHERE target_type = ? AND target_id = ?", (target_type, target_id)
+                )
+            ]
+            score_target(db, target_type, target_id, resume_ids, idf)
+        db.commit()
+    return len(targets)
+
+
+def refresh_idf(db, force=False):
+    """Обновляет снимок IDF и пересчитывает оценки, если корпус резюме заметно изменился.
+
+    Возвращает True, если снимок обновлен: тогда вызывающий код пересчитывает
+    и другие данные, посчитанные по весам IDF (рекомендации).
+    """
+    if not force and not idf_drifted(db):
+        return False
+    idf = store_idf_snapshot(db)
+    db.commit()
+    rescore_all(db, idf)
+    return True
+
+
+def vectorize(skill_ids, idf):
+    """Строит нормированный разреженный TF-IDF вектор {skill_id: вес}"""
+    vector = {skill_id: idf.get(skill_id, 1.0) for skill_id in skill_ids}
+    norm = math.sqrt(sum(w * w for w in vector.values()))
+    if not norm:
+        return {}
+    return {skill_id: w / norm for skill_id, w in vector.items()}
+
+
+def cosine(a, b):
+    """Скалярное произведение нормированных разреженных векторов"""
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b.get(k, 0.0) for k, w in a.items())
+
+
+def _target_skills(db, target_type, target_id):
+    if target_type == VACANCY:
+        sql = "SELECT skill_id FROM vacancy_skills WHERE vacancy_id = ?"
+    else:
+        sql = "SELECT skill_id FROM internship_skills WHERE internship_request_id = ?"
+    return [row[0] for row in db.execute(sql, (target_id,))]
+
+
+def _resume_skill_sets(db, resume_ids):
+    """Загружает навыки нескольких резюме одним запросом"""
+    result = {resume_id: [] for resume_id in resume_ids}
+    if not resume_ids:
+        return result
+    placeholders = ",".join("?" * len(resume_ids))
+    for resume_id, skill_id in db.execute(
+        f"SELECT resume_id, skill_id FROM resume_skills WHERE resume_id IN ({placeholders})",
+        list(resume_ids),
+    ):
+        result[resume_id].append(skill_id)
+    return result
+
+
+def score_target(db, target_type, target_id, resume_ids, idf=None):
+    """Пересчитывает оценки набора резюме для одной вакансии или стажировки"""
+    resume_ids = list(resume_ids)
+    if not resume_ids:
+        return
+    idf = idf if idf is not None else idf_weights(db)
+    target = vectorize(_target_skills(db, target_type, target_id), idf)
+    rows = [
+        (target_type, target_id, resume_id, cosine(target, vectorize(skills, idf)))
+        for resume_id, skills in _resume_skill_sets(db, resume_ids).items()
+    ]
+    db.executemany(
+        "INSERT OR REPLACE INTO match_scores (target_type, target_id, resume_id, score) VALUES (?, ?, ?, ?)",
+        rows,
+    )
+
+
+def _store_target_terms(db, target_type, target_id, text, title):
+    if target_type == VACANCY:
+        # Требования вакансии — свободный текст: только навыки, уже известные словарю
+        ids = _known_skill_ids(db, extract_terms(db, text or "", title or ""))
+        db.execute("DELETE FROM vacancy_skills WHERE vacancy_id = ?", (target_id,))
+        sql = "INSERT OR IGNORE INTO vacancy_skills (vacancy_id, skill_id) VALUES (?, ?)"
+    else:
+        # Навыки стажировки заявлены списком и пополняют словарь
+        ids = resume_index.skill_ids(db, extract_terms(db, text or "", title or "", declared=True))
+        db.execute("DELETE FROM internship_skills WHERE internship_request_id = ?", (target_id,))
+        sql = "INSERT OR IGNORE INTO internship_skills (internship_request_id, skill_id) VALUES (?, ?)"
+    db.executemany(sql, [(target_id, skill_id) for skill_id in ids.values()])
+    return list(ids.values())
+
+
+def index_vacancy(db, vacancy_id):
+    """Разбирает требования вакансии и пересчитывает оценки ее откликов"""
+    row = db.execute("SELECT title, requirements FROM vacancies WHERE id = ?", (vacancy_id,)).fetchone()
+    if row is None:
+        return
+    _store_target_terms(db, VACANCY, vacancy_id, row[1], row[0])
+    resume_ids = [
+        r[0] for r in db.execute(
+            "SELECT DISTINCT resume_id FROM applications WHERE vacancy_id = ? AND resume_id IS NOT NULL",
+            (vacancy_id,),
+        )
+    ]
+    score_target(db, VACANCY, vacancy_id, resume_ids)
+    db.commit()
+
+
+def index_new_vacancies(db, vacancy_ids):
+    """Разбирает навыки пачки только что созданных вакансий (откликов у них еще нет) одним коммитом"""
+    if not vacancy_ids:
+        return
+    vocabulary = skill_vocabulary(db)
+    pairs = []
+    for vacancy_id, title, requirements in db.execute(
+        f"SELECT id, title, requirements FROM vacancies WHERE id IN ({','.join('?' * len(vacancy_ids))})",
+        list(vacancy_ids),
+    ).fetchall():
+        terms = extract_terms(db, requirements or "", title or "", vocabulary)
+        pairs.extend((vacancy_id, skill_id) for skill_id in _known_skill_ids(db, terms).values())
+    db.executemany("INSERT OR IGNORE INTO vacancy_skills (vacancy_id, skill_id) VALUES (?, ?)", pairs)
+    db.commit()
+
+
+def index_internship(db, req_id):
+    """Разбирает навыки стажировки и оценивает публичные резюме с общими навыками"""
+    row = db.execute("SELECT specialization, skills_required FROM internship_requests WHERE id = ?", (req_id,)).fetchone()
+    if row is None:
+        return
+    skill_ids = _store_target_terms(db, INTERNSHIP, req_id, row[1], row[0])
+    db.execute("DELETE FROM match_scores WHERE target_type = ? AND target_id = ?", (INTERNSHIP, req_id))
+    if skill_ids:
+        # Кандидаты берутся из обратного индекса: только резюме хотя бы с одним общим навыком
+        placeholders = ",".join("?" * len(skill_ids))
+        resume_ids = [
+            r[0] for r in db.execute(
+                f"SELECT DISTINCT rs.resume_id FROM resume_skills rs JOIN resumes r ON r.id = rs.resume_id "
+                f"WHERE r.is_public = 1 AND rs.skill_id IN ({placeholders})",
+                skill_ids,
+            )
+        ]
+        score_target(db, INTERNSHIP, req_id, resume_ids)
+    db.commit()
+
+
+def score_resume(db, resume_id):
+    """Оценивает резюме по вакансиям его откликов и по стажировкам с общими навыками"""
+    idf = idf_weights(db)
+    for (vacancy_id,) in db.execute(
+        "SELECT DISTINCT vacancy_id FROM applications WHERE resume_id = ?", (resume_id,)
+    ).fetchall():
+        score_target(db, VACANCY, vacancy_id, [resume_id], idf)
+    is_public = db.execute("SELECT is_public FROM resumes WHERE id = ?", (resume_id,)).fetchone()
+    if is_public and is_public[0]:
+        for (req_id,) in db.execute(
+            "SELECT DISTINCT isk.internship_request_id FROM internship_skills isk "
+            "JOIN resume_skills rs ON rs.skill_id = isk.skill_id WHERE rs.resume_id = ?",
+            (resume_id,),
+        ).fetchall():
+            score_target(db, INTERNSHIP, req_id, [resume_id], idf)
+    db.commit()
+
+
+def vacancy_shortlist(db, vacancy_id, limit=50):
+    """Ранжированный список откликов на вакансию по предрасчитанной оценке"""
+    # Обход идет по индексу idx_match_scores_rank; отклики без посчитанной оценки появятся после индексации
+    return db.execute(
+        "SELECT a.id AS application_id, a.status, a.created_at, u.username AS candidate_name, "
+        "r.id AS resume_id, r.title AS resume_title, ms.score "
+        "FROM match_scores ms "
+        "JOIN applications a ON a.vacancy_id = ms.target_id AND a.resume_id = ms.resume_id "
+        "JOIN users u ON u.id = a.candidate_id "
+        "JOIN resumes r ON r.id = ms.resume_id "
+        "WHERE ms.target_type = 'vacancy' AND ms.target_id = ? ORDER BY ms.score DESC LIMIT ?",
+        (vacancy_id, limit),
+    ).fetchall()
+
+
+def internship_shortlist(db, req_id, limit=50):
+    """Ранжированный список публичных резюме для стажировки"""
+    return db.execute(
+        "SELECT r.id AS resume_id, r.title AS resume_title, r.education, u.username AS candidate_name, ms.score "
+        "FROM match_scores ms JOIN resumes r ON r.id = ms.resume_id JOIN users u ON u.id = r.candidate_id "
+        "WHERE ms.target_type = 'internship' AND ms.target_id = ? AND ms.score > 0 "
+        "ORDER BY ms.score DESC LIMIT ?",
+        (req_id, limit),
+    ).fetchall()
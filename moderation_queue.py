@@ -0,0 +1,116 @@
+"""
+Очередь модерации с захватом элементов по аренде (lease).
+
+Модератор забирает пачку элементов одним UPDATE ... RETURNING, аренда
+истекает автоматически, и элемент снова становится доступным. Порядок
+выдачи — по очереди между компаниями/университетами (group_key), внутри
+группы — от старых к новым, чтобы крупный работодатель не вытеснял
+остальных.
+"""
+
+LEASE_SECONDS = 600
+CLAIM_BATCH = 10
+
+
+def init_moderation_queue(db, schema="main"):
+    """Создает таблицу очереди в схеме schema и заполняет ее элементами, ожидающими модерации"""
+    db.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.moderation_queue (
+            item_type TEXT NOT NULL CHECK (item_type IN ('vacancy','internship')),
+            item_id INTEGER NOT NULL,
+            group_key TEXT NOT NULL,
+            enqueued_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP),
+            claimed_by INTEGER,
+            lease_expires_at TEXT,
+            PRIMARY KEY (item_type, item_id)
+        )
+        """
+    )
+    db.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_moderation_queue_claim ON moderation_queue(claimed_by, lease_expires_at)")
+    db.execute(
+        f"INSERT OR IGNORE INTO {schema}.moderation_queue (item_type, item_id, group_key, enqueued_at) "
+        "SELECT 'vacancy', id, 'company:' || company_id, created_at FROM vacancies WHERE status = 'on_moderation'"
+    )
+    # В старых БД у internship_requests нет created_at (миграция в init_db не проходит)
+    db.execute(
+        f"INSERT OR IGNORE INTO {schema}.moderation_queue (item_type, item_id, group_key) "
+        "SELECT 'internship', id, 'university:' || university_id FROM internship_requests WHERE status = 'on_moderation'"
+    )
+
+
+def enqueue(db, item_type, item_id, group_key):
+    """Ставит элемент в очередь; коммит выполняет вызывающий код в своей транзакции"""
+    db.execute(
+        "INSERT OR IGNORE INTO moderation_queue (item_type, item_id, group_key) VALUES (?, ?, ?)",
+        (item_type, item_id, group_key),
+    )
+
+
+def claim(db, moderator_id, limit=CLAIM_BATCH, lease_seconds=LEASE_SECONDS):
+    """Захватывает пачку свободных элементов (и продлевает свои) одной транзакцией"""
+    rows = db.execute(
+        "UPDATE moderation_queue SET claimed_by = ?, lease_expires_at = datetime('now', ?) "
+        "WHERE (item_type, item_id) IN ("
+        "  SELECT item_type, item_id FROM ("
+        "    SELECT item_type, item_id, enqueued_at, "
+        "           ROW_NUMBER() OVER (PARTITION BY group_key ORDER BY enqueued_at) AS group_rank "
+        "    FROM moderation_queue "
+        "    WHERE claimed_by IS NULL OR claimed_by = ? OR lease_expires_at <= datetime('now')"
+        "  ) ORDER BY group_rank, enqueued_at LIMIT ?"
+        ") RETURNING item_type, item_id, lease_expires_at",
+        (moderator_id, f"+{int(lease_seconds)} seconds", moderator_id, limit),
+    ).fetchall()
+    db.commit()
+    return rows
+
+
+def release(db, moderator_id):
+    """Возвращает все элементы модератора в общую очередь"""
+    db.execute(
+        "UPDATE moderation_queue SET claimed_by = NULL, lease_expires_at = NULL WHERE claimed_by = ?",
+        (moderator_id,),
+    )
+    db.commit()
+
+
+def locked_by_other(db, item_type, item_id, moderator_id):
+    """Проверяет, держит ли элемент другой модератор с действующей арендой"""
+    row = db.execute(
+        "SELECT 1 FROM moderation_queue WHERE item_type = ? AND item_id = ? "
+        "AND claimed_by IS NOT NULL AND claimed_by != ? AND lease_expires_at > datetime('now')",
+        (item_type, item_id, moderator_id),
+    ).fetchone()
+    return row is not None
+
+
+def complete(db, item_type, item_id):
+    """Убирает рассмотренный элемент из очереди; коммит выполняет вызывающий код"""
+    db.execute("DELETE FROM moderation_queue WHERE item_type = ? AND item_id = ?", (item_type, item_id))
+
+
+def my_claims(db, moderator_id):
+    """Элементы, захваченные модератором и с неистекшей арендой"""
+    return db.execute(
+        "SELECT q.item_type, q.item_id, q.lease_expires_at, q.enqueued_at, "
+        "COALESCE(v.title, ir.specialization) AS title, COALESCE(c.name, u.username) AS owner_name "
+        "FROM moderation_queue q "
+        "LEFT JOIN vacancies v ON q.item_type = 'vacancy' AND v.id = q.item_id "
+        "LEFT JOIN companies c ON c.id = v.company_id "
+        "LEFT JOIN internship_requests ir ON q.item_type = 'internship' AND ir.id = q.item_id "
+        "LEFT JOIN users u ON u.id = ir.university_id "
+        "WHERE q.claimed_by = ? AND q.lease_expires_at > datetime('now') "
+        "ORDER BY q.enqueued_at",
+        (moderator_id,),
+    ).fetchall()
+
+
+def stats(db):
+    """Сводка по очереди: всего, свободно, в работе"""
+    row = db.execute(
+        "SELECT COUNT(*), "
+        "SUM(CASE WHEN claimed_by IS NULL OR lease_expires_at <= datetime('now') THEN 1 ELSE 0 END) "
+        "FROM moderation_queue"
+    ).fetchone()
+    total, free = row[0], row[1] or 0
+    return {"total": total, "free": free, "claimed": total - free}
@@ -0,0 +1,320 @@
+"""
+Уведомления через outbox: запись в той же транзакции, доставка в фоне.
+
+notify() только добавляет строку в notification_outbox — коммит делает
+вызывающий код вместе с изменением, которое вызвало уведомление, поэтому
+запрос пользователя не ждет почтового сервера. Фоновый диспетчер раз в
+INTERVAL секунд захватывает пачку записей по аренде (как очередь
+модерации, поэтому несколько воркеров не отправят одно и то же дважды),
+собирает их в дайджест на получателя и отправляет через транспорт. Перед
+каждой отправкой аренда дайджеста продлевается: медленный SMTP не даст ей
+истечь посреди пачки, а записи, которые уже забрал другой воркер, не
+отправляются.
+
+Одинаковые неотправленные уведомления (recipient_id, dedup_key)
+схлопываются, а получателю уходит не больше MAX_DIGESTS_PER_HOUR писем в
+час — остальное копится до следующего дайджеста.
+
+Outbox есть в основной БД и в присоединенной appl (application_outbox):
+уведомление об отклике пишется в файл откликов и не берет блокировку
+записи основной БД. Диспетчер захватывает записи из обоих и собирает их
+в общий дайджест.
+"""
+import os
+import threading
+import time
+import uuid
+from email.message import EmailMessage
+
+BATCH_SIZE = 500
+INTERVAL = 60
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 5
+MAX_DIGESTS_PER_HOUR = 4
+MAX_DIGEST_ITEMS = 50
+# Outbox по схемам; имена разные, чтобы TEMP-триггер каскада находил таблицу без схемы
+OUTBOXES = {"main": "notification_outbox", "appl": "application_outbox"}
+
+
+class MaildirTransport:
+    """Складывает письма в локальный Maildir (разработка и тесты)"""
+
+    def __init__(self, path="mail", sender="noreply@localhost"):
+        self.path = path
+        self.sender = sender
+
+    def send(self, message):
+        # Почтовые модули импортируются при первой отправке, а не при старте воркера
+        import mailbox
+
+        message["From"] = self.sender
+        mailbox.Maildir(self.path, create=True).add(message)
+
+
+class SMTPTransport:
+    """Отправка через SMTP-сервер; одно соединение на пачку дайджестов"""
+
+    def __init__(self, host="localhost", port=25, username=None, password=None, sender="noreply@localhost", starttls=False):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.sender = sender
+        self.starttls = starttls
+        self._smtp = None
+
+    def send(self, message):
+        import smtplib
+
+        message["From"] = self.sender
+        if self._smtp is None:
+            self._smtp = smtplib.SMTP(self.host, self.port, timeout=30)
+            if self.starttls:
+                self._smtp.starttls()
+            if self.username:
+                self._smtp.login(self.username, self.password)
+        try:
+            self._smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            self._smtp = None
+            raise
+
+    def close(self):
+        if self._smtp is not None:
+            import smtplib
+
+            try:
+                self._smtp.quit()
+            except smtplib.SMTPException:
+                pass
+            self._smtp = None
+
+
+# Диспетчер на каждую БД процесса: ключ -> поток
+_dispatchers = {}
+_dispatchers_lock = threading.Lock()
+
+
+def init_notifications(db):
+    """Создает таблицы outbox и истории отправленных дайджестов"""
+    for schema, table in OUTBOXES.items():
+        # Внешние ключи не работают между файлами: в appl каскад по users делает TEMP-триггер
+        foreign_key = ",\n            FOREIGN KEY (recipient_id) REFERENCES users(id) ON DELETE CASCADE" if schema == "main" else ""
+        db.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {schema}.{table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                recipient_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                body TEXT NOT NULL,
+                dedup_key TEXT,
+                created_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP),
+                lease_token TEXT,
+                lease_expires_at TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                sent_at TEXT{foreign_key}
+            )
+            """
+        )
+        db.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_{table}_pending ON {table}(sent_at, lease_expires_at)")
+        # Дедупликация только среди неотправленных: повторное событие позже снова уведомит
+        db.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {schema}.idx_{table}_dedup "
+            f"ON {table}(recipient_id, dedup_key) WHERE sent_at IS NULL AND dedup_key IS NOT NULL"
+        )
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS notification_digests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipient_id INTEGER NOT NULL,
+            item_count INTEGER NOT NULL,
+            sent_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP)
+        )
+        """
+    )
+    db.execute("CREATE INDEX IF NOT EXISTS idx_notification_digests_recipient ON notification_digests(recipient_id, sent_at)")
+
+
+def notify(db, recipient_id, kind, subject, body, dedup_key=None, schema="main"):
+    """Добавляет уведомление в outbox схемы schema; коммит выполняет вызывающий код в своей транзакции"""
+    if recipient_id is None:
+        return
+    db.execute(
+        f"INSERT OR IGNORE INTO {schema}.{OUTBOXES[schema]} (recipient_id, kind, subject, body, dedup_key) "
+        f"VALUES (?, ?, ?, ?, ?)",
+        (recipient_id, kind, subject, body, dedup_key),
+    )
+
+
+def claim(db, limit=BATCH_SIZE, lease_seconds=LEASE_SECONDS):
+    """Захватывает пачку неотправленных записей (до limit из каждого outbox);
+    возвращает (токен аренды, строки), последнее поле строки — схема outbox"""
+    token = uuid.uuid4().hex
+    rows = []
+    for schema, table in OUTBOXES.items():
+        rows += db.execute(
+            f"UPDATE {schema}.{table} SET lease_token = ?, lease_expires_at = datetime('now', ?) "
+            f"WHERE id IN (SELECT id FROM {schema}.{table} WHERE sent_at IS NULL "
+            f"AND (lease_expires_at IS NULL OR lease_expires_at <= datetime('now')) "
+            # Получатели с исчерпанным лимитом писем не занимают пачку, иначе их записи
+            # захватывались бы каждый проход и вытесняли уведомления остальных
+            f"AND recipient_id NOT IN (SELECT recipient_id FROM main.notification_digests "
+            f"WHERE sent_at > datetime('now', '-1 hour') GROUP BY recipient_id HAVING COUNT(*) >= ?) "
+            f"ORDER BY id LIMIT ?) "
+            f"RETURNING id, recipient_id, kind, subject, body, attempts, created_at, '{schema}'",
+            (token, f"+{int(lease_seconds)} seconds", MAX_DIGESTS_PER_HOUR, limit),
+        ).fetchall()
+    db.commit()
+    return token, sorted(rows, key=lambda row: (row[6], row[7], row[0]))
+
+
+def build_digest(email, items):
+    """Одно письмо со всеми уведомлениями получателя"""
+    message = EmailMessage()
+    message["To"] = email
+    if len(items) == 1:
+        message["Subject"] = items[0][3]
+    else:
+        message["Subject"] = f"HR-платформа: новых уведомлений — {len(items)}"
+    parts = [f"{row[3]}\n{row[4]}" for row in items]
+    message.set_content("\n\n".join(parts) + "\n")
+    return message
+
+
+def _renew(db, items, token, lease_seconds=LEASE_SECONDS):
+    """Продлевает аренду записей дайджеста; возвращает те, что еще за нами"""
+    held = []
+    for schema, table in OUTBOXES.items():
+        ids = [row[0] for row in items if row[7] == schema]
+        if ids:
+            held += [
+                (schema, row[0]) for row in db.execute(
+                    f"UPDATE {schema}.{table} SET lease_expires_at = datetime('now', ?) "
+                    f"WHERE id IN ({','.join('?' * len(ids))}) AND lease_token = ? AND sent_at IS NULL RETURNING id",
+                    [f"+{int(lease_seconds)} seconds", *ids, token],
+                )
+            ]
+    db.commit()
+    held = set(held)
+    return [row for row in items if (row[7], row[0]) in held]
+
+
+def _finish(db, items, token, sent, error=None):
+    by_schema = {}
+    for row in items:
+        by_schema.setdefault(row[7], []).append(row[0])
+    for schema, ids in by_schema.items():
+        table = f"{schema}.{OUTBOXES[schema]}"
+        placeholders = ",".join("?" * len(ids))
+        if sent:
+            db.execute(
+                f"UPDATE {table} SET sent_at = CURRENT_TIMESTAMP, last_error = ?, lease_token = NULL "
+                f"WHERE id IN ({placeholders}) AND lease_token = ?",
+                [error, *ids, token],
+            )
+        else:
+            # Аренду снимаем, запись попадет в следующий дайджест; после MAX_ATTEMPTS — отказ
+            db.execute(
+                f"UPDATE {table} SET lease_token = NULL, lease_expires_at = NULL, "
+                f"attempts = attempts + ?, last_error = ?, "
+                f"sent_at = CASE WHEN attempts + 1 >= ? AND ? IS NOT NULL THEN CURRENT_TIMESTAMP END "
+                f"WHERE id IN ({placeholders}) AND lease_token = ?",
+                [1 if error else 0, error, MAX_ATTEMPTS, error, *ids, token],
+            )
+
+
+def dispatch(db, transport):
+    """Один проход диспетчера: возвращает число отправленных дайджестов"""
+    token, rows = claim(db)
+    if not rows:
+        return 0
+    by_recipient = {}
+    for row in rows:
+        by_recipient.setdefault(row[1], []).append(row)
+    placeholders = ",".join("?" * len(by_recipient))
+    recipients = list(by_recipient)
+    emails = dict(db.execute(f"SELECT id, email FROM users WHERE id IN ({placeholders})", recipients).fetchall())
+    recent = dict(
+        db.execute(
+            f"SELECT recipient_id, COUNT(*) FROM notification_digests "
+            f"WHERE recipient_id IN ({placeholders}) AND sent_at > datetime('now', '-1 hour') GROUP BY recipient_id",
+            recipients,
+        ).fetchall()
+    )
+    sent = 0
+    try:
+        for recipient_id, items in by_recipient.items():
+            if not emails.get(recipient_id):
+                _finish(db, items, token, sent=True, error="У получателя нет email")
+            elif recent.get(recipient_id, 0) >= MAX_DIGESTS_PER_HOUR:
+                # Лимит писем исчерпан: уведомления дождутся следующего окна
+                _finish(db, items, token, sent=False)
+            else:
+                # Аренда могла истечь, пока отправлялись предыдущие дайджесты пачки
+                items = _renew(db, items[:MAX_DIGEST_ITEMS], token)
+                if not items:
+                    continue
+                try:
+                    transport.send(build_digest(emails[recipient_id], items))
+                except Exception as exc:
+                    _finish(db, items, token, sent=False, error=str(exc) or exc.__class__.__name__)
+                else:
+                    _finish(db, items, token, sent=True)
+                    db.execute(
+                        "INSERT INTO notification_digests (recipient_id, item_count) VALUES (?, ?)",
+                        (recipient_id, len(items)),
+                    )
+                    sent += 1
+            db.commit()
+    finally:
+        # Не попавшие в дайджест (сверх MAX_DIGEST_ITEMS) сразу возвращаются в очередь
+        for schema, table in OUTBOXES.items():
+            db.execute(
+                f"UPDATE {schema}.{table} SET lease_token = NULL, lease_expires_at = NULL "
+                f"WHERE lease_token = ? AND sent_at IS NULL",
+                (token,),
+            )
+        db.commit()
+        close = getattr(transport, "close", None)
+        if close is not None:
+            close()
+    return sent
+
+
+def _run(connect, transport):
+    while True:
+        time.sleep(INTERVAL)
+        try:
+            db = connect()
+            try:
+                dispatch(db, transport)
+            finally:
+                db.close()
+        except Exception as exc:  # фоновый поток не должен падать
+            print(f"Ошибка отправки уведомлений: {exc}")
+
+
+def ensure_dispatcher(key, connect, transport):
+    """Запускает в текущем процессе фоновый диспетчер для БД key, если он еще не запущен;
+    connect открывает новое соединение с этой БД"""
+    thread = _dispatchers.get(key)
+    if thread is not None and thread.is_alive():
+        return
+    with _dispatchers_lock:
+        thread = _dispatchers.get(key)
+        if thread is None or not thread.is_alive():
+            thread = threading.Thread(target=_run, args=(connect, transport), name="notifications", daemon=True)
+            _dispatchers[key] = thread
+            thread.start()
+
+
+def _reset_after_fork():
+    global _dispatchers, _dispatchers_lock
+    _dispatchers = {}
+    _dispatchers_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
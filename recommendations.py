@@ -0,0 +1,258 @@
+"""
+Персональные рекомендации: вакансии для кандидатов и стажировки для компаний.
+
+Для каждого владельца (кандидат или компания) в таблице neighbors хранится
+top-K ближайших опубликованных объектов. Профиль кандидата — навыки его
+резюме и вакансий, на которые он откликался; профиль компании — навыки ее
+вакансий. Таблица обновляется точечно при индексации резюме, публикации и
+снятии объектов, а ленты читают ее по индексу без вычислений.
+"""
+import matching
+
+TOP_K = 20
+CANDIDATE = "candidate"
+COMPANY = "company"
+
+
+def init_recommendations(db):
+    """Создает таблицу предрасчитанных соседей"""
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS neighbors (
+            owner_type TEXT NOT NULL CHECK (owner_type IN ('candidate','company')),
+            owner_id INTEGER NOT NULL,
+            item_type TEXT NOT NULL CHECK (item_type IN ('vacancy','internship')),
+            item_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            updated_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP),
+            PRIMARY KEY (owner_type, owner_id, item_type, item_id)
+        )
+        """
+    )
+    db.execute("CREATE INDEX IF NOT EXISTS idx_neighbors_feed ON neighbors(owner_type, owner_id, score DESC)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_neighbors_item ON neighbors(item_type, item_id)")
+
+
+def _candidate_profiles(db, candidate_ids):
+    """Навыки кандидатов: из резюме и из вакансий, на которые они откликались"""
+    profiles = {candidate_id: set() for candidate_id in candidate_ids}
+    if not profiles:
+        return profiles
+    placeholders = ",".join("?" * len(profiles))
+    ids = list(profiles)
+    for candidate_id, skill_id in db.execute(
+        f"SELECT r.candidate_id, rs.skill_id FROM resumes r JOIN resume_skills rs ON rs.resume_id = r.id "
+        f"WHERE r.candidate_id IN ({placeholders}) AND r.deleted_at IS NULL "
+        f"UNION SELECT a.candidate_id, vs.skill_id FROM applications a JOIN vacancy_skills vs ON vs.vacancy_id = a.vacancy_id "
+        f"WHERE a.candidate_id IN ({placeholders})",
+        ids + ids,
+    ):
+        profiles[candidate_id].add(skill_id)
+    return profiles
+
+
+def _company_profiles(db, company_ids):
+    """Навыки компаний по их вакансиям"""
+    profiles = {company_id: set() for company_id in company_ids}
+    if not profiles:
+        return profiles
+    placeholders = ",".join("?" * len(profiles))
+    for company_id, skill_id in db.execute(
+        f"SELECT DISTINCT v.company_id, vs.skill_id FROM vacancies v JOIN vacancy_skills vs ON vs.vacancy_id = v.id "
+        f"WHERE v.company_id IN ({placeholders})",
+        list(profiles),
+    ):
+        profiles[company_id].add(skill_id)
+    return profiles
+
+
+def _item_skills(db, item_type, item_ids):
+    """Навыки набора вакансий или стажировок"""
+    result = {item_id: set() for item_id in item_ids}
+    if not result:
+        return result
+    placeholders = ",".join("?" * len(result))
+    if item_type == matching.VACANCY:
+        sql = f"SELECT vacancy_id, skill_id FROM vacancy_skills WHERE vacancy_id IN ({placeholders})"
+    else:
+        sql = f"SELECT internship_request_id, skill_id FROM internship_skills WHERE internship_request_id IN ({placeholders})"
+    for item_id, skill_id in db.execute(sql, list(result)):
+        result[item_id].add(skill_id)
+    return result
+
+
+def _trim(db, owner_type, owner_id, item_type):
+    db.execute(
+        "DELETE FROM neighbors WHERE owner_type = ? AND owner_id = ? AND item_type = ? AND item_id NOT IN "
+        "(SELECT item_id FROM neighbors WHERE owner_type = ? AND owner_id = ? AND item_type = ? ORDER BY score DESC LIMIT ?)",
+        (owner_type, owner_id, item_type, owner_type, owner_id, item_type, TOP_K),
+    )
+
+
+def _replace(db, owner_type, owner_id, item_type, scored):
+    db.execute(
+        "DELETE FROM neighbors WHERE owner_type = ? AND owner_id = ? AND item_type = ?",
+        (owner_type, owner_id, item_type),
+    )
+    top = sorted(scored, key=lambda pair: pair[1], reverse=True)[:TOP_K]
+    db.executemany(
+        "INSERT INTO neighbors (owner_type, owner_id, item_type, item_id, score) VALUES (?, ?, ?, ?, ?)",
+        [(owner_type, owner_id, item_type, item_id, score) for item_id, score in top if score > 0],
+    )
+
+
+def refresh_candidate(db, candidate_id, idf=None):
+    """Полностью пересчитывает рекомендации вакансий для кандидата"""
+    idf = idf if idf is not None else matching.idf_weights(db)
+    profile = _candidate_profiles(db, [candidate_id])[candidate_id]
+    scored = []
+    if profile:
+        placeholders = ",".join("?" * len(profile))
+        # Кандидаты в рекомендации — опубликованные вакансии с общими навыками, кроме уже откликнутых
+        item_ids = [
+            row[0] for row in db.execute(
+                f"SELECT DISTINCT v.id FROM vacancy_skills vs JOIN vacancies v ON v.id = vs.vacancy_id "
+                f"WHERE vs.skill_id IN ({placeholders}) AND v.status = 'published' "
+                f"AND v.id NOT IN (SELECT vacancy_id FROM applications WHERE candidate_id = ?)",
+                list(profile) + [candidate_id],
+            )
+        ]
+        vector = matching.vectorize(profile, idf)
+        scored = [
+            (item_id, matching.cosine(vector, matching.vectorize(skills, idf)))
+            for item_id, skills in _item_skills(db, matching.VACANCY, item_ids).items()
+        ]
+    _replace(db, CANDIDATE, candidate_id, matching.VACANCY, scored)
+    db.commit()
+
+
+def refresh_company(db, company_id, idf=None):
+    """Полностью пересчитывает рекомендации стажировок для компании"""
+    idf = idf if idf is not None else matching.idf_weights(db)
+    profile = _company_profiles(db, [company_id])[company_id]
+    scored = []
+    if profile:
+        placeholders = ",".join("?" * len(profile))
+        item_ids = [
+            row[0] for row in db.execute(
+                f"SELECT DISTINCT ir.id FROM internship_skills isk JOIN internship_requests ir ON ir.id = isk.internship_request_id "
+                f"WHERE isk.skill_id IN ({placeholders}) AND ir.status = 'published'",
+                list(profile),
+            )
+        ]
+        vector = matching.vectorize(profile, idf)
+        scored = [
+            (item_id, matching.cosine(vector, matching.vectorize(skills, idf)))
+            for item_id, skills in _item_skills(db, matching.INTERNSHIP, item_ids).items()
+        ]
+    _replace(db, COMPANY, company_id, matching.INTERNSHIP, scored)
+    db.commit()
+
+
+def refresh_all(db, idf=None):
+    """Пересчитывает рекомендации всех кандидатов и компаний по одному снимку IDF"""
+    idf = idf if idf is not None else matching.idf_weights(db)
+    for (candidate_id,) in db.execute("SELECT DISTINCT candidate_id FROM resumes").fetchall():
+        refresh_candidate(db, candidate_id, idf)
+    for (company_id,) in db.execute("SELECT id FROM companies").fetchall():
+        refresh_company(db, company_id, idf)
+
+
+def refresh_weights(db, _resume_id=None):
+    """Обработчик индексации резюме: при заметном росте корпуса обновляет снимок IDF,
+    все оценки соответствия и рекомендации"""
+    if matching.refresh_idf(db):
+        refresh_all(db)
+
+
+def refresh_resume_owner(db, resume_id):
+    """Обработчик индексации резюме: обновляет рекомендации его владельца"""
+    row = db.execute("SELECT candidate_id FROM resumes WHERE id = ?", (resume_id,)).fetchone()
+    if row is not None:
+        refresh_candidate(db, row[0])
+
+
+def _merge_item(db, owner_type, item_type, item_id, profiles, idf):
+    """Добавляет новый объект в top-K владельцев, у которых есть общие навыки"""
+    item_vector = matching.vectorize(_item_skills(db, item_type, [item_id])[item_id], idf)
+    for owner_id, skills in profiles.items():
+        score = matching.cosine(item_vector, matching.vectorize(skills, idf))
+        if score <= 0:
+            continue
+        db.execute(
+            "INSERT OR REPLACE INTO neighbors (owner_type, owner_id, item_type, item_id, score) VALUES (?, ?, ?, ?, ?)",
+            (owner_type, owner_id, item_type, item_id, score),
+        )
+        _trim(db, owner_type, owner_id, item_type)
+
+
+def on_vacancy_published(db, vacancy_id):
+    """Вакансия опубликована: добавляем ее кандидатам с общими навыками"""
+    idf = matching.idf_weights(db)
+    candidate_ids = [
+        row[0] for row in db.execute(
+            "SELECT DISTINCT r.candidate_id FROM vacancy_skills vs "
+            "JOIN resume_skills rs ON rs.skill_id = vs.skill_id JOIN resumes r ON r.id = rs.resume_id "
+            "WHERE vs.vacancy_id = ? AND r.deleted_at IS NULL AND r.candidate_id NOT IN (SELECT candidate_id FROM applications WHERE vacancy_id = ?)",
+            (vacancy_id, vacancy_id),
+        )
+    ]
+    _merge_item(db, CANDIDATE, matching.VACANCY, vacancy_id, _candidate_profiles(db, candidate_ids), idf)
+    company = db.execute("SELECT company_id FROM vacancies WHERE id = ?", (vacancy_id,)).fetchone()
+    if company is not None:
+        # Профиль компании изменился — ее ленту стажировок пересчитываем целиком
+        refresh_company(db, company[0], idf)
+    db.commit()
+
+
+def on_internship_published(db, req_id):
+    """Стажировка опубликована: добавляем ее компаниям с общими навыками"""
+    idf = matching.idf_weights(db)
+    company_ids = [
+        row[0] for row in db.execute(
+            "SELECT DISTINCT v.company_id FROM internship_skills isk "
+            "JOIN vacancy_skills vs ON vs.skill_id = isk.skill_id JOIN vacancies v ON v.id = vs.vacancy_id "
+            "WHERE isk.internship_request_id = ?",
+            (req_id,),
+        )
+    ]
+    _merge_item(db, COMPANY, matching.INTERNSHIP, req_id, _company_profiles(db, company_ids), idf)
+    db.commit()
+
+
+def remove_item(db, item_type, item_id):
+    """Снимает объект из всех лент (отклонен, закрыт или удален)"""
+    db.execute("DELETE FROM neighbors WHERE item_type = ? AND item_id = ?", (item_type, item_id))
+    db.commit()
+
+
+def on_applied(db, candidate_id, vacancy_id):
+    """Кандидат откликнулся: вакансия уходит из его ленты"""
+    db.execute(
+        "DELETE FROM neighbors WHERE owner_type = ? AND owner_id = ? AND item_type = ? AND item_id = ?",
+        (CANDIDATE, candidate_id, matching.VACANCY, vacancy_id),
+    )
+    db.commit()
+
+
+def vacancy_feed(db, candidate_id, limit=TOP_K):
+    """Лента рекомендованных вакансий кандидата"""
+    return db.execute(
+        "SELECT v.id, v.title, v.description, v.salary_range, c.name AS company_name, n.score "
+        "FROM neighbors n JOIN vacancies v ON v.id = n.item_id JOIN companies c ON c.id = v.company_id "
+        "WHERE n.owner_type = 'candidate' AND n.owner_id = ? AND n.item_type = 'vacancy' AND v.status = 'published' "
+        "ORDER BY n.score DESC LIMIT ?",
+        (candidate_id, limit),
+    ).fetchall()
+
+
+def internship_feed(db, company_id, limit=TOP_K):
+    """Лента рекомендованных стажировок компании"""
+    return db.execute(
+        "SELECT ir.id, ir.specialization, ir.student_count, ir.period_start, ir.period_end, ir.skills_required, "
+        "u.username AS university_name, n.score "
+        "FROM neighbors n JOIN internship_requests ir ON ir.id = n.item_id JOIN users u ON u.id = ir.university_id "
+        "WHERE n.owner_type = 'company' AND n.owner_id = ? AND n.item_type = 'internship' AND ir.status = 'published' "
+        "ORDER BY n.score DESC LIMIT ?",
+        (company_id, limit),
+    ).fetchall()
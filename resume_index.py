@@ -0,0 +1,273 @@
+"""
+Извлечение текста из файлов резюме и индексация навыков.
+
+Текст DOCX читается напрямую из word/document.xml, PDF разбирается
+простым парсером потоков содержимого без внешних зависимостей.
+Навыки нормализуются в таблицу skills, связи пишутся в resume_skills,
+а индекс idx_resume_skills_skill служит обратным индексом навык -> резюме.
+Индексация выполняется фоновым потоком, чтобы не задерживать запрос.
+"""
+import os
+import queue
+import re
+import sqlite3
+import threading
+import zipfile
+import zlib
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+SKILL_SEPARATORS = re.compile(r"[,;\n\r/|•·]+")
+WORD_RE = re.compile(r"[0-9a-zа-яё+#.\-]+", re.IGNORECASE)
+MAX_SKILL_LENGTH = 64
+MAX_SKILL_WORDS = 3
+
+# Обработчики, вызываемые после индексации резюме: hook(db, resume_id)
+on_indexed = []
+
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def init_resume_index(db):
+    """Создает колонки и индексы, необходимые для индексации резюме"""
+    for column in ("skills_text TEXT", "content_text TEXT", "indexed_at TEXT"):
+        try:
+            db.execute(f"ALTER TABLE resumes ADD COLUMN {column}")
+        except sqlite3.OperationalError:
+            # Колонка уже существует
+            pass
+    db.execute("CREATE INDEX IF NOT EXISTS idx_resume_skills_skill ON resume_skills(skill_id, resume_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_resumes_indexed ON resumes(indexed_at)")
+
+
+def normalize_skill(name):
+    """Приводит название навыка к каноничному виду"""
+    name = " ".join((name or "").lower().split())
+    name = name.strip(" .-–—:()[]\"'")
+    if not name or len(name) > MAX_SKILL_LENGTH:
+        return None
+    return name
+
+
+def parse_skills(text):
+    """Разбивает свободный текст навыков на список уникальных нормализованных навыков"""
+    result = []
+    seen = set()
+    for part in SKILL_SEPARATORS.split(text or ""):
+        skill = normalize_skill(part)
+        if skill and skill not in seen:
+            seen.add(skill)
+            result.append(skill)
+    return result
+
+
+def find_known_skills(text, vocabulary):
+    """Находит в тексте навыки из словаря (фразы до MAX_SKILL_WORDS слов)"""
+    words = [w.strip(".-").lower() for w in WORD_RE.findall(text or "")]
+    words = [w for w in words if w]
+    found = set()
+    for size in range(1, MAX_SKILL_WORDS + 1):
+        for i in range(len(words) - size + 1):
+            phrase = " ".join(words[i:i + size])
+            if phrase in vocabulary:
+                found.add(phrase)
+    return found
+
+
+def extract_docx_text(path):
+    """Извлекает текст из DOCX (zip-архив с word/document.xml)"""
+    # Разбор XML нужен только для DOCX, поэтому импортируется при первом вызове
+    from xml.etree import ElementTree
+
+    with zipfile.ZipFile(path) as archive:
+        xml = archive.read("word/document.xml")
+    root = ElementTree.fromstring(xml)
+    paragraphs = []
+    for paragraph in root.iter(f"{WORD_NS}p"):
+        parts = [node.text or "" for node in paragraph.iter(f"{WORD_NS}t")]
+        if parts:
+            paragraphs.append("".join(parts))
+    return "\n".join(paragraphs)
+
+
+_PDF_STREAM_RE = re.compile(rb"stream\r?\n(.*?)\r?\n?endstream", re.DOTALL)
+_PDF_TEXT_RE = re.compile(rb"\((?:\\.|[^\\)])*\)\s*(?:Tj|'|\")|\[(?:\\.|[^\]])*\]\s*TJ|T\*|ET")
+_PDF_STRING_RE = re.compile(rb"\((?:\\.|[^\\)])*\)")
+_PDF_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f"}
+
+
+def _decode_pdf_string(raw):
+    """Раскрывает экранирование строкового литерала PDF"""
+    raw = raw[1:-1]
+    out = bytearray()
+    i = 0
+    while i < len(raw):
+        ch = raw[i:i + 1]
+        if ch != b"\\":
+            out += ch
+            i += 1
+            continue
+        nxt = raw[i + 1:i + 2]
+        if nxt in _PDF_ESCAPES:
+            out += _PDF_ESCAPES[nxt]
+            i += 2
+        elif nxt and nxt in b"01234567":
+            octal = re.match(rb"[0-7]{1,3}", raw[i + 1:i + 4]).group()
+            out.append(int(octal, 8) & 0xFF)
+            i += 1 + len(octal)
+        elif nxt in (b"\r", b"\n"):
+            # Обратный слеш в конце строки — перенос литерала, в текст не попадает
+            i += 3 if raw[i + 1:i + 3] == b"\r\n" else 2
+        else:
+            # Остальные символы (в том числе \8 и \9) означают сами себя
+            out += nxt
+            i += 2
+    if out.startswith(b"\xfe\xff"):
+        return out[2:].decode("utf-16-be", "ignore")
+    try:
+        return out.decode("utf-8")
+    except UnicodeDecodeError:
+        return out.decode("cp1251", "ignore")
+
+
+def extract_pdf_text(path):
+    """Извлекает текст из операторов Tj/TJ потоков содержимого PDF"""
+    with open(path, "rb") as fh:
+        data = fh.read()
+    lines = []
+    for match in _PDF_STREAM_RE.finditer(data):
+        content = match.group(1)
+        try:
+            content = zlib.decompress(content)
+        except zlib.error:
+            pass
+        line = []
+        for op in _PDF_TEXT_RE.finditer(content):
+            token = op.group()
+            if token in (b"T*", b"ET"):
+                if line:
+                    lines.append("".join(line))
+                    line = []
+                continue
+            line.extend(_decode_pdf_string(s) for s in _PDF_STRING_RE.findall(token))
+        if line:
+            lines.append("".join(line))
+    return "\n".join(lines)
+
+
+def extract_text(path):
+    """Извлекает текст из файла резюме; неподдерживаемые или битые файлы дают пустую строку"""
+    if not path or not os.path.exists(path):
+        return ""
+    # Формат определяем по содержимому: secure_filename может съесть расширение
+    try:
+        if zipfile.is_zipfile(path):
+            return extract_docx_text(path)
+        with open(path, "rb") as fh:
+            header = fh.read(5)
+        if header == b"%PDF-":
+            return extract_pdf_text(path)
+    # ElementTree.ParseError — подкласс SyntaxError
+    except (OSError, KeyError, zipfile.BadZipFile, SyntaxError):
+        return ""
+    # Старый бинарный формат .doc не поддерживается
+    return ""
+
+
+def skill_ids(db, names):
+    """Возвращает id навыков по названиям, создавая недостающие"""
+    if not names:
+        return {}
+    db.executemany("INSERT OR IGNORE INTO skills (name) VALUES (?)", [(n,) for n in names])
+    placeholders = ",".join("?" * len(names))
+    rows = db.execute(f"SELECT id, name FROM skills WHERE name IN ({placeholders})", list(names)).fetchall()
+    return {row[1]: row[0] for row in rows}
+
+
+def index_resume(db, resume_id):
+    """Извлекает текст резюме и заполняет resume_skills"""
+    resume = db.execute(
+        "SELECT id, experience, education, resume_file, skills_text FROM resumes WHERE id = ?",
+        (resume_id,),
+    ).fetchone()
+    if resume is None:
+        return []
+    content = extract_text(resume[3])
+    declared = parse_skills(resume[4])
+    vocabulary = {row[0] for row in db.execute("SELECT name FROM skills")}
+    vocabulary.update(declared)
+    found = find_known_skills("\n".join(filter(None, [resume[1], resume[2], content])), vocabulary)
+    names = sorted(set(declared) | found)
+
+    ids = skill_ids(db, names)
+    db.execute("DELETE FROM resume_skills WHERE resume_id = ?", (resume_id,))
+    db.executemany(
+        "INSERT OR IGNORE INTO resume_skills (resume_id, skill_id) VALUES (?, ?)",
+        [(resume_id, skill_id) for skill_id in ids.values()],
+    )
+    db.execute(
+        "UPDATE resumes SET content_text = ?, indexed_at = CURRENT_TIMESTAMP WHERE id = ?",
+        (content, resume_id),
+    )
+    db.commit()
+    return names
+
+
+def resume_skill_names(db, resume_id):
+    """Возвращает навыки резюме"""
+    return [
+        row[0] for row in db.execute(
+            "SELECT s.name FROM resume_skills rs JOIN skills s ON s.id = rs.skill_id WHERE rs.resume_id = ? ORDER BY s.name",
+            (resume_id,),
+        )
+    ]
+
+
+def process_resume(db, resume_id):
+    """Индексирует резюме и вызывает обработчики on_indexed"""
+    index_resume(db, resume_id)
+    for hook in on_indexed:
+        hook(db, resume_id)
+
+
+def pending_resume_ids(db):
+    """Возвращает резюме, которые еще не проиндексированы"""
+    return [row[0] for row in db.execute("SELECT id FROM resumes WHERE indexed_at IS NULL ORDER BY id")]
+
+
+def _run():
+    while True:
+        connect, resume_id = _queue.get()
+        try:
+            db = connect()
+            try:
+                process_resume(db, resume_id)
+            finally:
+                db.close()
+        except Exception as exc:  # фоновый поток не должен падать
+            print(f"Ошибка индексации резюме {resume_id}: {exc}")
+        finally:
+            _queue.task_done()
+
+
+def enqueue(connect, resume_id):
+    """Ставит резюме в очередь фоновой индексации; connect открывает новое соединение с БД резюме"""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="resume-index", daemon=True)
+            _worker.start()
+    # Соединение задается для каждого резюме: приложения процесса могут работать с разными БД
+    _queue.put((connect, resume_id))
+
+
+def _reset_after_fork():
+    global _queue, _worker, _worker_lock
+    _queue = queue.Queue()
+    _worker = None
+    _worker_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
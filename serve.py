@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Продакшен-сервер: pre-fork модель с пулом потоков в каждом воркере.
+
+Мастер один раз выполняет create_app() (схема БД, папки), открывает
+слушающий сокет и запускает воркеры через fork. Каждый воркер принимает
+соединения с общего сокета и обрабатывает их в пуле из --threads потоков.
+
+Сигналы мастеру:
+  SIGHUP  — плавная перезагрузка: стартуют новые воркеры, старые
+            дорабатывают текущие запросы и завершаются;
+  SIGTERM, SIGINT — плавная остановка.
+С --no-preload приложение импортируется в воркере, поэтому SIGHUP
+подхватывает и новый код.
+
+Соединение, от которого --timeout секунд нет данных, закрывается, чтобы
+простаивающие клиенты не занимали потоки пула. Воркер, не завершившийся за
+--graceful-timeout после остановки или перезагрузки, получает SIGKILL.
+
+Пример: FLASK_SECRET_KEY=... python serve.py --bind 0.0.0.0:8000 --workers 4 --threads 8
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer
+
+# Секунд ожидания данных от клиента, после которых соединение закрывается
+DEFAULT_TIMEOUT = 30
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """WSGI-сервер werkzeug с ограниченным пулом потоков.
+
+    Пока все потоки заняты, воркер не принимает новые соединения, и их
+    забирают свободные воркеры с того же сокета.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd, timeout=DEFAULT_TIMEOUT):
+        super().__init__(host, port, app, fd=fd)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http")
+        self._slots = threading.BoundedSemaphore(threads)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        self._executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            # Клиент, который не присылает запрос (или держит keep-alive), не занимает поток дольше timeout
+            request.settimeout(self.timeout)
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def drain(self):
+        """Дожидается завершения запросов, которые уже выполняются"""
+        self._executor.shutdown(wait=True)
+
+
+def parse_bind(value):
+    host, _, port = value.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def load_app():
+    """Импортирует модуль приложения и создает экземпляр через create_app()"""
+    import app as app_module
+
+    return app_module.create_app()
+
+
+def worker_main(listener, host, port, threads, application=None, timeout=DEFAULT_TIMEOUT):
+    """Цикл воркера: обслуживает запросы до SIGTERM, затем дорабатывает текущие"""
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # При preload приложение уже создано мастером и унаследовано через fork
+    if application is None:
+        application = load_app()
+    # Контроль допуска рассчитан на число потоков именно этого воркера
+    application.config["ADMISSION_CAPACITY"] = threads
+    server = PooledWSGIServer(host, port, application, threads, listener.fileno(), timeout)
+
+    def stop(_signum, _frame):
+        # shutdown() ждет выхода из serve_forever, поэтому вызываем его из отдельного потока
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    server.serve_forever(poll_interval=0.5)
+    server.drain()
+    # Воркер завершается через os._exit без atexit, поэтому буфер журнала сбрасываем явно
+    import event_log
+
+    event_log.flush()
+
+
+class Master:
+    def __init__(self, args):
+        self.args = args
+        self.host, self.port = parse_bind(args.bind)
+        self.workers = {}
+        # pid остановленного воркера -> срок, после которого он получит SIGKILL
+        self.retiring = {}
+        self.application = None
+        self.generation = 0
+        self.reload_requested = False
+        self.stopping = False
+
+    def open_listener(self):
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        listener = socket.socket(family, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(self.args.backlog)
+        return listener
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                worker_main(self.listener, self.host, self.port, self.args.threads, self.application, self.args.timeout)
+            finally:
+                os._exit(0)
+        self.workers[pid] = self.generation
+        return pid
+
+    def spawn_generation(self):
+        self.generation += 1
+        for _ in range(self.args.workers):
+            self.spawn()
+
+    def retire(self, generation):
+        deadline = time.monotonic() + self.args.graceful_timeout
+        for pid, gen in list(self.workers.items()):
+            if gen < generation and pid not in self.retiring:
+                os.kill(pid, signal.SIGTERM)
+                self.retiring[pid] = deadline
+
+    def kill_overdue(self):
+        """SIGKILL воркерам, которые не завершились за graceful-timeout после SIGTERM"""
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if deadline <= now:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                del self.retiring[pid]
+
+    def reap(self):
+        while True:
+            try:
+                pid, _status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            gen = self.workers.pop(pid, None)
+            self.retiring.pop(pid, None)
+            # Упавший воркер текущего поколения заменяем новым
+            if gen == self.generation and not self.stopping:
+                self.spawn()
+
+    def run(self):
+        if self.args.preload:
+            # Разовая подготовка в мастере: дочерние процессы наследуют готовое приложение
+            self.application = load_app()
+        self.listener = self.open_listener()
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, "reload_requested", True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, "stopping", True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, "stopping", True))
+        print(f"Мастер {os.getpid()}: http://{self.host}:{self.port}, воркеров {self.args.workers}, потоков {self.args.threads}")
+        self.spawn_generation()
+
+        while not self.stopping:
+            if self.reload_requested:
+                self.reload_requested = False
+                # Новые воркеры начинают принимать соединения до остановки старых — без простоя
+                self.spawn_generation()
+                self.retire(self.generation)
+            self.reap()
+            self.kill_overdue()
+            time.sleep(0.2)
+
+        self.retire(self.generation + 1)
+        while self.workers:
+            self.reap()
+            self.kill_overdue()
+            time.sleep(0.1)
+        self.listener.close()
+        return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Запуск HR-платформы в многопроцессном режиме")
+    parser.add_argument("--bind", default=os.environ.get("BIND", "127.0.0.1:8000"), help="host:port")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("THREADS", 8)), help="потоков на воркер")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--graceful-timeout", type=float, default=30.0)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="секунд ожидания данных от клиента")
+    parser.add_argument("--no-preload", dest="preload", action="store_false", help="импортировать приложение в каждом воркере")
+    parser.add_argument("--dev", action="store_true", help="однопроцессный сервер разработки с отладчиком")
+    args = parser.parse_args(argv)
+
+    if args.dev:
+        host, port = parse_bind(args.bind)
+        load_app().run(host=host, port=port, debug=True)
+        return 0
+    return Master(args).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
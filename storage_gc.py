@@ -0,0 +1,177 @@
+"""
+Сборка мусора в хранилище загрузок и учет занятого места.
+
+Файлы в папках резюме и аватаров сверяются с resumes.resume_file и
+profiles.avatar; файлы без ссылок удаляются пачками. Резюме, удаленные
+кандидатом, пока к ним прикреплены отклики, только помечаются deleted_at;
+когда откликов не остается (вакансии удалены), GC удаляет строку, и ее
+файл становится сиротой в том же проходе. Так же удаляются старые копии
+резюме, созданные на отдельный отклик (stored = 0), после каскадного
+удаления их откликов.
+
+Свежие объекты не трогаем: файл сохраняется на диск раньше, чем
+коммитится строка резюме, а отклик создается после резюме, поэтому
+сиротами считаются только файлы старше grace, резюме, помеченные
+удаленными раньше grace, и копии, проиндексированные раньше grace.
+"""
+import os
+import time
+
+BATCH_SIZE = 500
+GRACE_SECONDS = 24 * 3600
+
+
+def _native(path):
+    """Путь с разделителями текущей ОС: в БД есть пути, сохраненные под Windows (uploads\\resume.pdf)"""
+    return path.replace("\\", os.sep)
+
+
+def _inside(path, folder):
+    folder = os.path.realpath(_native(folder))
+    return os.path.commonpath([os.path.realpath(_native(path)), folder]) == folder
+
+
+def _normalized(path):
+    return os.path.normcase(os.path.realpath(_native(path))) if path else None
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def orphan_resume_ids(db, grace_seconds=GRACE_SECONDS):
+    """Резюме без откликов: удаленные кандидатом раньше grace и копии для откликов, не сохраненные кандидатом"""
+    return [
+        row[0] for row in db.execute(
+            "SELECT r.id FROM resumes r WHERE (r.deleted_at < datetime('now', ?) "
+            "OR (r.stored = 0 AND r.indexed_at < datetime('now', ?))) "
+            "AND NOT EXISTS (SELECT 1 FROM applications a WHERE a.resume_id = r.id) ORDER BY r.id",
+            (f"-{int(grace_seconds)} seconds", f"-{int(grace_seconds)} seconds"),
+        )
+    ]
+
+
+def referenced_files(db):
+    paths = set()
+    for (path,) in db.execute(
+        "SELECT resume_file FROM resumes WHERE resume_file IS NOT NULL AND resume_file != '' "
+        "UNION SELECT avatar FROM profiles WHERE avatar IS NOT NULL AND avatar != ''"
+    ):
+        paths.add(_normalized(path))
+    return paths
+
+
+def orphan_files(db, folders, grace_seconds=GRACE_SECONDS, exclude=()):
+    """Файлы в папках хранилища без ссылок из БД и старше grace"""
+    referenced = referenced_files(db) - {_normalized(path) for path in exclude}
+    cutoff = time.time() - grace_seconds
+    result = []
+    for folder in folders:
+        if not os.path.isdir(folder):
+            continue
+        for entry in os.scandir(folder):
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            if _normalized(entry.path) in referenced:
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime < cutoff:
+                result.append((entry.path, stat.st_size))
+    return sorted(result)
+
+
+def collect(db, folders, dry_run=True, batch_size=BATCH_SIZE, grace_seconds=GRACE_SECONDS):
+    """Удаляет резюме-сироты и файлы без ссылок; dry_run только считает"""
+    resume_ids = orphan_resume_ids(db, grace_seconds)
+    freed_paths = []
+    if resume_ids:
+        freed_paths = [
+            row[0] for row in db.execute(
+                f"SELECT resume_file FROM resumes WHERE id IN ({','.join('?' * len(resume_ids))}) AND resume_file IS NOT NULL",
+                resume_ids,
+            )
+        ]
+    if not dry_run:
+        for batch in _batches(resume_ids, batch_size):
+            db.execute(
+                f"DELETE FROM resumes WHERE id IN ({','.join('?' * len(batch))}) "
+                f"AND NOT EXISTS (SELECT 1 FROM applications a WHERE a.resume_id = resumes.id)",
+                batch,
+            )
+            db.commit()
+    # В пробном прогоне строки остаются, поэтому их файлы учитываем вручную
+    files = orphan_files(db, folders, grace_seconds, exclude=freed_paths if dry_run else ())
+    removed, freed = 0, 0
+    for batch in _batches(files, batch_size):
+        for path, size in batch:
+            if dry_run:
+                removed += 1
+                freed += size
+                continue
+            if not any(_inside(path, folder) for folder in folders):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += size
+    return {
+        "dry_run": dry_run,
+        "resumes": len(resume_ids),
+        "files": removed,
+        "bytes": freed,
+        "paths": [path for path, _size in files],
+    }
+
+
+def _file_size(path, cache):
+    if path not in cache:
+        try:
+            cache[path] = os.path.getsize(_native(path))
+        except OSError:
+            cache[path] = 0
+    return cache[path]
+
+
+def usage(db):
+    """Занятое место по пользователям (резюме и аватар) и по компаниям (резюме откликов)"""
+    sizes = {}
+    users = {}
+    for user_id, username, path in db.execute(
+        "SELECT u.id, u.username, r.resume_file FROM resumes r JOIN users u ON u.id = r.candidate_id "
+        "WHERE r.resume_file IS NOT NULL AND r.resume_file != '' "
+        "UNION ALL SELECT u.id, u.username, p.avatar FROM profiles p JOIN users u ON u.id = p.user_id "
+        "WHERE p.avatar IS NOT NULL AND p.avatar != ''"
+    ):
+        entry = users.setdefault(user_id, {"user_id": user_id, "username": username, "files": 0, "bytes": 0})
+        entry["files"] += 1
+        entry["bytes"] += _file_size(path, sizes)
+    companies = {}
+    for company_id, name, path in db.execute(
+        "SELECT DISTINCT c.id, c.name, r.resume_file FROM applications a "
+        "JOIN vacancies v ON v.id = a.vacancy_id JOIN companies c ON c.id = v.company_id "
+        "JOIN resumes r ON r.id = a.resume_id WHERE r.resume_file IS NOT NULL AND r.resume_file != ''"
+    ):
+        entry = companies.setdefault(company_id, {"company_id": company_id, "name": name, "files": 0, "bytes": 0})
+        entry["files"] += 1
+        entry["bytes"] += _file_size(path, sizes)
+    by_size = lambda entry: entry["bytes"]
+    return {
+        "users": sorted(users.values(), key=by_size, reverse=True),
+        "companies": sorted(companies.values(), key=by_size, reverse=True),
+    }
+
+
+def remove_replaced_file(old_path, new_path, folder):
+    """Удаляет прежний файл после замены (например, аватара), если он лежит в folder"""
+    if not old_path or _normalized(old_path) == _normalized(new_path):
+        return False
+    if not _inside(old_path, folder):
+        return False
+    try:
+        os.remove(_native(old_path))
+    except FileNotFoundError:
+        return False
+    return True
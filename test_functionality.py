@@ -6,7 +6,20 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app import app, get_db, init_db
+import app as app_module
+from app import get_db
+import exports
+import resume_index
+
+# Каждый запуск работает со своей БД в памяти, а не с app.bd;
+# быстрый хеш паролей ускоряет создание пользователей по умолчанию
+app = app_module.create_app({
+    "TESTING": True,
+    "SECRET_KEY": "test",
+    "DATABASE": app_module.MEMORY_DATABASE,
+    "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000",
+    "NOTIFY_TRANSPORT": None,
+})
 
 def test_multilang():
     """Тестирует функционал многоязычности"""
@@ -63,25 +76,1319 @@ def test_database():
                  'internship_responses', 'moderation_logs']
         
         for table in tables:
-            result = db.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table}'").fetchone()
+            # Часть таблиц лежит в присоединенных БД, поэтому смотрим по всем схемам
+            result = db.execute(f"SELECT name FROM pragma_table_list WHERE type='table' AND name='{table}'").fetchone()
             assert result is not None, f"Таблица {table} не найдена"
             print(f"   ✓ Таблица {table} существует")
         
         print("   ✓ Все необходимые таблицы созданы")
 
+def test_resume_index():
+    """Тестирует разбор навыков и извлечение текста резюме"""
+    print("\n=== Тестирование индексации резюме ===")
+    import tempfile
+    import zipfile
+
+    skills = resume_index.parse_skills("Python, SQL;  Machine   Learning\npython")
+    assert skills == ["python", "sql", "machine learning"], f"Неверный разбор навыков: {skills}"
+    print("   ✓ Навыки нормализуются и дедуплицируются")
+
+    found = resume_index.find_known_skills("Опыт: Machine learning и SQL.", {"machine learning", "sql", "go"})
+    assert found == {"machine learning", "sql"}, f"Неверный поиск навыков: {found}"
+    print("   ✓ Навыки из словаря находятся в тексте")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "resume_docx")
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr(
+                "word/document.xml",
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                "<w:body><w:p><w:r><w:t>Python</w:t></w:r><w:r><w:t> developer</w:t></w:r></w:p></w:body></w:document>",
+            )
+        text = resume_index.extract_text(path)
+        assert text == "Python developer", f"Неверный текст DOCX: {text!r}"
+    print("   ✓ Текст DOCX извлекается без внешних зависимостей")
+
+    decoded = resume_index._decode_pdf_string(b"(SQL \\8\\9 \\101\\(x\\) C\\\n++)")
+    assert decoded == "SQL 89 A(x) C++", f"Неверное раскрытие строки PDF: {decoded!r}"
+    print("   ✓ Экранирование строк PDF раскрывается по спецификации, включая \\8 и \\9")
+
+def test_exports():
+    """Тестирует потоковую выгрузку откликов"""
+    print("\n=== Тестирование выгрузки откликов ===")
+    import csv
+    import io
+    import sqlite3
+    import zipfile
+    from xml.etree import ElementTree
+
+    db = sqlite3.connect(":memory:")
+    db.row_factory = sqlite3.Row
+    columns = [key for key, _title in exports.COLUMNS]
+    db.execute(f"CREATE TABLE rows ({', '.join(columns)})")
+    db.executemany(
+        f"INSERT INTO rows VALUES ({', '.join('?' * len(columns))})",
+        [[i, "2025-01-01", "new", 1, "Аналитик <QA> & \x01", *["x"] * (len(columns) - 5)] for i in range(1200)],
+    )
+
+    chunks = list(exports.stream_xlsx(db.execute("SELECT * FROM rows")))
+    assert len(chunks) > 3, "XLSX должен отдаваться частями"
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+        assert archive.testzip() is None
+        sheet = ElementTree.fromstring(archive.read("xl/worksheets/sheet1.xml"))
+    ns = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+    rows = list(sheet.iter(f"{ns}row"))
+    assert len(rows) == 1201, "В XLSX должны быть заголовок и все строки"
+    assert len(rows[0]) == len(columns)
+    print("   ✓ XLSX собирается потоком и открывается как корректный архив")
+
+    lines = b"".join(exports.stream_csv(db.execute("SELECT * FROM rows"))).decode("utf-8-sig").splitlines()
+    assert len(lines) == 1201 and lines[0].startswith("ID отклика")
+    print("   ✓ CSV содержит заголовок и все строки")
+
+    db.execute("DELETE FROM rows")
+    db.execute(
+        f"INSERT INTO rows ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+        [-1, "=HYPERLINK(\"http://evil\")", "+1", "@SUM(A1)", "-2", "\tx", "ok", *[None] * (len(columns) - 7)],
+    )
+    output = b"".join(exports.stream_csv(db.execute("SELECT * FROM rows"))).decode("utf-8-sig")
+    row = next(csv.reader(io.StringIO(output.splitlines()[1])))
+    assert row[:7] == ["-1", "'=HYPERLINK(\"http://evil\")", "'+1", "'@SUM(A1)", "'-2", "'\tx", "ok"], f"Формулы не экранированы: {row}"
+    print("   ✓ CSV экранирует значения, похожие на формулы")
+
+def login(client, username):
+    """Входит под пользователем по умолчанию (пароль совпадает с логином)"""
+    response = client.post('/login', data={'username': username, 'password': username})
+    assert response.status_code == 302, f"Вход {username} не удался: {response.status_code}"
+
+def test_internship_rejection():
+    """Тестирует отклонение заявки на стажировку модератором"""
+    print("\n=== Тестирование отклонения стажировки ===")
+
+    with app.app_context():
+        db = get_db()
+        university_id = db.execute("SELECT id FROM users WHERE username = 'university_rep'").fetchone()[0]
+        req_id = db.execute(
+            "INSERT INTO internship_requests (university_id, specialization, status) VALUES (?, 'Тест', 'on_moderation')",
+            (university_id,),
+        ).lastrowid
+        db.commit()
+
+    with app.test_client() as client:
+        login(client, 'admin')
+        response = client.post(f'/admin/moderation/internship/{req_id}/reject')
+        assert response.status_code == 302, f"Ожидался код 302, получен {response.status_code}"
+
+    with app.app_context():
+        db = get_db()
+        status = db.execute("SELECT status FROM internship_requests WHERE id = ?", (req_id,)).fetchone()[0]
+        assert status == 'rejected', f"Неверный статус заявки: {status}"
+        queued = db.execute(
+            "SELECT 1 FROM moderation_queue WHERE item_type = 'internship' AND item_id = ?", (req_id,)
+        ).fetchone()
+        assert queued is None, "Элемент очереди модерации должен быть завершен"
+    print("   ✓ Заявка отклоняется, элемент очереди модерации завершается")
+
+def test_moderation_queue():
+    """Тестирует захват элементов очереди модерации по аренде"""
+    print("\n=== Тестирование очереди модерации ===")
+    import moderation_queue
+
+    application = app_module.create_app({
+        "TESTING": True, "SECRET_KEY": "test", "DATABASE": app_module.MEMORY_DATABASE,
+        "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000", "NOTIFY_TRANSPORT": None,
+    })
+    with application.app_context():
+        db = get_db()
+        first, second = create_user(db, 'moderator_a', 'admin'), create_user(db, 'moderator_b', 'admin')
+        vacancy_ids = [create_vacancy(db, f'Вакансия в очереди {i}', status='on_moderation') for i in range(2)]
+        for vacancy_id in vacancy_ids:
+            moderation_queue.enqueue(db, "vacancy", vacancy_id, "company:1")
+        db.commit()
+
+    with application.test_client() as client:
+        login(client, 'moderator_a')
+        client.post('/admin/moderation/claim')
+    with application.app_context():
+        db = get_db()
+        claimed = db.execute("SELECT claimed_by FROM moderation_queue").fetchall()
+        assert [row[0] for row in claimed] == [first, first], "Модератор должен захватить свободные элементы"
+        assert moderation_queue.claim(db, second) == [], "Захваченные элементы не должны выдаваться второму модератору"
+        print("   ✓ Два модератора не захватывают один элемент")
+
+        db.execute("UPDATE moderation_queue SET lease_expires_at = datetime('now', '-1 second')")
+        db.commit()
+        reclaimed = sorted(row["item_id"] for row in moderation_queue.claim(db, second))
+        assert reclaimed == vacancy_ids, "Элементы с истекшей арендой должны снова выдаваться"
+        print("   ✓ Истекшая аренда возвращает элементы в очередь")
+
+    with application.test_client() as client:
+        login(client, 'moderator_a')
+        client.post(f'/admin/moderation/vacancy/{vacancy_ids[0]}/approve')
+        login(client, 'moderator_b')
+        client.post(f'/admin/moderation/vacancy/{vacancy_ids[1]}/approve')
+    with application.app_context():
+        db = get_db()
+        statuses = [
+            db.execute("SELECT status FROM vacancies WHERE id = ?", (vacancy_id,)).fetchone()[0] for vacancy_id in vacancy_ids
+        ]
+        assert statuses == ['on_moderation', 'published'], f"Решение по потерянной аренде применено: {statuses}"
+        queued = db.execute("SELECT item_id, claimed_by FROM moderation_queue").fetchall()
+        assert [tuple(row) for row in queued] == [(vacancy_ids[0], second)], "Элемент должен остаться у нового модератора"
+    print("   ✓ Решение модератора, потерявшего аренду, отклоняется")
+
+def test_notification_rate_cap():
+    """Тестирует, что получатели с исчерпанным лимитом писем не вытесняют остальных"""
+    print("\n=== Тестирование outbox уведомлений ===")
+    import notifications
+
+    class Transport:
+        def __init__(self):
+            self.sent = []
+
+        def send(self, message):
+            self.sent.append(message["To"])
+
+    with app.app_context():
+        db = get_db()
+        capped, other = [
+            db.execute(
+                "INSERT INTO users (username, password_hash, role, email) VALUES (?, 'x', 'candidate', ?)",
+                (name, f"{name}@example.com"),
+            ).lastrowid
+            for name in ("notify_capped", "notify_other")
+        ]
+        db.executemany(
+            "INSERT INTO notification_digests (recipient_id, item_count) VALUES (?, 1)",
+            [(capped,)] * notifications.MAX_DIGESTS_PER_HOUR,
+        )
+        # Записей ограниченного получателя больше, чем помещается в одну пачку
+        for i in range(notifications.BATCH_SIZE + 10):
+            notifications.notify(db, capped, "test", f"Уведомление {i}", "Текст")
+        notifications.notify(db, other, "test", "Другому получателю", "Текст")
+        db.commit()
+
+        transport = Transport()
+        for _ in range(2):
+            notifications.dispatch(db, transport)
+        assert transport.sent == ["notify_other@example.com"], f"Неверные получатели: {transport.sent}"
+        leased = db.execute(
+            "SELECT COUNT(*) FROM notification_outbox WHERE recipient_id = ? AND lease_token IS NOT NULL", (capped,)
+        ).fetchone()[0]
+        assert leased == 0, "Записи ограниченного получателя не должны захватываться"
+    print("   ✓ Лимит писем не блокирует уведомления других получателей")
+
+    with app.app_context():
+        db = get_db()
+        first, second = create_user(db, 'lease_first', 'candidate'), create_user(db, 'lease_second', 'candidate')
+        notifications.notify(db, first, "test", "Первому", "Текст")
+        notifications.notify(db, second, "test", "Второму", "Текст")
+        db.commit()
+        reclaimed = []
+
+        class SlowTransport(Transport):
+            def send(self, message):
+                super().send(message)
+                if not reclaimed:
+                    # Отправка шла дольше аренды: другой воркер забирает оставшиеся записи пачки
+                    db.execute("UPDATE notification_outbox SET lease_expires_at = datetime('now', '-1 second') "
+                               "WHERE sent_at IS NULL AND lease_token IS NOT NULL")
+                    db.commit()
+                    reclaimed.append(notifications.claim(db))
+
+        transport = SlowTransport()
+        notifications.dispatch(db, transport)
+        token, rows = reclaimed[0]
+        assert transport.sent == ["lease_first@example.com"], f"Отправлено по потерянной аренде: {transport.sent}"
+        assert second in [row[1] for row in rows]
+        held = db.execute(
+            "SELECT lease_token FROM notification_outbox WHERE recipient_id = ? AND sent_at IS NULL", (second,)
+        ).fetchone()
+        assert held is not None and held[0] == token, "Запись, забранную другим воркером, нельзя трогать"
+    print("   ✓ Записи с потерянной арендой не отправляются повторно")
+
+def create_user(db, username, role):
+    """Создает пользователя с паролем, совпадающим с логином"""
+    return db.execute(
+        "INSERT INTO users (username, password_hash, role, email) VALUES (?, ?, ?, ?)",
+        (username, app_module.hash_password(username), role, f"{username}@example.com"),
+    ).lastrowid
+
+def create_vacancy(db, title, requirements="", status="published", **fields):
+    """Создает вакансию компании company_hr"""
+    company_id, hr_id = db.execute(
+        "SELECT c.id, u.id FROM companies c JOIN users u ON u.id = c.contact_user_id WHERE u.username = 'company_hr'"
+    ).fetchone()
+    columns = ["title", "requirements", "company_id", "status", "created_by", *fields]
+    return db.execute(
+        f"INSERT INTO vacancies ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+        [title, requirements, company_id, status, hr_id, *fields.values()],
+    ).lastrowid
+
+def test_stored_resumes():
+    """Тестирует сохраненные резюме, порядок индексации и сборку старых копий"""
+    print("\n=== Тестирование сохраненных резюме ===")
+    import matching
+    import storage_gc
+
+    with app.app_context():
+        db = get_db()
+        candidate_id = create_user(db, 'resume_candidate', 'candidate')
+        resume_index.skill_ids(db, ['python'])
+        vacancy_id = create_vacancy(db, 'Разработчик', 'Python, SQL')
+        matching.index_vacancy(db, vacancy_id)
+        # Старые копии резюме, созданные на каждый отклик, не входят в лимит
+        for i in range(app_module.MAX_STORED_RESUMES + 1):
+            legacy_id = db.execute(
+                "INSERT INTO resumes (candidate_id, title, indexed_at) VALUES (?, ?, datetime('now', '-2 days'))",
+                (candidate_id, f"Копия {i}"),
+            ).lastrowid
+            db.execute(
+                "INSERT INTO applications (vacancy_id, candidate_id, resume_id, status) VALUES (?, ?, ?, 'new')",
+                (create_vacancy(db, f"Старая вакансия {i}"), candidate_id, legacy_id),
+            )
+        db.commit()
+
+    with app.test_client() as client:
+        login(client, 'resume_candidate')
+        response = client.post(f'/vacancy/{vacancy_id}/apply', data={
+            'resume_id': 'new', 'title': 'Основное', 'skills': 'Python', 'cover_letter': '',
+        })
+        assert response.status_code == 302, f"Ожидался код 302, получен {response.status_code}"
+    resume_index._queue.join()
+
+    with app.app_context():
+        db = get_db()
+        resume_id = db.execute(
+            "SELECT id FROM resumes WHERE candidate_id = ? AND stored = 1", (candidate_id,)
+        ).fetchone()[0]
+        print("   ✓ Старые копии резюме не мешают сохранить новое")
+        score = db.execute(
+            "SELECT score FROM match_scores WHERE target_type = 'vacancy' AND target_id = ? AND resume_id = ?",
+            (vacancy_id, resume_id),
+        ).fetchone()
+        assert score is not None and score[0] > 0, "Оценка пары вакансия-резюме должна быть посчитана"
+        print("   ✓ Новое резюме оценивается по вакансии отклика после индексации")
+
+        db.execute("DELETE FROM vacancies WHERE title = 'Старая вакансия 0'")
+        db.commit()
+        orphans = storage_gc.orphan_resume_ids(db)
+        legacy = db.execute("SELECT id FROM resumes WHERE title = 'Копия 0'").fetchone()[0]
+        assert orphans == [legacy], f"Неверные резюме-сироты: {orphans}"
+    print("   ✓ Копии резюме без откликов собирает storage-gc")
+
+def test_matching_vocabulary():
+    """Тестирует словарь навыков и снимок весов IDF"""
+    print("\n=== Тестирование сопоставления навыков ===")
+    import matching
+
+    with app.app_context():
+        db = get_db()
+        resume_index.skill_ids(db, ['docker'])
+        vacancy_id = create_vacancy(db, 'DevOps', 'Опыт работы от 3 лет, Docker')
+        matching.index_vacancy(db, vacancy_id)
+        skills = [row[0] for row in db.execute(
+            "SELECT s.name FROM vacancy_skills vs JOIN skills s ON s.id = vs.skill_id WHERE vs.vacancy_id = ?", (vacancy_id,)
+        )]
+        assert skills == ['docker'], f"Неверные навыки вакансии: {skills}"
+        assert 'опыт работы от 3 лет' not in matching.skill_vocabulary(db), "Фраза из требований попала в словарь"
+        print("   ✓ Требования вакансии не пополняют словарь навыков")
+
+        university_id = db.execute("SELECT id FROM users WHERE username = 'university_rep'").fetchone()[0]
+        req_id = db.execute(
+            "INSERT INTO internship_requests (university_id, specialization, skills_required, status) "
+            "VALUES (?, 'Мобильная разработка', 'Kotlin, Swift', 'published')",
+            (university_id,),
+        ).lastrowid
+        matching.index_internship(db, req_id)
+        assert {'kotlin', 'swift'} <= matching.skill_vocabulary(db), "Заявленные навыки стажировки должны попасть в словарь"
+        print("   ✓ Заявленные навыки стажировки пополняют словарь")
+
+        matching.refresh_idf(db, force=True)
+        snapshot = matching.idf_weights(db)
+        candidate_id = create_user(db, 'idf_candidate', 'candidate')
+        docker_id = resume_index.skill_ids(db, ['docker'])['docker']
+
+        def add_resumes(count):
+            for _ in range(count):
+                resume_id = db.execute(
+                    "INSERT INTO resumes (candidate_id, title, stored) VALUES (?, 'Docker', 1)", (candidate_id,)
+                ).lastrowid
+                db.execute("INSERT INTO resume_skills (resume_id, skill_id) VALUES (?, ?)", (resume_id, docker_id))
+            db.commit()
+
+        add_resumes(1)
+        assert not matching.refresh_idf(db) and matching.idf_weights(db) == snapshot, "Веса IDF не должны меняться"
+        print("   ✓ Оценки считаются по снимку IDF, а не по текущему корпусу")
+        add_resumes(matching.IDF_MIN_CHANGE + 1)
+        assert matching.refresh_idf(db), "Снимок IDF должен обновиться после роста корпуса"
+        assert matching.idf_weights(db)[docker_id] < snapshot.get(docker_id, float('inf'))
+    print("   ✓ Снимок IDF обновляется пачкой при заметном изменении корпуса")
+
+def test_asgi_streaming():
+    """Тестирует потоковую выгрузку через ASGI-адаптер"""
+    print("\n=== Тестирование ASGI-режима ===")
+    import asyncio
+    import asgi
+    from urllib.parse import urlencode
+
+    with app.app_context():
+        db = get_db()
+        candidate_id = create_user(db, 'asgi_candidate', 'candidate')
+        vacancy_id = create_vacancy(db, 'Выгрузка через ASGI')
+        db.executemany(
+            "INSERT INTO applications (vacancy_id, candidate_id, status, cover_letter) VALUES (?, ?, 'new', ?)",
+            [(vacancy_id, candidate_id, f"Письмо {i}") for i in range(exports.FETCH_SIZE * 3)],
+        )
+        db.commit()
+
+    adapter = asgi.ASGIAdapter(app, threads=4)
+
+    async def request(method, path, body=b"", headers=()):
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        path, _, query = path.partition("?")
+        await adapter({
+            "type": "http", "method": method, "path": path, "query_string": query.encode(),
+            "headers": [(b"host", b"localhost"), *headers],
+        }, receive, send)
+        return sent
+
+    async def scenario():
+        form = urlencode({"username": "company_hr", "password": "company_hr"}).encode()
+        sent = await request("POST", "/login", form, [(b"content-type", b"application/x-www-form-urlencoded")])
+        cookie = next(v for k, v in sent[0]["headers"] if k == b"set-cookie").split(b";")[0]
+        return await request("GET", f"/hr/vacancies/{vacancy_id}/applications/export?format=csv", headers=[(b"cookie", cookie)])
+
+    sent = asyncio.run(scenario())
+    adapter.executor.shutdown()
+    assert sent[0]["status"] == 200, f"Ожидался код 200, получен {sent[0]['status']}"
+    bodies = [message["body"] for message in sent[1:] if message["body"]]
+    lines = b"".join(bodies).decode("utf-8-sig").splitlines()
+    assert len(bodies) > 3 and len(lines) == exports.FETCH_SIZE * 3 + 1, "Выгрузка должна прийти частями и целиком"
+    print("   ✓ Потоковый ответ с курсором SQLite читается в одном потоке пула")
+
+    import tempfile
+    from flask import send_file
+
+    content = os.urandom(2 * 1024 * 1024)
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        f.write(content)
+    application = app_module.create_app({
+        "TESTING": True, "SECRET_KEY": "test", "DATABASE": app_module.MEMORY_DATABASE, "NOTIFY_TRANSPORT": None,
+    })
+    application.add_url_rule("/big-file", "big_file", lambda: send_file(f.name))
+    application.add_url_rule("/ping", "ping", lambda: "pong")
+    # Один поток пула: пока медленный клиент качает файл, остальные запросы должны проходить;
+    # request() выше обращается к этому же adapter
+    adapter = asgi.ASGIAdapter(application, threads=1)
+
+    async def slow_download(first_block, resume):
+        received = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message.get("body"):
+                received.append(message["body"])
+                if not first_block.is_set():
+                    first_block.set()
+                    await resume.wait()
+
+        await adapter({"type": "http", "method": "GET", "path": "/big-file", "headers": [(b"host", b"localhost")]}, receive, send)
+        return b"".join(received)
+
+    async def file_scenario():
+        first_block, resume = asyncio.Event(), asyncio.Event()
+        download = asyncio.create_task(slow_download(first_block, resume))
+        await first_block.wait()
+        ping = asyncio.create_task(request("GET", "/ping"))
+        done, _pending = await asyncio.wait({ping}, timeout=5)
+        resume.set()
+        return ping in done, await ping, await download
+
+    try:
+        answered, ping, downloaded = asyncio.run(file_scenario())
+    finally:
+        adapter.executor.shutdown()
+        os.remove(f.name)
+    assert answered and ping[0]["status"] == 200, "Запрос не прошел, пока медленный клиент качает файл"
+    assert downloaded == content, "Файл отдан не целиком"
+    print("   ✓ Медленное скачивание файла не занимает поток пула")
+
+def test_stream_rows():
+    """Тестирует чтение курсоров потоковых страниц"""
+    print("\n=== Тестирование потоковых страниц ===")
+    import sqlite3
+    import threading
+
+    db = sqlite3.connect(":memory:", check_same_thread=False)
+    db.execute("CREATE TABLE items (id INTEGER)")
+    db.executemany("INSERT INTO items VALUES (?)", [(i,) for i in range(app_module.STREAM_FETCH_ROWS * 2 + 1)])
+    owner = threading.get_ident()
+    rows = list(app_module._stream_rows(db.execute("SELECT id FROM items"), owner))
+    assert len(rows) == app_module.STREAM_FETCH_ROWS * 2 + 1, "Курсор должен читаться целиком"
+    print("   ✓ Курсор читается пачками в потоке запроса")
+
+    errors = []
+    rows = app_module._stream_rows(db.execute("SELECT id FROM items"), owner)
+
+    def read_elsewhere():
+        try:
+            next(rows)
+        except RuntimeError as exc:
+            errors.append(exc)
+
+    thread = threading.Thread(target=read_elsewhere)
+    thread.start()
+    thread.join()
+    assert errors, "Чтение страницы из другого потока должно быть запрещено"
+    print("   ✓ Чтение из другого потока отклоняется")
+
+    import gzip
+    from jinja2 import ChoiceLoader, DictLoader
+
+    application = app_module.create_app({
+        "TESTING": True, "SECRET_KEY": "test", "DATABASE": app_module.MEMORY_DATABASE, "NOTIFY_TRANSPORT": None,
+    })
+    application.jinja_env.loader = ChoiceLoader([
+        DictLoader({"stream_list.html": "<ul>{% for row in items %}<li>{{ row[0] }}</li>{% endfor %}</ul>"}),
+        application.jinja_env.loader,
+    ])
+
+    @application.route("/stream-list")
+    def stream_list():
+        return app_module.stream_page("stream_list.html", items=db.execute("SELECT id FROM items ORDER BY id"))
+
+    expected = "<ul>" + "".join(f"<li>{i}</li>" for i in range(app_module.STREAM_FETCH_ROWS * 2 + 1)) + "</ul>"
+    with application.test_client() as client:
+        response = client.get("/stream-list", headers={"Accept-Encoding": "gzip"})
+        assert response.is_streamed and response.headers.get("Content-Encoding") == "gzip", \
+            "Потоковая страница отдана без сжатия"
+        assert gzip.decompress(response.get_data()).decode() == expected, "Сжатая потоковая страница повреждена"
+        response.close()
+        response = client.get("/stream-list")
+        assert "Content-Encoding" not in response.headers and response.get_data(as_text=True) == expected
+        response.close()
+    print("   ✓ Потоковая страница сжимается gzip по мере отдачи")
+
+def test_admission_reserve():
+    """Тестирует, что тяжелые запросы не занимают потоки интерактивных"""
+    print("\n=== Тестирование контроля допуска ===")
+    import threading
+    import time
+    import admission
+
+    capacity = 8
+    classes = admission.default_classes(capacity)
+    limits = {route_class.name: route_class for route_class in classes}
+    occupied = sum(limits[name].max_concurrent + limits[name].max_queue for name in ("heavy", "bulk"))
+    assert occupied < capacity, f"heavy и bulk могут занять все {capacity} потоков"
+
+    controller = admission.AdmissionController(capacity, classes)
+    heavy = limits["heavy"]
+    tickets = [controller.acquire("heavy", "report") for _ in range(heavy.max_concurrent)]
+    waiters = [
+        threading.Thread(target=lambda: tickets.append(controller.acquire("heavy", "report")))
+        for _ in range(heavy.max_queue)
+    ]
+    for waiter in waiters:
+        waiter.start()
+    while controller.metrics()["classes"]["heavy"]["queued"] < heavy.max_queue:
+        time.sleep(0.01)
+    try:
+        controller.acquire("heavy", "report")
+    except admission.Rejected:
+        pass
+    else:
+        raise AssertionError("Сверх лимита heavy запрос должен получать 503")
+
+    # Тяжелый класс насыщен, но интерактивные запросы проходят сразу
+    interactive = [controller.acquire("interactive", "login") for _ in range(capacity - heavy.max_concurrent)]
+    for ticket in interactive + tickets[:heavy.max_concurrent]:
+        controller.release(ticket)
+    for waiter in waiters:
+        waiter.join()
+    print("   ✓ Интерактивные запросы проходят при насыщенном классе heavy")
+
+    # Первые запросы воркера приходят одновременно, но контроллер у приложения один
+    application = app_module.create_app({
+        "TESTING": True, "SECRET_KEY": "test", "DATABASE": app_module.MEMORY_DATABASE, "NOTIFY_TRANSPORT": None,
+    })
+    barrier = threading.Barrier(16)
+    controllers = []
+
+    def first_request():
+        with application.app_context():
+            barrier.wait()
+            controllers.append(app_module.admission_controller())
+
+    class SlowController(admission.AdmissionController):
+        # Расширяет окно гонки между проверкой и сохранением контроллера
+        def __init__(self, *args):
+            time.sleep(0.05)
+            super().__init__(*args)
+
+    threads = [threading.Thread(target=first_request) for _ in range(16)]
+    admission.AdmissionController, original = SlowController, admission.AdmissionController
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        admission.AdmissionController = original
+    assert len({id(controller) for controller in controllers}) == 1, "Параллельные запросы создали разные контроллеры"
+    print("   ✓ Параллельные первые запросы получают один контроллер допуска")
+
+    import tempfile
+    from flask import send_file
+
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        f.write(b"resume")
+    application.add_url_rule("/download", "download", lambda: send_file(f.name))
+    try:
+        with application.test_client() as client:
+            for _ in range(capacity * 2):
+                response = client.get("/download")
+                assert response.status_code == 200, "Место допуска не освобождено после скачивания файла"
+                response.close()
+    finally:
+        os.remove(f.name)
+    with application.app_context():
+        assert app_module.admission_controller().metrics()["in_flight"] == 0
+    print("   ✓ Ответы send_file освобождают место допуска")
+
+def test_change_feed():
+    """Тестирует ленту изменений и outbox откликов в присоединенной БД"""
+    print("\n=== Тестирование ленты изменений ===")
+    import notifications
+
+    with app.app_context():
+        db = get_db()
+        create_user(db, 'feed_candidate', 'candidate')
+        db.execute("UPDATE users SET email = 'hr@example.com' WHERE username = 'company_hr'")
+        vacancy_id = create_vacancy(db, 'Аналитик ленты')
+        db.commit()
+
+    with app.test_client() as client:
+        login(client, 'company_hr')
+        cursor = client.get('/api/changes?limit=1000').get_json()["next"]
+        while client.get(f'/api/changes?since={cursor}').get_json()["has_more"]:
+            cursor = client.get(f'/api/changes?since={cursor}&limit=1000').get_json()["next"]
+
+    with app.test_client() as client:
+        login(client, 'feed_candidate')
+        response = client.post(f'/vacancy/{vacancy_id}/apply', data={
+            'resume_id': 'new', 'title': 'Резюме аналитика', 'skills': 'SQL', 'cover_letter': '',
+        })
+        assert response.status_code == 302, f"Ожидался код 302, получен {response.status_code}"
+
+    with app.app_context():
+        db = get_db()
+        application_id = db.execute("SELECT id FROM applications WHERE vacancy_id = ?", (vacancy_id,)).fetchone()[0]
+        in_main = db.execute(
+            "SELECT COUNT(*) FROM main.change_log WHERE entity_type = 'application' AND entity_id = ?", (application_id,)
+        ).fetchone()[0]
+        in_appl = db.execute(
+            "SELECT COUNT(*) FROM appl.application_change_log WHERE entity_type = 'application' AND entity_id = ?",
+            (application_id,),
+        ).fetchone()[0]
+        assert (in_main, in_appl) == (0, 1), f"Изменение отклика записано не в журнал appl: {in_main}, {in_appl}"
+        outbox = db.execute(
+            "SELECT COUNT(*) FROM appl.application_outbox WHERE dedup_key = ?", (f"application:{application_id}",)
+        ).fetchone()[0]
+        assert outbox == 1, "Уведомление об отклике должно лежать в outbox appl"
+    print("   ✓ Отклик пишет журнал изменений и outbox в файл откликов")
+
+    with app.test_client() as client:
+        login(client, 'company_hr')
+        feed = client.get(f'/api/changes?since={cursor}').get_json()
+        seen = {(change["entity"], change["id"]) for change in feed["changes"]}
+        assert ("application", application_id) in seen, f"Отклик не попал в ленту: {seen}"
+        assert feed["next"] != cursor
+        assert client.get(f'/api/changes?since={feed["next"]}').get_json()["changes"] == []
+        items = client.get(f'/api/changes/application?ids={application_id}').get_json()["items"]
+        assert [item["id"] for item in items] == [application_id]
+        assert client.get('/api/changes?since=x').status_code == 400
+    print("   ✓ Лента объединяет журналы, курсор next не повторяет изменения")
+
+    with app.app_context():
+        db = get_db()
+        university_id = db.execute("SELECT id FROM users WHERE username = 'university_rep'").fetchone()[0]
+        internship_ids = [
+            db.execute(
+                "INSERT INTO internship_requests (university_id, specialization, status) VALUES (?, ?, ?)",
+                (university_id, f'Стажировка ленты {status}', status),
+            ).lastrowid
+            for status in ('on_moderation', 'rejected', 'published')
+        ]
+        db.commit()
+    with app.test_client() as client:
+        login(client, 'company_hr')
+        feed = client.get(f'/api/changes?since={feed["next"]}').get_json()
+        seen = [change["id"] for change in feed["changes"] if change["entity"] == "internship"]
+        assert seen == internship_ids[2:], f"HR видит неопубликованные заявки на стажировку: {seen}"
+        login(client, 'university_rep')
+        seen = {change["id"] for change in client.get('/api/changes?limit=1000').get_json()["changes"]}
+        assert set(internship_ids) <= seen, "Вуз должен видеть свои заявки в любом статусе"
+    print("   ✓ HR видит в ленте только опубликованные стажировки")
+
+    class Transport:
+        def __init__(self):
+            self.sent = []
+
+        def send(self, message):
+            self.sent.append(message.get_content())
+
+    with app.app_context():
+        db = get_db()
+        transport = Transport()
+        notifications.dispatch(db, transport)
+        assert any('Аналитик ленты' in body for body in transport.sent), f"Дайджест не отправлен: {transport.sent}"
+        pending = db.execute("SELECT COUNT(*) FROM appl.application_outbox WHERE sent_at IS NULL").fetchone()[0]
+        assert pending == 0, "Уведомления outbox appl должны быть отправлены"
+    print("   ✓ Диспетчер отправляет уведомления из outbox appl")
+
+def test_app_factory():
+    """Тестирует, что приложения из create_app не делят БД, кеш и журнал событий"""
+    print("\n=== Тестирование фабрики приложений ===")
+    import cache_bus
+    import event_log
+
+    config = {
+        "TESTING": True, "SECRET_KEY": "test", "DATABASE": app_module.TEMP_DATABASE,
+        "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000", "NOTIFY_TRANSPORT": None,
+    }
+    first, second = app_module.create_app(config), app_module.create_app(config)
+    assert first is not second
+    assert first.config["DATABASE_PATH"] != second.config["DATABASE_PATH"], "У приложений должны быть разные БД"
+    assert "DATABASE_PATH" not in app_module.DEFAULT_CONFIG, "create_app не должен менять конфигурацию по умолчанию"
+
+    with first.app_context():
+        db = get_db()
+        vacancy_id = create_vacancy(db, 'Только в первом приложении')
+        db.commit()
+        event_log.emit("vacancy", vacancy_id, "create")
+        assert cache_bus.cached("catalog:factory", lambda: "первое") == "первое"
+    with second.app_context():
+        db = get_db()
+        create_vacancy(db, 'Только во втором приложении')
+        db.commit()
+        found = db.execute("SELECT 1 FROM vacancies WHERE title = 'Только в первом приложении'").fetchone()
+        assert found is None, "Данные первого приложения видны во втором"
+        assert cache_bus.cached("catalog:factory", lambda: "второе") == "второе", "Кеш общий для двух приложений"
+        assert event_log.query("vacancy", vacancy_id) == [], "Журнал событий общий для двух приложений"
+    with first.app_context():
+        assert [event["action"] for event in event_log.query("vacancy", vacancy_id)] == ["create"]
+    print("   ✓ Два приложения работают каждое со своей временной БД, кешем и журналом")
+
+    with second.test_client() as client:
+        login(client, 'company_hr')
+        feed = client.get('/api/changes?limit=1000').get_json()
+        ids = ",".join(str(change["id"]) for change in feed["changes"] if change["entity"] == "vacancy")
+        items = client.get(f'/api/changes/vacancy?ids={ids}').get_json()["items"]
+        assert [item["title"] for item in items] == ['Только во втором приложении'], f"Чужие вакансии в ленте: {items}"
+    print("   ✓ Маршруты и обработчики запросов зарегистрированы в новом экземпляре")
+
+    import gc
+
+    folder = os.path.dirname(first.config["DATABASE_PATH"])
+    del first
+    gc.collect()
+    assert not os.path.exists(folder), f"Временный каталог {folder} остался после удаления приложения: {os.listdir(folder)}"
+    print("   ✓ Временный каталог БД удаляется вместе с приложением")
+
+def test_backup_cli():
+    """Тестирует резервную копию и восстановление БД командами flask с нестандартной DATABASE"""
+    print("\n=== Тестирование резервного копирования ===")
+    import tempfile
+
+    folder = tempfile.mkdtemp(prefix="hr_case_backup_")
+    application = app_module.create_app({
+        "TESTING": True, "SECRET_KEY": "test", "DATABASE": os.path.join(folder, "custom.bd"),
+        "BACKUP_DIR": os.path.join(folder, "backups"), "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000",
+        "NOTIFY_TRANSPORT": None,
+    })
+    with application.app_context():
+        db = get_db()
+        candidate_id = create_user(db, 'backup_candidate', 'candidate')
+        vacancy_id = create_vacancy(db, 'Вакансия из снимка')
+        db.execute(
+            "INSERT INTO applications (vacancy_id, candidate_id, status) VALUES (?, ?, 'new')", (vacancy_id, candidate_id)
+        )
+        db.commit()
+
+    runner = application.test_cli_runner()
+    result = runner.invoke(args=["backup-db", "--no-compress"])
+    assert result.exit_code == 0, result.output
+    snapshot = os.path.join(folder, "backups", os.listdir(os.path.join(folder, "backups"))[0])
+    assert sorted(os.listdir(snapshot)) == ["custom.bd", "custom_applications.bd", "custom_moderation.bd"], \
+        f"Снимок должен содержать БД приложения: {os.listdir(snapshot)}"
+    print("   ✓ backup-db копирует БД из конфигурации приложения")
+
+    with application.app_context():
+        db = get_db()
+        db.execute("DELETE FROM vacancies WHERE id = ?", (vacancy_id,))
+        db.commit()
+    result = runner.invoke(args=["restore-db", "--yes"])
+    assert result.exit_code == 0, result.output
+    with application.app_context():
+        db = get_db()
+        restored = db.execute("SELECT title FROM vacancies WHERE id = ?", (vacancy_id,)).fetchone()
+        assert restored is not None and restored[0] == 'Вакансия из снимка', "Вакансия должна вернуться из снимка"
+        applications = db.execute("SELECT COUNT(*) FROM applications WHERE vacancy_id = ?", (vacancy_id,)).fetchone()[0]
+        assert applications == 1, "Отклики из присоединенной БД должны вернуться из снимка"
+    print("   ✓ restore-db восстанавливает основную и присоединенные БД")
+
+    import backup
+    from datetime import datetime
+
+    class FrozenDatetime(datetime):
+        # Два снимка в один и тот же момент времени
+        @classmethod
+        def now(cls, tz=None):
+            return cls(2030, 1, 2, 3, 4, 5, 600000)
+
+    directory = os.path.join(folder, "same_moment")
+    os.makedirs(os.path.join(directory, "20000101-000000"))
+    backup.datetime, original = FrozenDatetime, backup.datetime
+    try:
+        paths = [backup.create_snapshot([], directory)["path"] for _ in range(2)]
+    finally:
+        backup.datetime = original
+    assert len(set(paths)) == 2, f"Снимки в одну секунду перезаписали друг друга: {paths}"
+    names = [os.path.basename(path) for path in backup.snapshots(directory)]
+    assert names == ["20300102-030405-600000_1", "20300102-030405-600000", "20000101-000000"], names
+    print("   ✓ Одновременные снимки получают разные имена, старые имена по секундам распознаются")
+
+def test_cli_environment():
+    """Тестирует, что команды flask --app app используют БД из FLASK_DATABASE"""
+    print("\n=== Тестирование CLI с переменными окружения ===")
+    import subprocess
+    import tempfile
+
+    folder = tempfile.mkdtemp(prefix="hr_case_cli_")
+    database = os.path.join(folder, "cli.bd")
+    app_module.create_app({
+        "TESTING": True, "SECRET_KEY": "test", "DATABASE": database,
+        "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000", "NOTIFY_TRANSPORT": None,
+    })
+    env = dict(os.environ, FLASK_DATABASE=database, FLASK_BACKUP_DIR=os.path.join(folder, "backups"))
+    result = subprocess.run(
+        [sys.executable, "-m", "flask", "--app", "app", "backup-db", "--no-compress"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    snapshots = os.listdir(os.path.join(folder, "backups"))
+    files = sorted(os.listdir(os.path.join(folder, "backups", snapshots[0])))
+    assert files == ["cli.bd", "cli_applications.bd", "cli_moderation.bd"], f"Снимок не той БД: {files}"
+    print("   ✓ flask --app app backup-db снимает БД из FLASK_DATABASE в FLASK_BACKUP_DIR")
+
+def test_recommendations():
+    """Тестирует ленту рекомендаций вакансий после модерации и отклика"""
+    print("\n=== Тестирование рекомендаций ===")
+    import matching
+    import recommendations
+
+    with app.app_context():
+        db = get_db()
+        candidate_id = create_user(db, 'feed_reader', 'candidate')
+        resume_id = db.execute(
+            "INSERT INTO resumes (candidate_id, title, skills_text, stored) VALUES (?, 'Мобильный разработчик', 'Kotlin', 1)",
+            (candidate_id,),
+        ).lastrowid
+        resume_index.process_resume(db, resume_id)
+        published, rejected = [
+            create_vacancy(db, title, 'Kotlin', status='on_moderation') for title in ('Kotlin-разработчик', 'Kotlin-стажер')
+        ]
+        for vacancy_id in (published, rejected):
+            matching.index_vacancy(db, vacancy_id)
+        db.commit()
+
+    def feed():
+        with app.app_context():
+            return [row["id"] for row in recommendations.vacancy_feed(get_db(), candidate_id)]
+
+    with app.test_client() as client:
+        login(client, 'admin')
+        for vacancy_id in (published, rejected):
+            client.post(f'/admin/moderation/vacancy/{vacancy_id}/approve')
+        assert sorted(feed()) == sorted([published, rejected]), f"Опубликованные вакансии не попали в ленту: {feed()}"
+        print("   ✓ Опубликованная вакансия добавляется в ленту кандидата с общими навыками")
+        client.post(f'/admin/moderation/vacancy/{rejected}/reject')
+        assert feed() == [published], f"Отклоненная вакансия осталась в ленте: {feed()}"
+        print("   ✓ Отклоненная вакансия уходит из ленты")
+
+    with app.test_client() as client:
+        login(client, 'feed_reader')
+        response = client.post(f'/vacancy/{published}/apply', data={'resume_id': str(resume_id), 'cover_letter': ''})
+        assert response.status_code == 302, f"Ожидался код 302, получен {response.status_code}"
+    assert feed() == [], f"Вакансия с откликом осталась в ленте: {feed()}"
+    print("   ✓ После отклика вакансия уходит из ленты кандидата")
+
+def test_event_log():
+    """Тестирует журнал событий модерации и очистку старых сегментов"""
+    print("\n=== Тестирование журнала событий ===")
+    import event_log
+
+    with app.app_context():
+        db = get_db()
+        vacancy_id = create_vacancy(db, 'Вакансия с историей', status='on_moderation')
+        db.commit()
+        logged = db.execute("SELECT COUNT(*) FROM moderation_logs").fetchone()[0]
+
+    with app.test_client() as client:
+        login(client, 'admin')
+        client.post(f'/admin/moderation/vacancy/{vacancy_id}/approve')
+        client.post(f'/admin/moderation/vacancy/{vacancy_id}/delete')
+        events = client.get(f'/admin/events/vacancy/{vacancy_id}').get_json()
+    assert [event["action"] for event in events] == ["delete", "approve"], f"Неверная история: {events}"
+    assert events[1]["data"] == {"status": "published"}
+    with app.app_context():
+        assert get_db().execute("SELECT COUNT(*) FROM moderation_logs").fetchone()[0] == logged, \
+            "Решения модерации не должны писаться в moderation_logs"
+    print("   ✓ Решения модератора и удаление попадают в журнал событий")
+
+    with app.app_context():
+        directory = app.config["EVENT_LOG_DIR"]
+        event_log._open_segment(os.path.join(directory, "events_2000_01.db")).close()
+        result = app.test_cli_runner().invoke(args=["compact-events", "--keep-months", "12"])
+        assert result.exit_code == 0, result.output
+        months = [month for month, _path in event_log.segments()]
+    assert "2000_01" not in months and months, f"Неверные сегменты после очистки: {months}"
+    print("   ✓ compact-events удаляет сегменты старше срока хранения")
+
+    with app.app_context():
+        event_log._open_segment(os.path.join(app.config["EVENT_LOG_DIR"], "events_2001_02.db")).close()
+        assert "2001_02" in event_log.compact(), "Закрытый сегмент должен сжиматься"
+        assert "2001_02" not in event_log.compact(), "Сжатый сегмент не должен сжиматься повторно"
+        # Опоздавшее событие прошлого месяца снова делает сегмент кандидатом на сжатие
+        event_log._buffer.append((app.config["EVENT_LOG_DIR"], "2001-02-28 23:59:59", "vacancy", 1, "late", None, None))
+        assert "2001_02" in event_log.compact(), "Сегмент с новыми событиями должен сжиматься снова"
+    print("   ✓ compact сжимает каждый закрытый сегмент один раз")
+
+def test_attached_databases():
+    """Тестирует отклики и очередь модерации в присоединенных БД"""
+    print("\n=== Тестирование присоединенных БД ===")
+    import sqlite3
+
+    application = app_module.create_app({
+        "TESTING": True, "SECRET_KEY": "test", "DATABASE": app_module.TEMP_DATABASE,
+        "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000", "NOTIFY_TRANSPORT": None,
+    })
+    with application.app_context():
+        db = get_db()
+        candidate_id = create_user(db, 'attached_candidate', 'candidate')
+        vacancy_id = create_vacancy(db, 'Вакансия в основной БД')
+        db.commit()
+
+    # Другое соединение держит блокировку записи основной БД
+    blocker = sqlite3.connect(application.config["DATABASE_PATH"], isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        with application.app_context():
+            db = app_module.connect_db()
+            db.execute("PRAGMA busy_timeout = 100")
+            application_id = db.execute(
+                "INSERT INTO applications (vacancy_id, candidate_id, status) VALUES (?, ?, 'new')", (vacancy_id, candidate_id)
+            ).lastrowid
+            db.commit()
+            db.close()
+    finally:
+        blocker.rollback()
+        blocker.close()
+    print("   ✓ Отклик записывается, пока основная БД заблокирована на запись")
+
+    with application.app_context():
+        db = get_db()
+        assert db.execute("SELECT 1 FROM main.sqlite_master WHERE name = 'applications'").fetchone() is None
+        db.execute("DELETE FROM vacancies WHERE id = ?", (vacancy_id,))
+        db.commit()
+        left = db.execute("SELECT COUNT(*) FROM appl.applications WHERE id = ?", (application_id,)).fetchone()[0]
+        assert left == 0, "Удаление вакансии должно каскадом удалить отклики из присоединенной БД"
+    print("   ✓ Каскады между файлами БД выполняются триггерами соединения")
+
+def test_vacancy_import():
+    """Тестирует массовый импорт вакансий через JSON API"""
+    print("\n=== Тестирование импорта вакансий ===")
+    rows = [
+        {"title": "Импорт: аналитик", "requirements": "SQL", "salary_range": "от 100к", "city": " санкт-петербург "},
+        {"title": "", "description": "Без названия"},
+        {"title": "Импорт: тестировщик", "salary_range": "50000-80000 руб."},
+    ]
+    with app.test_client() as client:
+        login(client, 'company_hr')
+        report = client.post('/hr/vacancies/import?dry_run=1', json=rows).get_json()
+        assert (report["valid"], report["imported"]) == (2, 0), f"Неверный пробный отчет: {report}"
+        report = client.post('/hr/vacancies/import', json={"vacancies": rows}).get_json()
+    assert report["imported"] == 2 and [error["row"] for error in report["errors"]] == [2], f"Неверный отчет: {report}"
+    print("   ✓ Корректные строки импортируются, ошибочные попадают в отчет с номером строки")
+
+    with app.app_context():
+        db = get_db()
+        placeholders = ",".join("?" * len(report["vacancy_ids"]))
+        vacancies = db.execute(
+            f"SELECT title, status, salary_min, salary_max, city FROM vacancies WHERE id IN ({placeholders}) ORDER BY id",
+            report["vacancy_ids"],
+        ).fetchall()
+        assert [tuple(row) for row in vacancies] == [
+            ("Импорт: аналитик", "on_moderation", 100000, None, "Санкт-Петербург"),
+            ("Импорт: тестировщик", "on_moderation", 50000, 80000, None),
+        ], f"Неверные вакансии: {[tuple(row) for row in vacancies]}"
+        queued = db.execute(
+            f"SELECT COUNT(*) FROM moderation_queue WHERE item_type = 'vacancy' AND item_id IN ({placeholders})",
+            report["vacancy_ids"],
+        ).fetchone()[0]
+        assert queued == 2, "Импортированные вакансии должны попасть в очередь модерации"
+    print("   ✓ Вакансии уходят на модерацию с разобранной зарплатой и городом")
+
+def test_compression():
+    """Тестирует сжатие JSON-ответов и отдачу собранной статики"""
+    print("\n=== Тестирование сжатия ответов и статики ===")
+    import gzip
+    import json
+    import shutil
+    import tempfile
+    import compression
+
+    with app.test_client() as client:
+        login(client, 'admin')
+        plain = client.get('/api/changes?limit=100')
+        compressed = client.get('/api/changes?limit=100', headers={"Accept-Encoding": "gzip"})
+    assert len(plain.data) >= compression.MIN_SIZE, "Лента изменений слишком мала для проверки сжатия"
+    assert "Content-Encoding" not in plain.headers, "Ответ сжат без Accept-Encoding"
+    assert compressed.headers.get("Content-Encoding") == "gzip", "JSON не сжат при Accept-Encoding: gzip"
+    assert "Accept-Encoding" in compressed.headers.get("Vary", "")
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json(), "Сжатый ответ отличается от исходного"
+    print("   ✓ JSON сжимается gzip только по Accept-Encoding")
+
+    static_folder = tempfile.mkdtemp()
+    application = app_module.create_app({
+        "TESTING": True, "SECRET_KEY": "test", "DATABASE": app_module.TEMP_DATABASE, "NOTIFY_TRANSPORT": None,
+    })
+    try:
+        shutil.copy(os.path.join(app.static_folder, "style.css"), static_folder)
+        application.static_folder = static_folder
+        result = application.test_cli_runner().invoke(args=["build-static"])
+        assert result.exit_code == 0, result.output
+        with application.test_request_context():
+            from flask import url_for
+            url = url_for("static", filename="style.css")
+        assert url.startswith("/static/build/style.") and url.endswith(".css"), f"Нет отпечатка в имени: {url}"
+        with application.test_client() as client:
+            response = client.get(url, headers={"Accept-Encoding": "gzip"})
+            original = response.data
+            response.close()
+            plain = client.get(url)
+            plain_data = plain.data
+            plain.close()
+        assert response.headers.get("Content-Encoding") == "gzip", "Не отдана готовая .gz версия"
+        assert "immutable" in response.headers.get("Cache-Control", "")
+        with open(os.path.join(static_folder, "style.css"), "rb") as f:
+            assert gzip.decompress(original) == f.read() == plain_data
+    finally:
+        compression.load_manifest(app.static_folder)
+        shutil.rmtree(static_folder, ignore_errors=True)
+    print("   ✓ build-static подставляет отпечаток в url_for и отдает сжатую версию с кешем на год")
+
+def test_storage_gc():
+    """Тестирует удаление файлов загрузок без ссылок и учет занятого места"""
+    print("\n=== Тестирование сборки мусора в хранилище ===")
+    import shutil
+    import tempfile
+    import time
+    import storage_gc
+
+    folder = tempfile.mkdtemp()
+    old = time.time() - 2 * storage_gc.GRACE_SECONDS
+
+    def upload(name, size, mtime=None):
+        path = os.path.join(folder, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    try:
+        kept = upload("kept.pdf", 300, old)
+        orphan = upload("orphan.pdf", 200, old)
+        fresh = upload("fresh.pdf", 100)
+        # Путь, сохраненный под Windows: uploads\resume.docx
+        windows = upload("windows.docx", 50, old)
+        with app.app_context():
+            db = get_db()
+            candidate_id = create_user(db, 'gc_candidate', 'candidate')
+            db.executemany(
+                "INSERT INTO resumes (candidate_id, title, resume_file) VALUES (?, 'С файлом', ?)",
+                [(candidate_id, kept), (candidate_id, folder + "\\windows.docx")],
+            )
+            db.commit()
+
+            report = storage_gc.collect(db, [folder], dry_run=True)
+            assert report["paths"] == [orphan] and report["bytes"] == 200, f"Неверный пробный прогон: {report}"
+            assert os.path.exists(orphan), "Пробный прогон не должен удалять файлы"
+            report = storage_gc.collect(db, [folder], dry_run=False)
+            assert report["files"] == 1 and not os.path.exists(orphan), "Файл без ссылок не удален"
+            assert os.path.exists(kept) and os.path.exists(fresh), "Удален файл со ссылкой или свежий файл"
+            assert os.path.exists(windows), "Удален файл, путь к которому сохранен с обратными слешами"
+            print("   ✓ Удаляются только старые файлы без ссылок из БД")
+
+            users = {entry["username"]: entry for entry in storage_gc.usage(db)["users"]}
+            assert (users["gc_candidate"]["files"], users["gc_candidate"]["bytes"]) == (2, 350)
+            print("   ✓ Занятое место считается по файлам пользователя")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+def test_catalog_facets():
+    """Тестирует счетчики фасетов каталога при публикации, снятии и удалении вакансий"""
+    print("\n=== Тестирование фасетов каталога ===")
+    import facets
+
+    def city_count(db):
+        return dict((value, count) for value, _label, count in facets.counts(db)[facets.CITY]).get('Фасетоград', 0)
+
+    with app.app_context():
+        db = get_db()
+        vacancy_ids = [
+            create_vacancy(db, f'Фасетная вакансия {i}', status='on_moderation', city='Фасетоград', salary_min=120000)
+            for i in range(2)
+        ]
+        db.commit()
+        assert city_count(db) == 0, "Вакансии на модерации не должны попадать в фасеты"
+
+    with app.test_client() as client:
+        login(client, 'admin')
+        for vacancy_id in vacancy_ids:
+            client.post(f'/admin/moderation/vacancy/{vacancy_id}/approve')
+    with app.app_context():
+        db = get_db()
+        assert city_count(db) == 2, "Опубликованные вакансии не учтены в фасете города"
+        rows, total = facets.search(db, city='Фасетоград', salary_from=100000)
+        assert total == 2 and sorted(row["id"] for row in rows) == vacancy_ids, "Поиск по фасетам не нашел вакансии"
+        assert facets.search(db, city='Фасетоград', salary_from=150000)[1] == 0
+    print("   ✓ Одобренные вакансии попадают в счетчики и поиск по фасетам")
+
+    with app.test_client() as client:
+        login(client, 'company_hr')
+        client.post(f'/hr/vacancies/{vacancy_ids[0]}/close')
+        login(client, 'admin')
+        client.post(f'/admin/moderation/vacancy/{vacancy_ids[1]}/delete')
+    with app.app_context():
+        db = get_db()
+        assert city_count(db) == 0, "Закрытые и удаленные вакансии остались в фасетах"
+        assert facets.search(db, city='Фасетоград')[1] == 0
+        counts = facets.counts(db)
+        facets.rebuild(db)
+        assert facets.counts(db) == counts, "Инкрементальные счетчики разошлись с пересчетом"
+    print("   ✓ Закрытие и удаление вакансий уменьшают счетчики, совпадающие с полным пересчетом")
+
+def test_internship_periods():
+    """Тестирует интервальный индекс периодов стажировок"""
+    print("\n=== Тестирование периодов стажировок ===")
+    from datetime import date
+    import internship_periods
+
+    with app.app_context():
+        db = get_db()
+        university_id = create_user(db, 'periods_university', 'university_rep')
+
+        def add(specialization, period_start, period_end, status='published'):
+            return db.execute(
+                "INSERT INTO internship_requests (university_id, specialization, period_start, period_end, status) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (university_id, specialization, period_start, period_end, status),
+            ).lastrowid
+
+        summer = add('Лето', '2031-07-10', '2031-08-20')
+        june = add('Июнь', '2031-06-01', None)
+        own = add('Своя', '2031-07-01', '2031-07-05', status='on_moderation')
+        swapped = add('Перепутанные даты', '2031-09-10', '2031-07-25')
+        legacy = add('Старый формат', '15.06.2031', None)
+        db.commit()
+
+        def ids(rows):
+            return [row["id"] for row in rows]
+
+        july = (date(2031, 7, 1), date(2031, 7, 31))
+        assert ids(internship_periods.overlapping(db, *july)) == [summer, swapped], "Неверные пересечения с июлем"
+        assert ids(internship_periods.overlapping(db, *july, university_id)) == [own, summer, swapped], \
+            "Вуз должен видеть свои заявки на модерации"
+        june_starts = (date(2031, 6, 1), date(2031, 6, 30))
+        assert ids(internship_periods.starting_between(db, *june_starts)) == [june], "Период без конца — один день"
+        print("   ✓ Пересечения и начала периодов ищутся по R*Tree с учетом видимости")
+
+        assert internship_periods.normalize_dates(db) == 1
+        assert ids(internship_periods.starting_between(db, *june_starts)) == [june, legacy], \
+            "Дата в старом формате не попала в индекс после нормализации"
+        db.execute("UPDATE internship_requests SET period_start = '2031-08-01' WHERE id = ?", (summer,))
+        db.execute("DELETE FROM internship_requests WHERE id = ?", (swapped,))
+        db.commit()
+        assert ids(internship_periods.overlapping(db, *july)) == [], "Индекс не следует за изменением и удалением"
+        print("   ✓ Триггеры обновляют индекс при нормализации, изменении и удалении")
+
+        grid = internship_periods.month_grid(db, 2031, 7, university_id)
+        assert len(grid["days"]) == 31 and [row["internship"]["id"] for row in grid["rows"]] == [own]
+        active = grid["rows"][0]["active"]
+        assert active[:5] == [True] * 5 and not any(active[5:]), "Неверно отмечены дни в календаре"
+        print("   ✓ Календарь месяца отмечает дни стажировки")
+
+def test_cache_bus():
+    """Тестирует инвалидацию кеша воркера событием из другого процесса"""
+    print("\n=== Тестирование шины инвалидации кеша ===")
+    import subprocess
+    import time
+    import cache_bus
+
+    application = app_module.create_app({
+        "TESTING": True, "SECRET_KEY": "test", "DATABASE": app_module.TEMP_DATABASE, "NOTIFY_TRANSPORT": None,
+    })
+    with application.app_context():
+        bus_path = app_module.cache_bus_path()
+        assert cache_bus.cached("catalog:search", lambda: "старое") == "старое"
+        assert cache_bus.cached("profile:1", lambda: "профиль") == "профиль"
+        assert cache_bus.cached("catalog:search", lambda: "новое") == "старое", "Значение не закешировано"
+
+    # Второй воркер: отдельный процесс публикует событие в тот же файл шины
+    result = subprocess.run(
+        [sys.executable, "-c", "import sys, cache_bus; cache_bus.configure(sys.argv[1]); cache_bus.publish('catalog')",
+         str(bus_path)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+    with application.app_context():
+        deadline = time.monotonic() + 5
+        while cache_bus.cached("catalog:search", lambda: "новое") == "старое" and time.monotonic() < deadline:
+            time.sleep(cache_bus.POLL_INTERVAL)
+        assert cache_bus.cached("catalog:search", lambda: "новое") == "новое", "Событие другого процесса не вытеснило ключ"
+        assert cache_bus.cached("profile:1", lambda: "другой") == "профиль", "Вытеснен ключ вне иерархии catalog"
+    print("   ✓ publish в другом процессе вытесняет ключ и его потомков, остальные остаются")
+
+def test_prefork_server():
+    """Тестирует pre-fork сервер: обслуживание запросов, таймауты, плавную перезагрузку и остановку"""
+    print("\n=== Тестирование pre-fork сервера ===")
+    import http.client
+    import signal
+    import socket
+    import subprocess
+    import tempfile
+    import time
+
+    if not hasattr(os, "fork"):
+        print("   - Пропущено: нужен os.fork")
+        return
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    folder = tempfile.mkdtemp(prefix="hr_case_serve_")
+    env = dict(os.environ, FLASK_DATABASE=os.path.join(folder, "serve.bd"), FLASK_SECRET_KEY="test")
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--bind", f"127.0.0.1:{port}", "--workers", "1", "--threads", "2",
+         "--timeout", "1", "--graceful-timeout", "1"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+
+    def get(path, attempts=50):
+        for _ in range(attempts):
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+                return response.status
+            except ConnectionError:
+                time.sleep(0.1)
+            finally:
+                connection.close()
+        raise AssertionError(f"Сервер не ответил: {server.stderr.read().decode() if server.poll() is not None else ''}")
+
+    idle = []
+    try:
+        assert get('/api/changes') == 302, "Воркер должен перенаправить неавторизованный запрос на вход"
+        print("   ✓ Воркер обслуживает запросы с общего сокета")
+
+        # Клиенты, которые не присылают запрос, занимают оба потока до таймаута
+        idle = [socket.create_connection(("127.0.0.1", port)) for _ in range(2)]
+        time.sleep(0.2)
+        started = time.monotonic()
+        assert get('/api/changes') == 302, "Простаивающие соединения заняли пул"
+        assert time.monotonic() - started < 4
+        for connection in idle:
+            connection.settimeout(5)
+            assert connection.recv(1) == b"", "Простаивающее соединение не закрыто по таймауту"
+        print("   ✓ Простаивающие соединения закрываются по --timeout и не блокируют пул")
+
+        # Клиент присылает запрос по байту: таймаут чтения не срабатывает, старый воркер не может доработать
+        slow = socket.create_connection(("127.0.0.1", port))
+        idle.append(slow)
+        slow.sendall(b"GET /")
+        time.sleep(0.2)
+        server.send_signal(signal.SIGHUP)
+        killed = False
+        deadline = time.monotonic() + 10
+        while not killed and time.monotonic() < deadline:
+            time.sleep(0.3)
+            try:
+                slow.sendall(b"a")
+            except OSError:
+                killed = True
+        assert killed, "Зависший воркер старого поколения не завершен после --graceful-timeout"
+        assert all(get('/api/changes') == 302 for _ in range(5)), "Запросы не обслуживаются после SIGHUP"
+        print("   ✓ SIGHUP заменяет воркеры, зависший старый воркер получает SIGKILL")
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=35) == 0, "Мастер должен завершиться с кодом 0"
+        print("   ✓ SIGTERM плавно останавливает мастер и воркеры")
+    finally:
+        for connection in idle:
+            connection.close()
+        if server.poll() is None:
+            server.kill()
+            server.wait()
+        server.stderr.close()
+
 def main():
     """Основная функция тестирования"""
     print("Запуск тестирования функционала HR платформы...")
     
     try:
-        # Инициализируем базу данных
-        with app.app_context():
-            init_db()
-        
-        # Запускаем тесты
+        # Запускаем тесты (схему БД создал create_app при импорте)
         test_multilang()
         test_internship_catalog()
         test_database()
+        test_resume_index()
+        test_exports()
+        test_internship_rejection()
+        test_moderation_queue()
+        test_notification_rate_cap()
+        test_stored_resumes()
+        test_matching_vocabulary()
+        test_asgi_streaming()
+        test_stream_rows()
+        test_admission_reserve()
+        test_change_feed()
+        test_app_factory()
+        test_backup_cli()
+        test_cli_environment()
+        test_recommendations()
+        test_event_log()
+        test_attached_databases()
+        test_vacancy_import()
+        test_compression()
+        test_storage_gc()
+        test_catalog_facets()
+        test_internship_periods()
+        test_cache_bus()
+        test_prefork_server()
         
         print("\n🎉 Все тесты прошли успешно!")
         print("\nДобавленный функционал:")
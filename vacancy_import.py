@@ -0,0 +1,127 @@
+"""
+Массовый импорт вакансий из CSV или JSON.
+
+Файл разбирается и проверяется целиком до записи; корректные строки
+вставляются одним executemany в одной транзакции и сразу ставятся в
+очередь модерации группой компании, ошибочные попадают в отчет с номером
+строки. Навыки новых вакансий разбираются после коммита одной пачкой.
+"""
+import csv
+import io
+import json
+import time
+
+import facets
+import matching
+
+MAX_ROWS = 5000
+FIELDS = ("title", "description", "requirements", "salary_range", "city")
+MAX_LENGTH = {"title": 200, "salary_range": 100, "city": 100}
+
+
+class ImportFormatError(ValueError):
+    """Файл не удалось разобрать целиком (неизвестный формат, битый JSON и т.п.)"""
+
+
+def read_rows(data, filename):
+    """Разбирает содержимое файла в список словарей по расширению имени"""
+    name = (filename or "").lower()
+    try:
+        text = data.decode("utf-8-sig") if isinstance(data, bytes) else data
+    except UnicodeDecodeError:
+        raise ImportFormatError("Файл должен быть в кодировке UTF-8")
+    if name.endswith(".json"):
+        try:
+            rows = json.loads(text)
+        except ValueError as exc:
+            raise ImportFormatError(f"Некорректный JSON: {exc}")
+        # Допускаем как список, так и {"vacancies": [...]}
+        if isinstance(rows, dict):
+            rows = rows.get("vacancies")
+        if not isinstance(rows, list):
+            raise ImportFormatError("JSON должен содержать список вакансий")
+        return rows
+    if name.endswith(".csv"):
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames or "title" not in [f.strip().lower() for f in reader.fieldnames]:
+            raise ImportFormatError("В CSV нет колонки title")
+        return [{(k or "").strip().lower(): v for k, v in row.items()} for row in reader]
+    raise ImportFormatError("Поддерживаются файлы .csv и .json")
+
+
+def validate_rows(rows):
+    """Возвращает (корректные строки, ошибки); номера строк начинаются с 1"""
+    if len(rows) > MAX_ROWS:
+        raise ImportFormatError(f"Не более {MAX_ROWS} вакансий за один импорт")
+    valid, errors = [], []
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({"row": number, "error": "Строка должна быть объектом"})
+            continue
+        values, problem = {}, None
+        for field in FIELDS:
+            value = row.get(field)
+            if value is None:
+                value = ""
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                value = str(value)
+            elif not isinstance(value, str):
+                problem = f"Поле {field} должно быть строкой"
+                break
+            value = value.strip()
+            if len(value) > MAX_LENGTH.get(field, 10000):
+                problem = f"Поле {field} длиннее {MAX_LENGTH.get(field, 10000)} символов"
+                break
+            values[field] = value
+        if problem is None and not values["title"]:
+            problem = "Не указано название вакансии (title)"
+        if problem is not None:
+            errors.append({"row": number, "error": problem})
+            continue
+        valid.append((number, values))
+    return valid, errors
+
+
+def import_vacancies(db, company_id, user_id, rows, dry_run=False):
+    """Проверяет и вставляет вакансии компании; возвращает отчет об импорте"""
+    valid, errors = validate_rows(rows)
+    report = {"total": len(rows), "imported": 0, "errors": errors, "vacancy_ids": [], "db_seconds": 0.0}
+    if dry_run or not valid:
+        report["valid"] = len(valid)
+        return report
+
+    started = time.perf_counter()
+    # Блокировка записи берется сразу, поэтому новые id идут подряд после текущего максимума
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        last_id = db.execute("SELECT COALESCE(MAX(id), 0) FROM vacancies").fetchone()[0]
+        db.executemany(
+            "INSERT INTO vacancies (title, description, requirements, salary_range, salary_min, salary_max, city, "
+            "company_id, status, created_by) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'on_moderation', ?)",
+            [
+                (
+                    v["title"], v["description"], v["requirements"], v["salary_range"],
+                    *facets.parse_salary(v["salary_range"]), facets.normalize_city(v["city"]), company_id, user_id,
+                )
+                for _number, v in valid
+            ],
+        )
+        vacancy_ids = [
+            row[0] for row in db.execute(
+                "SELECT id FROM vacancies WHERE id > ? AND company_id = ? ORDER BY id", (last_id, company_id)
+            )
+        ]
+        # Вся пачка попадает в очередь одной группой компании
+        db.executemany(
+            "INSERT OR IGNORE INTO moderation_queue (item_type, item_id, group_key) VALUES ('vacancy', ?, ?)",
+            [(vacancy_id, f"company:{company_id}") for vacancy_id in vacancy_ids],
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    report["db_seconds"] = round(time.perf_counter() - started, 4)
+    report["imported"] = len(vacancy_ids)
+    report["vacancy_ids"] = vacancy_ids
+    matching.index_new_vacancies(db, vacancy_ids)
+    return report